@@ -10,7 +10,7 @@ from urllib.parse import urlparse
 import psycopg2
 import sqlite3
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
 from collections import defaultdict, Counter
 import json
@@ -51,10 +51,12 @@ def analyze_payment_screen_behavior(date_filter):
     
     # Формируем условие фильтрации по дате (по московскому времени)
     if db_type == 'postgresql':
-        date_condition = """AND (
-            (timestamp::timestamp AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Moscow')::date = %s::date
-        )"""
-        date_params = (date_filter,)
+        # Границы суток по Москве; сравниваем саму колонку timestamptz, чтобы работал индекс
+        moscow_tz = pytz.timezone('Europe/Moscow')
+        date_start_msk = moscow_tz.localize(datetime.strptime(date_filter, "%Y-%m-%d"))
+        date_end_msk = moscow_tz.localize(datetime.strptime(date_filter, "%Y-%m-%d") + timedelta(days=1))
+        date_condition = "AND timestamp >= %s AND timestamp < %s"
+        date_params = (date_start_msk, date_end_msk)
     else:
         moscow_tz = pytz.timezone('Europe/Moscow')
         date_start_msk = moscow_tz.localize(datetime.strptime(f"{date_filter} 00:00:00", "%Y-%m-%d %H:%M:%S"))
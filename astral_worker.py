@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Отдельный процесс генерации натальных карт.
+
+Берёт задания из общей очереди generation_jobs (см. generation_queue.py),
+считает карту, генерирует отчёт через OpenAI, собирает PDF и сам отправляет
+его пользователю через Bot API. Telegram-обновления и платежи не обрабатывает,
+поэтому мощность генерации масштабируется отдельно от бота: воркер можно
+запустить на любом числе реплик с той же БД (PostgreSQL), задания между ними
+делятся через аренду. Чтобы генерации не выполнялись в процессе бота, ему
+задаётся GENERATION_IN_BOT=0 (по умолчанию бот тоже разбирает очередь) - тогда
+бот только ставит задания в очередь и пишет ошибку в лог, если не видит
+запущенного воркера.
+
+Запуск:
+    python -m astral_worker
+    python astral_worker.py
+
+Railway: второй сервис из того же репозитория с конфигурацией railway.generator.json,
+затем GENERATION_IN_BOT=0 в переменных сервиса бота.
+
+Лимиты OpenAI (LLM_RPM, LLM_TPM, LLM_MAX_CONCURRENCY) действуют на процесс -
+при нескольких репликах общий лимит ключа делится между ними.
+
+Настройки (переменные окружения, кроме общих для бота - TELEGRAM_BOT_TOKEN,
+OPENAI_API_KEY, DATABASE_URL, GENERATION_*):
+    WORKER_HEALTH_PORT  - порт /health (по умолчанию PORT или 8080, 0 - без HTTP)
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import sys
+from datetime import datetime
+
+from aiohttp import web
+from telegram import Bot
+
+import bot as astral_bot
+import chart_executor
+import generation_queue
+import llm_gateway
+import report_checkpoints
+from db_pool import close_pool, get_pool_stats
+from repository import get_event_buffer_stats, stop_event_buffer
+
+logger = logging.getLogger(__name__)
+
+WORKER_HEALTH_PORT = int(os.getenv('WORKER_HEALTH_PORT') or os.getenv('PORT') or '8080')
+
+
+async def health_handler(request):
+    """Health check: счётчики воркеров, шлюза OpenAI и пула БД"""
+    status = {
+        'status': 'ok',
+        'role': 'generation_worker',
+        'timestamp': datetime.now().isoformat(),
+        'generation_queue': generation_queue.get_generation_queue_stats(),
+        'report_checkpoints': report_checkpoints.get_report_checkpoint_stats(),
+        'llm_gateway': llm_gateway.get_llm_gateway_stats(),
+        'executors': chart_executor.get_executor_stats(),
+        'db_pool': get_pool_stats(),
+        'events': get_event_buffer_stats(),
+    }
+    return web.json_response(status, status=200)
+
+
+async def run_worker(token: str):
+    """Воркеры очереди генераций до SIGTERM/SIGINT; незаконченные задания возвращаются в очередь"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    runner = None
+    if WORKER_HEALTH_PORT:
+        aioapp = web.Application()
+        aioapp.router.add_get('/health', health_handler)
+        aioapp.router.add_get('/', health_handler)
+        runner = web.AppRunner(aioapp)
+        await runner.setup()
+        await web.TCPSite(runner, '0.0.0.0', WORKER_HEALTH_PORT).start()
+        logger.info(f"✅ Healthcheck воркера запущен на порту {WORKER_HEALTH_PORT}")
+
+    bot = Bot(token=token)
+    await bot.initialize()
+    astral_bot.start_generation_workers(bot)
+    logger.info("🚀 Воркер генераций запущен, ожидание заданий из очереди")
+
+    await stop.wait()
+    logger.info("🛑 Остановка воркера генераций...")
+
+    try:
+        await astral_bot.stop_generation_workers()
+    except Exception as e:
+        logger.warning(f"⚠️ Ошибка при остановке воркеров генераций: {e}")
+    try:
+        await bot.shutdown()
+    except Exception as e:
+        logger.warning(f"⚠️ Ошибка при остановке Bot: {e}")
+    if runner is not None:
+        await runner.cleanup()
+
+
+def main():
+    token = os.getenv('TELEGRAM_BOT_TOKEN')
+    if not token:
+        logger.error("TELEGRAM_BOT_TOKEN не установлен в переменных окружения!")
+        return 1
+
+    try:
+        astral_bot.init_db()
+    except Exception as e:
+        logger.error(f"❌ Критическая ошибка при инициализации БД: {e}", exc_info=True)
+        return 1
+
+    try:
+        asyncio.run(run_worker(token))
+    finally:
+        # Дописываем буфер событий и закрываем пул соединений с БД
+        stop_event_buffer()
+        close_pool()
+        chart_executor.shutdown_executors()
+    logger.info("✅ Воркер генераций остановлен")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Асинхронный слой доступа к данным для обработчиков бота.
+
+Повторяет функции repository.py (те же имена и аргументы), но выполняет запросы
+в отдельном пуле потоков, поэтому event loop не ждёт ответа от БД и продолжает
+обрабатывать обновления других пользователей:
+
+    user_data = await async_repository.load_user_profile(user_id)
+
+Пул потоков ограничен размером пула соединений (DB_POOL_MAX_SIZE), так что
+потоки не простаивают в ожидании свободного соединения.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import repository
+from db_pool import DB_POOL_MAX_SIZE
+
+_executor = ThreadPoolExecutor(max_workers=DB_POOL_MAX_SIZE, thread_name_prefix='db')
+
+
+async def _run(func, *args, **kwargs):
+    """Выполняет синхронную функцию репозитория в пуле потоков БД"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+# ===== ПОЛЬЗОВАТЕЛИ =====
+
+async def save_user_profile(user_id, user_data):
+    """Сохранение профиля пользователя в базу данных"""
+    return await _run(repository.save_user_profile, user_id, dict(user_data))
+
+
+async def load_user_profile(user_id) -> dict:
+    """Загрузка профиля пользователя из базы данных"""
+    return await _run(repository.load_user_profile, user_id)
+
+
+async def get_user_state(user_id: int) -> dict:
+    """Профиль, флаг оплаты, username и право на бесплатную генерацию одним запросом"""
+    return await _run(repository.get_user_state, user_id)
+
+
+async def user_has_paid(user_id: int) -> bool:
+    """Проверяет, оплачена ли генерация (или пользователь в списке бесплатных)"""
+    return await _run(repository.user_has_paid, user_id)
+
+
+async def mark_user_paid(user_id: int):
+    """Помечает пользователя как оплатившего"""
+    return await _run(repository.mark_user_paid, user_id)
+
+
+async def save_user_username(user_id: int, username: Optional[str], first_name: Optional[str]):
+    """Сохраняет username и first_name пользователя"""
+    return await _run(repository.save_user_username, user_id, username, first_name)
+
+
+async def reset_user_payment(user_id: int):
+    """Сбрасывает статус оплаты после выдачи натальной карты"""
+    return await _run(repository.reset_user_payment, user_id)
+
+
+async def has_special_price(user_id: int) -> bool:
+    """Проверяет, назначена ли пользователю специальная цена"""
+    return await _run(repository.has_special_price, user_id)
+
+
+# ===== СОБЫТИЯ (АНАЛИТИКА) =====
+
+async def log_event(user_id: int, event_type: str, event_data: Optional[dict] = None):
+    """
+    Логирует событие для аналитики. Обычно только кладёт его в буфер, поэтому без пула
+    потоков; события из DURABLE_EVENT_TYPES пишутся в БД сразу - через пул.
+    """
+    if event_type in repository.DURABLE_EVENT_TYPES:
+        return await _run(repository.log_event, user_id, event_type, event_data)
+    repository.log_event(user_id, event_type, event_data)
+
+
+# ===== ПЛАТЕЖИ (ЮKASSA) =====
+
+async def save_payment_info(user_id: int, yookassa_payment_id: str, internal_payment_id: str, amount: float):
+    """Сохраняет информацию о платеже"""
+    return await _run(repository.save_payment_info, user_id, yookassa_payment_id, internal_payment_id, amount)
+
+
+async def update_payment_status(yookassa_payment_id: str, status: str, payment_data: dict = None):
+    """Обновляет статус платежа, возвращает (user_id, amount)"""
+    return await _run(repository.update_payment_status, yookassa_payment_id, status, payment_data)
+
+
+async def get_last_payment(user_id: int):
+    """Последний платеж пользователя: (yookassa_payment_id, status, created_at) или None"""
+    return await _run(repository.get_last_payment, user_id)
+
+
+async def get_pending_payment(user_id: int):
+    """Последний ожидающий платеж пользователя: (yookassa_payment_id, amount, created_at) или None"""
+    return await _run(repository.get_pending_payment, user_id)
+
+
+async def get_unprocessed_succeeded_payment(user_id: int):
+    """Succeeded платеж без события payment_success или None"""
+    return await _run(repository.get_unprocessed_succeeded_payment, user_id)
+
+
+async def list_stale_pending_payments(limit: int = 10) -> list:
+    """Ожидающие платежи старше 1 минуты"""
+    return await _run(repository.list_stale_pending_payments, limit)
+
+
+# ===== ОЧЕРЕДЬ ГЕНЕРАЦИЙ =====
+
+async def enqueue_generation_job(user_id: int, chat_id: int, message_id: Optional[int], birth_data: dict,
+                                 priority: int) -> Optional[int]:
+    """Ставит генерацию в очередь: job_id или None, если у пользователя уже есть задание"""
+    return await _run(repository.enqueue_generation_job, user_id, chat_id, message_id, dict(birth_data), priority)
+
+
+async def get_active_generation_job(user_id: int) -> Optional[dict]:
+    """Незавершённое задание пользователя или None"""
+    return await _run(repository.get_active_generation_job, user_id)
+
+
+async def claim_generation_job(worker_id: str, lease_seconds: float) -> Optional[dict]:
+    """Берёт следующее задание в аренду или None"""
+    return await _run(repository.claim_generation_job, worker_id, lease_seconds)
+
+
+async def heartbeat_generation_job(job_id: int, worker_id: str, lease_seconds: float) -> bool:
+    """Продлевает аренду задания (False - аренда потеряна)"""
+    return await _run(repository.heartbeat_generation_job, job_id, worker_id, lease_seconds)
+
+
+async def update_generation_job(job_id: int, worker_id: str, state: str, stage_data: dict,
+                                error: Optional[str] = None) -> bool:
+    """Записывает стадию задания (False - аренда у другого воркера)"""
+    return await _run(repository.update_generation_job, job_id, worker_id, state, dict(stage_data), error)
+
+
+async def release_generation_job(job_id: int, worker_id: str) -> bool:
+    """Снимает аренду без смены стадии"""
+    return await _run(repository.release_generation_job, job_id, worker_id)
+
+
+async def touch_generation_worker(worker_id: str):
+    """Отметка, что пул воркеров запущен"""
+    await _run(repository.touch_generation_worker, worker_id)
+
+
+async def remove_generation_worker(worker_id: str):
+    """Пул воркеров остановлен"""
+    await _run(repository.remove_generation_worker, worker_id)
+
+
+async def count_live_generation_workers(max_age_seconds: float) -> int:
+    """Сколько пулов воркеров отмечались за последние max_age_seconds"""
+    return await _run(repository.count_live_generation_workers, max_age_seconds)
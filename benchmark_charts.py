@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Замер пропускной способности пакетного расчёта натальных карт (chart_batch.py).
+
+Записи генерируются из городов справочника gazetteer со случайными датами, поэтому
+замер идёт офлайн (без Nominatim) и без chart_cache. Сравниваются расчёт в текущем
+процессе и в пуле процессов (CPU_EXECUTOR_WORKERS), результат - карт в секунду.
+
+Запуск:
+    python benchmark_charts.py           # 2000 записей
+    python benchmark_charts.py 10000
+"""
+import logging
+import random
+import sys
+import time
+
+import chart_batch
+import chart_executor
+import gazetteer
+
+logging.basicConfig(
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+def make_records(count: int, seed: int = 14) -> list:
+    """Случайные записи рождения в городах справочника"""
+    rng = random.Random(seed)
+    cities = [city['name'] for city in gazetteer.get_gazetteer().cities]
+    return [
+        {
+            'date': f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{rng.randint(1940, 2010)}",
+            'time': f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}",
+            'place': rng.choice(cities),
+        }
+        for _ in range(count)
+    ]
+
+
+def measure(name: str, records: list, **kwargs) -> float:
+    started = time.perf_counter()
+    charts = chart_batch.calculate_natal_charts(records, use_cache=False, **kwargs)
+    elapsed = time.perf_counter() - started
+    done = sum(1 for chart in charts if chart is not None)
+    rate = done / elapsed if elapsed else 0.0
+    logger.info(f"   {name}: {done} карт за {elapsed:.2f} с - {rate:.1f} карт/с")
+    return rate
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    logger.info(f"🚀 Пакетный расчёт карт: {count} записей")
+    logger.info("=" * 60)
+
+    records = make_records(count)
+    # Прогрев: загрузка справочника и эфемерид, запуск процессов пула
+    chart_batch.calculate_natal_charts(records[:chart_batch.CHART_BATCH_CHUNK * 2], use_cache=False)
+
+    sequential = measure("В текущем процессе", records, use_processes=False)
+    parallel = measure(f"Пул процессов ({chart_executor.cpu_pool.max_workers})", records)
+
+    logger.info("=" * 60)
+    logger.info(f"📊 Ускорение пула процессов: x{parallel / sequential:.2f}" if sequential else "📊 Нет данных")
+    chart_executor.shutdown_executors(wait=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Замер задержки: положения тел из предрасчитанной таблицы (ephemeris_table.py)
+против прямых вызовов Swiss Ephemeris.
+
+Сравниваются два уровня на одних и тех же случайных моментах в диапазоне таблицы:
+    - положения 10 планет и истинного узла (как в compute_chart)
+    - натальная карта целиком (ephemeris.compute_chart: + дома, аспекты)
+
+Используется data/ephemeris_table.npy (EPHEMERIS_TABLE_PATH); если таблица не
+собрана, для замера строится временная таблица на 1989-1991 годы.
+
+Запуск:
+    python benchmark_ephemeris.py          # 5000 моментов
+    python benchmark_ephemeris.py 20000
+"""
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+import swisseph as swe
+
+import ephemeris
+import ephemeris_table
+
+logging.basicConfig(
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def measure(name: str, func, moments: list) -> float:
+    """Время одного вызова func(jd, lat, lon) в микросекундах: p50, p95, среднее"""
+    timings = []
+    for jd, lat, lon in moments:
+        started = time.perf_counter()
+        func(jd, lat, lon)
+        timings.append((time.perf_counter() - started) * 1e6)
+    mean = sum(timings) / len(timings)
+    logger.info(
+        f"   {name}: p50 {percentile(timings, 0.5):.1f} мкс, p95 {percentile(timings, 0.95):.1f} мкс, "
+        f"среднее {mean:.1f} мкс"
+    )
+    return mean
+
+
+def bodies_swe(jd, lat, lon):
+    for body in ephemeris_table.BODIES:
+        swe.calc_ut(jd, body, ephemeris_table.TABLE_FLAGS)
+
+
+def bodies_table(jd, lat, lon):
+    for body in ephemeris_table.BODIES:
+        ephemeris_table.calc_ut(jd, body, ephemeris_table.TABLE_FLAGS)
+
+
+def chart_swe(jd, lat, lon):
+    ephemeris.compute_chart(jd, lat, lon, precise=True)
+
+
+def chart_table(jd, lat, lon):
+    ephemeris.compute_chart(jd, lat, lon)
+
+
+def run(table, count: int):
+    rng = random.Random(15)
+    moments = [
+        (rng.uniform(table.start_jd, table.end_jd - 1e-6), rng.uniform(-60, 60), rng.uniform(-180, 180))
+        for _ in range(count)
+    ]
+    # Прогрев: страницы таблицы и файлы эфемерид
+    for jd, lat, lon in moments[:200]:
+        chart_swe(jd, lat, lon)
+        chart_table(jd, lat, lon)
+
+    logger.info("🪐 Положения 11 тел:")
+    bodies_slow = measure("Swiss Ephemeris", bodies_swe, moments)
+    bodies_fast = measure("Таблица", bodies_table, moments)
+    logger.info("📜 Натальная карта целиком:")
+    chart_slow = measure("Swiss Ephemeris", chart_swe, moments)
+    chart_fast = measure("Таблица", chart_table, moments)
+
+    logger.info("=" * 60)
+    logger.info(f"📊 Ускорение: положения тел x{bodies_slow / bodies_fast:.1f}, карта x{chart_slow / chart_fast:.1f}")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    logger.info(f"🚀 Таблица эфемерид против Swiss Ephemeris: {count} моментов")
+    logger.info("=" * 60)
+
+    table = ephemeris_table.get_table()
+    if table is not None:
+        run(table, count)
+        return 0
+
+    logger.warning("⚠️ Таблица не собрана (python ephemeris_table.py build) - строим временную на 1989-1991")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ephemeris_table.npy')
+        ephemeris_table.build_table(path, 1989, 1991)
+        ephemeris_table._table = ephemeris_table.EphemerisTable.load(path)
+        run(ephemeris_table._table, count)
+        ephemeris_table._table = None
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
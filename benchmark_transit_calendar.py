@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Замер календаря транзитов (transit_calendar.py): год транзитов для случайных
+натальных карт, одно ядро. Цель - меньше TARGET_MS на календарь.
+
+Для каждой карты замеряются время до первого события (генератор) и до
+последнего. Первая карта считается с пустым кэшем сетки
+(ephemeris.transit_longitudes), остальные используют общую сетку - как в
+боте, где календари разных пользователей приходятся на одни и те же дни.
+
+Запуск:
+    python benchmark_transit_calendar.py        # 20 карт
+    python benchmark_transit_calendar.py 100
+"""
+import logging
+import random
+import sys
+import time
+
+import ephemeris
+import transit_calendar
+
+logging.basicConfig(
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+TARGET_MS = 500
+YEAR_START_JD = 2461041.5  # 01.01.2026
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def measure(chart: ephemeris.Chart) -> tuple:
+    """(мс до первого события, мс на весь календарь, событий)"""
+    started = time.perf_counter()
+    events = transit_calendar.transit_calendar(chart, YEAR_START_JD, YEAR_START_JD + 365)
+    first = next(events, None)
+    first_ms = (time.perf_counter() - started) * 1000
+    count = (first is not None) + sum(1 for _ in events)
+    return first_ms, (time.perf_counter() - started) * 1000, count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    logger.info(f"🚀 Календарь транзитов на год: {count} карт, цель < {TARGET_MS} мс")
+    logger.info("=" * 60)
+
+    rng = random.Random(17)
+    charts = [
+        ephemeris.Chart(rng.uniform(2429630.5, 2457388.5), rng.uniform(-60, 60), rng.uniform(-180, 180))
+        for _ in range(count)
+    ]
+
+    ephemeris.transit_longitudes.cache_clear()
+    cold_first, cold_total, cold_events = measure(charts[0])
+    logger.info(f"❄️ Пустой кэш сетки: первое событие {cold_first:.1f} мс, календарь {cold_total:.1f} мс ({cold_events} событий)")
+
+    firsts, totals, events = [], [], []
+    for chart in charts[1:] or charts:
+        first_ms, total_ms, event_count = measure(chart)
+        firsts.append(first_ms)
+        totals.append(total_ms)
+        events.append(event_count)
+    logger.info(
+        f"🔥 Общая сетка: первое событие p50 {percentile(firsts, 0.5):.1f} мс, "
+        f"календарь p50 {percentile(totals, 0.5):.1f} мс, p95 {percentile(totals, 0.95):.1f} мс, "
+        f"в среднем {sum(events) / len(events):.0f} событий"
+    )
+
+    logger.info("=" * 60)
+    worst = max(cold_total, percentile(totals, 0.95))
+    if worst < TARGET_MS:
+        logger.info(f"✅ Цель выполнена: худший случай {worst:.1f} мс < {TARGET_MS} мс")
+    else:
+        logger.warning(f"⚠️ Цель не выполнена: худший случай {worst:.1f} мс >= {TARGET_MS} мс")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
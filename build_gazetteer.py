@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Сборка данных офлайн-справочника (см. gazetteer.py) из открытых выгрузок.
+
+В репозитории лежит data/gazetteer.tsv с крупными городами России, СНГ и мира.
+Полный справочник собирается из GeoNames (https://download.geonames.org/export/dump/):
+
+    python build_gazetteer.py cities cities15000.txt
+
+Из альтернативных имён GeoNames сохраняются только кириллические и латинские -
+этого достаточно для поиска по-русски и по-английски, а файл остаётся компактным.
+
+Полигоны таймзон для точного определения пояса по координатам собираются из
+timezone-boundary-builder (https://github.com/evansiroky/timezone-boundary-builder):
+
+    python build_gazetteer.py timezones combined.json
+
+Координаты округляются до 0.01° (около 1 км), повторяющиеся точки удаляются.
+"""
+
+import json
+import os
+import re
+import sys
+
+from gazetteer import GAZETTEER_PATH, TIMEZONE_POLYGONS_PATH
+
+# Имена, в которых есть только кириллица или латиница (с диакритикой), цифры и знаки
+_NAME_RE = re.compile(r"^[\w\s.'’()-]+$")
+_CYRILLIC_RE = re.compile(r'[а-яёіїєґўәғқңөұүһ]', re.IGNORECASE)
+
+
+def _keep_name(name: str) -> bool:
+    if not name or not _NAME_RE.match(name):
+        return False
+    letters = [ch for ch in name if ch.isalpha()]
+    # Только кириллица или только латиница (включая расширенную, U+0000-U+024F)
+    return all(_CYRILLIC_RE.match(ch) for ch in letters) or all(ord(ch) < 0x250 for ch in letters)
+
+
+def build_cities(source: str, target: str = GAZETTEER_PATH) -> int:
+    """cities15000.txt (GeoNames) -> gazetteer.tsv"""
+    rows = []
+    with open(source, encoding='utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 18:
+                continue
+            name, ascii_name, alternate = fields[1], fields[2], fields[3]
+            names = []
+            for alt in [ascii_name] + alternate.split(','):
+                alt = alt.strip()
+                if alt and alt != name and alt not in names and _keep_name(alt):
+                    names.append(alt)
+            # Кириллическое имя - основное, если оно есть (для логов и сообщений)
+            cyrillic = [n for n in names if _CYRILLIC_RE.search(n)]
+            if cyrillic and not _CYRILLIC_RE.search(name):
+                names.remove(cyrillic[0])
+                names.insert(0, name)
+                name = cyrillic[0]
+            rows.append((name, fields[8], fields[4], fields[5], fields[17], fields[14] or '0', ','.join(names)))
+
+    rows.sort(key=lambda row: (-int(row[5]), row[0]))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'w', encoding='utf-8') as f:
+        f.write('# name\tcountry_code\tlatitude\tlongitude\ttimezone\tpopulation\talternate_names\n')
+        for row in rows:
+            f.write('\t'.join(row) + '\n')
+    return len(rows)
+
+
+def _simplify_ring(ring: list) -> list:
+    simplified = []
+    for lon, lat in ring:
+        point = [round(lon, 2), round(lat, 2)]
+        if not simplified or simplified[-1] != point:
+            simplified.append(point)
+    return simplified
+
+
+def build_timezones(source: str, target: str = TIMEZONE_POLYGONS_PATH) -> int:
+    """GeoJSON timezone-boundary-builder -> компактный GeoJSON с округлёнными координатами"""
+    with open(source, encoding='utf-8') as f:
+        features = json.load(f)['features']
+
+    result = []
+    for feature in features:
+        geometry = feature['geometry']
+        polygons = geometry['coordinates']
+        if geometry['type'] == 'Polygon':
+            polygons = [polygons]
+        polygons = [[_simplify_ring(ring) for ring in rings] for rings in polygons]
+        polygons = [rings for rings in polygons if len(rings[0]) >= 4]
+        if polygons:
+            result.append({
+                'type': 'Feature',
+                'properties': {'tzid': feature['properties']['tzid']},
+                'geometry': {'type': 'MultiPolygon', 'coordinates': polygons},
+            })
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'w', encoding='utf-8') as f:
+        json.dump({'type': 'FeatureCollection', 'features': result}, f, separators=(',', ':'))
+    return len(result)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == 'cities':
+        count = build_cities(sys.argv[2])
+        print(f"✅ Справочник городов: {count} городов -> {GAZETTEER_PATH}")
+    elif len(sys.argv) == 3 and sys.argv[1] == 'timezones':
+        count = build_timezones(sys.argv[2])
+        print(f"✅ Полигоны таймзон: {count} зон -> {TIMEZONE_POLYGONS_PATH}")
+    else:
+        print("Использование:")
+        print("  python build_gazetteer.py cities <cities15000.txt>")
+        print("  python build_gazetteer.py timezones <combined.json>")
+        sys.exit(1)
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Пакетный расчёт натальных карт для многих записей сразу: бэкфиллы аналитики,
+спецпредложения, перегенерация отчётов после изменения промптов.
+
+calculate_natal_chart считает одну карту и для каждой записи отдельно
+геокодирует место, определяет таймзону и пишет подробный лог. Здесь то же
+самое для пачки записей:
+
+    1) места рождения дедуплицируются; координаты берутся из справочника
+       gazetteer и одним запросом из geocode_cache, резолвер вызывается
+       один раз на место
+    2) таймзона определяется один раз на точку (справочник, кэш места)
+    3) одинаковые карты считаются один раз, готовые берутся из chart_cache пачкой
+    4) Swiss Ephemeris считается в пуле процессов chart_executor.cpu_pool
+       кусками по CHART_BATCH_CHUNK карт
+    5) результат - chart_data в порядке входных записей (None для некорректных
+       записей и карт, которые не удалось рассчитать)
+
+    charts = chart_batch.calculate_natal_charts(records)
+    for chart in chart_batch.iter_natal_charts(stream): ...
+
+Запись - словарь {'date': 'ДД.ММ.ГГГГ', 'time': 'ЧЧ:ММ', 'place': '...'}, как
+у calculate_natal_chart. По умолчанию места определяются офлайн (справочник и
+кэш, без запросов к Nominatim); bot.calculate_natal_charts_batch передаёт
+резолверы бота с полным геокодированием.
+
+Расчёт карт всех пользователей (прогрев chart_cache):
+    python chart_batch.py --users
+    python chart_batch.py --users 500    # не больше 500 пользователей
+
+Настройки (переменные окружения):
+    CHART_BATCH_SIZE   - записей в одной пачке при потоковой обработке (по умолчанию 1000)
+    CHART_BATCH_CHUNK  - карт в одной задаче пула процессов (по умолчанию 50)
+"""
+
+import copy
+import logging
+import os
+import sys
+import time
+from collections import deque
+
+import pytz
+
+import chart_cache
+import chart_executor
+import ephemeris
+import gazetteer
+import geocode_cache
+from db_pool import db_connection
+
+logger = logging.getLogger(__name__)
+
+CHART_BATCH_SIZE = int(os.getenv('CHART_BATCH_SIZE', '1000'))
+CHART_BATCH_CHUNK = int(os.getenv('CHART_BATCH_CHUNK', '50'))
+
+# Координаты по умолчанию, если место не найдено (как в calculate_natal_chart)
+DEFAULT_COORDINATES = (55.7558, 37.6173)  # Москва
+
+
+# ===== ОФЛАЙН-РЕЗОЛВЕРЫ =====
+
+def offline_coordinates(place: str):
+    """Координаты из справочника или кэша геокодирования, без запросов к Nominatim"""
+    city = gazetteer.find_place(place)
+    if city:
+        return city['latitude'], city['longitude']
+    cached = geocode_cache.lookup(place)
+    if cached and cached['found']:
+        return cached['latitude'], cached['longitude']
+    return None, None
+
+
+def longitude_timezone(place: str, lat: float, lon: float, naive_local_dt):
+    """Таймзона по долготе (1° = 4 минуты) - последний запасной вариант, как в боте"""
+    return pytz.FixedOffset(int(round(lon * 4)))
+
+
+# ===== РАЗРЕШЕНИЕ МЕСТ И ТАЙМЗОН =====
+
+def _resolve_places(places: dict, resolve_place) -> dict:
+    """places: {place_key: место} -> {place_key: (lat, lon)}"""
+    # Места, которых нет в справочнике, - одним запросом из кэша геокодирования
+    # (дальше резолвер найдёт их в памяти)
+    not_in_gazetteer = [place for place in places.values() if not gazetteer.find_place(place)]
+    if not_in_gazetteer:
+        geocode_cache.lookup_many(not_in_gazetteer)
+
+    coordinates = {}
+    for key, place in places.items():
+        try:
+            lat, lon = resolve_place(place)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось определить координаты места '{place}': {e}")
+            lat, lon = None, None
+        if lat is None or lon is None:
+            logger.warning(f"Используются координаты по умолчанию для места: {place}")
+            lat, lon = DEFAULT_COORDINATES
+        coordinates[key] = (lat, lon)
+    return coordinates
+
+
+def _timezone(place: str, lat: float, lon: float, naive_local_dt, resolve_timezone, memo: dict):
+    """
+    Порядок как в resolve_timezone_from_place: справочник по координатам, таймзона
+    места из кэша, затем резолвер (результат может зависеть от даты, не запоминается).
+    """
+    city = gazetteer.find_place(place)
+    country_code = city['country_code'] if city else None
+    point = (round(lat, 4), round(lon, 4), country_code)
+    if point not in memo:
+        tz_name = gazetteer.timezone_at(lat, lon, country_code)
+        try:
+            memo[point] = pytz.timezone(tz_name) if tz_name else None
+        except pytz.UnknownTimeZoneError:
+            memo[point] = None
+    if memo[point] is not None:
+        return memo[point]
+
+    cached = geocode_cache.lookup(place)
+    if cached and cached['found'] and cached.get('timezone'):
+        try:
+            return pytz.timezone(cached['timezone'])
+        except pytz.UnknownTimeZoneError:
+            pass
+    return resolve_timezone(place, lat, lon, naive_local_dt)
+
+
+# ===== РАСЧЁТ =====
+
+def _compute(jobs: list, use_processes: bool) -> list:
+    """jobs: список (jd, lat, lon) -> список chart_data в том же порядке"""
+    if not use_processes or len(jobs) <= CHART_BATCH_CHUNK:
+        return ephemeris.compute_charts(jobs)
+
+    chunks = [jobs[start:start + CHART_BATCH_CHUNK] for start in range(0, len(jobs), CHART_BATCH_CHUNK)]
+    pool = chart_executor.cpu_pool
+    window = pool.max_workers * 2  # не занимать всю очередь пула, которым пользуется и бот
+    results = []
+    pending = deque()
+
+    def collect():
+        future, chunk = pending.popleft()
+        try:
+            results.extend(future.result(timeout=pool.timeout))
+        except Exception as e:
+            logger.warning(f"⚠️ Пакет из {len(chunk)} карт не рассчитан в пуле процессов ({e}), считаем в текущем процессе")
+            results.extend(ephemeris.compute_charts(chunk))
+
+    for chunk in chunks:
+        while len(pending) >= window:
+            collect()
+        try:
+            pending.append((pool.submit(ephemeris.compute_charts, chunk), chunk))
+        except chart_executor.ExecutorOverloaded:
+            while pending:
+                collect()
+            results.extend(ephemeris.compute_charts(chunk))
+    while pending:
+        collect()
+    return results
+
+
+def calculate_natal_charts(records, resolve_place=None, resolve_timezone=None,
+                           use_cache: bool = True, use_processes: bool = True) -> list:
+    """
+    chart_data для каждой записи в том же порядке; None - запись некорректна
+    или карту не удалось рассчитать.
+
+    resolve_place(place) -> (lat, lon) и resolve_timezone(place, lat, lon, naive_local_dt) -> tz
+    вызываются для мест, которых нет в справочнике и кэше (по умолчанию офлайн).
+    use_cache=False - не читать и не писать chart_cache (например, для замеров).
+    """
+    resolve_place = resolve_place or offline_coordinates
+    resolve_timezone = resolve_timezone or longitude_timezone
+    records = list(records)
+    started = time.monotonic()
+
+    # Разбор и валидация записей
+    parsed = [None] * len(records)
+    places = {}
+    for i, record in enumerate(records):
+        date_str = (record.get('date') or '').strip()
+        time_str = (record.get('time') or '').strip()
+        place_str = (record.get('place') or '').strip()
+        if not date_str or not time_str or not place_str:
+            logger.warning(f"⚠️ Запись {i}: не указаны дата, время или место рождения")
+            continue
+        try:
+            naive_local_dt = ephemeris.parse_birth_datetime(date_str, time_str)
+        except ValueError as e:
+            logger.warning(f"⚠️ Запись {i}: {e}")
+            continue
+        place_key = geocode_cache.normalize_place(place_str)
+        places.setdefault(place_key, place_str)
+        parsed[i] = (date_str, time_str, place_str, place_key, naive_local_dt)
+
+    # Координаты - один раз на место, таймзоны - один раз на точку
+    coordinates = _resolve_places(places, resolve_place)
+    tz_memo = {}
+    keys = [None] * len(records)
+    jobs = {}  # chart_key -> (jd, lat, lon)
+    for i, item in enumerate(parsed):
+        if item is None:
+            continue
+        date_str, time_str, place_str, place_key, naive_local_dt = item
+        lat, lon = coordinates[place_key]
+        try:
+            tz = _timezone(place_str, lat, lon, naive_local_dt, resolve_timezone, tz_memo)
+            tz_name = getattr(tz, 'zone', None) or str(tz)
+            key = chart_cache.chart_key(naive_local_dt, lat, lon, tz_name, 'P')
+            if key not in jobs:
+                jobs[key] = (ephemeris.julian_day_utc(naive_local_dt, tz), lat, lon)
+            keys[i] = key
+        except Exception as e:
+            logger.warning(f"⚠️ Запись {i}: не удалось определить время рождения в UTC: {e}")
+
+    # Готовые карты - пачкой из кэша, остальные - в пуле процессов
+    charts = chart_cache.get_many(list(jobs)) if use_cache else {}
+    to_compute = [key for key in jobs if key not in charts]
+    for key, chart in zip(to_compute, _compute([jobs[key] for key in to_compute], use_processes)):
+        charts[key] = chart
+
+    if use_cache:
+        # Новые карты - в кэш одной транзакцией, остальные записи - в индекс данных рождения
+        computed = {key for key in to_compute if charts[key] is not None}
+        new_items = {}
+        for i, key in enumerate(keys):
+            if key is None or charts[key] is None:
+                continue
+            date_str, time_str, place_str = parsed[i][:3]
+            if key in computed and key not in new_items:
+                new_items[key] = (key, charts[key], date_str, time_str, place_str)
+            else:
+                chart_cache.remember_birth(key, date_str, time_str, place_str)
+        chart_cache.put_many(list(new_items.values()))
+
+    # Результат в порядке записей; одинаковые карты - независимые копии
+    result = []
+    used = set()
+    for key in keys:
+        if key is None or charts[key] is None:
+            result.append(None)
+        elif key in used:
+            result.append(copy.deepcopy(charts[key]))
+        else:
+            used.add(key)
+            result.append(charts[key])
+
+    elapsed = time.monotonic() - started
+    failed = sum(1 for key in to_compute if charts[key] is None)
+    logger.info(
+        f"📦 Пакетный расчёт карт: записей {len(records)}, мест {len(places)}, уникальных карт {len(jobs)}, "
+        f"из кэша {len(jobs) - len(to_compute)}, рассчитано {len(to_compute) - failed}, "
+        f"ошибок {failed} за {elapsed:.2f} с"
+    )
+    return result
+
+
+def iter_natal_charts(records, batch_size: int = CHART_BATCH_SIZE, **kwargs):
+    """Потоковый вариант: читает записи пачками по batch_size и отдаёт chart_data по порядку"""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield from calculate_natal_charts(batch, **kwargs)
+            batch = []
+    if batch:
+        yield from calculate_natal_charts(batch, **kwargs)
+
+
+# ===== ДАННЫЕ ПОЛЬЗОВАТЕЛЕЙ =====
+
+def iter_user_birth_data(limit: int = None):
+    """Данные рождения пользователей из таблицы users (только заполненные)"""
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        query = '''
+            SELECT birth_date, birth_time, birth_place FROM users
+            WHERE birth_date IS NOT NULL AND birth_date <> ''
+              AND birth_time IS NOT NULL AND birth_time <> ''
+              AND birth_place IS NOT NULL AND birth_place <> ''
+            ORDER BY user_id
+        '''
+        if limit:
+            query += f' LIMIT {int(limit)}'
+        cursor.execute(query)
+        rows = cursor.fetchall()
+    for birth_date, birth_time, birth_place in rows:
+        yield {'date': birth_date, 'time': birth_time, 'place': birth_place}
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    if len(sys.argv) < 2 or sys.argv[1] != '--users':
+        print("Использование:")
+        print("  python chart_batch.py --users [limit]")
+        sys.exit(1)
+
+    from bot import calculate_natal_charts_batch
+
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    records = list(iter_user_birth_data(limit))
+    started = time.monotonic()
+    charts = []
+    for start in range(0, len(records), CHART_BATCH_SIZE):
+        charts.extend(calculate_natal_charts_batch(records[start:start + CHART_BATCH_SIZE]))
+    elapsed = time.monotonic() - started
+    done = sum(1 for chart in charts if chart is not None)
+    print(f"✅ Рассчитано карт: {done} из {len(records)} за {elapsed:.1f} с ({done / elapsed if elapsed else 0:.1f} карт/с)")
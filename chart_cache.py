@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Кэш рассчитанных натальных карт (результат calculate_natal_chart).
+
+Пользователь, который открыл "планеты", а затем "интерпретацию", раньше платил
+за геокодирование и Swiss Ephemeris дважды (и ещё раз в запасном пути генерации).
+Карта полностью определяется входными данными, поэтому её можно переиспользовать:
+
+    chart_key - версия расчёта + локальные дата/время + координаты + таймзона +
+                система домов (точный ключ расчёта)
+    birth_key - дата, время и нормализованное место, как их ввёл пользователь;
+                по нему повторный расчёт не геокодирует место вовсе
+
+В таблице у каждого написания данных рождения своя строка (ключ chart_key +
+birth_key): одно написание не перезаписывает связь другого с картой.
+
+Два уровня: LRU в памяти процесса и (по желанию) таблица chart_cache в БД.
+При изменении данных рождения в save_user_profile записи для старых данных
+удаляются (invalidate_birth). CHART_CACHE_VERSION увеличивается при изменении
+самого расчёта - старые записи перестают совпадать по ключу; настройки
+аспектов (chart_engine.CONFIG_TAG) тоже входят в ключ.
+
+Настройки (переменные окружения):
+    CHART_CACHE_MAX_SIZE  - максимум карт в памяти (по умолчанию 1000)
+    CHART_CACHE_TTL       - время жизни карты в памяти, секунды (по умолчанию 3600)
+    CHART_CACHE_PERSIST   - хранить карты в таблице chart_cache: 1 (по умолчанию) или 0
+"""
+
+import copy
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Optional
+
+import chart_engine
+from db_pool import db_connection
+from geocode_cache import normalize_place
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+CHART_CACHE_MAX_SIZE = int(os.getenv('CHART_CACHE_MAX_SIZE', '1000'))
+CHART_CACHE_TTL = float(os.getenv('CHART_CACHE_TTL', '3600'))
+CHART_CACHE_PERSIST = os.getenv('CHART_CACHE_PERSIST', '1') == '1'
+
+# Версия расчёта: увеличить при изменении calculate_natal_chart (орбисы, набор точек и т.п.)
+CHART_CACHE_VERSION = 1
+
+_charts = TTLCache(CHART_CACHE_MAX_SIZE, CHART_CACHE_TTL)       # chart_key -> chart_data
+_birth_index = TTLCache(CHART_CACHE_MAX_SIZE, CHART_CACHE_TTL)  # birth_key -> chart_key
+
+_stats_lock = threading.Lock()
+_db_hits = 0
+_db_misses = 0
+
+
+def chart_key(local_dt: datetime, lat: float, lon: float, tz_name: str, house_system: str = 'P') -> str:
+    """Точный ключ расчёта по местному времени рождения; координаты округляются до 0.0001° (~10 м)"""
+    return (f"v{CHART_CACHE_VERSION}{chart_engine.CONFIG_TAG}|{local_dt:%Y-%m-%dT%H:%M}"
+            f"|{lat:.4f}|{lon:.4f}|{tz_name}|{house_system}")
+
+
+def birth_key(date_str: str, time_str: str, place: str) -> str:
+    """Ключ входных данных пользователя: дата и время без пробелов, нормализованное место"""
+    return f"v{CHART_CACHE_VERSION}{chart_engine.CONFIG_TAG}|{(date_str or '').strip()}|{(time_str or '').strip()}|{normalize_place(place)}"
+
+
+def _count(hit: bool):
+    global _db_hits, _db_misses
+    with _stats_lock:
+        if hit:
+            _db_hits += 1
+        else:
+            _db_misses += 1
+
+
+# ===== ЧТЕНИЕ =====
+
+def get(key: str) -> Optional[dict]:
+    """Карта по точному ключу расчёта (копия) или None"""
+    chart = _charts.get(key)
+    if chart is not None:
+        return copy.deepcopy(chart)
+    if not CHART_CACHE_PERSIST:
+        return None
+
+    version = _charts.version(key)
+    try:
+        with db_connection() as (conn, db_type):
+            cursor = conn.cursor()
+            ph = '%s' if db_type == 'postgresql' else '?'
+            cursor.execute(f'SELECT chart_data FROM chart_cache WHERE chart_key = {ph} LIMIT 1', (key,))
+            row = cursor.fetchone()
+    except Exception as e:
+        logger.error(f"❌ Ошибка чтения кэша карт: {e}", exc_info=True)
+        return None
+
+    _count(bool(row))
+    if not row:
+        return None
+    chart = json.loads(row[0])
+    _charts.set(key, chart, version=version)
+    return copy.deepcopy(chart)
+
+
+def lookup_birth(date_str: str, time_str: str, place: str) -> Optional[dict]:
+    """Карта по данным рождения в том виде, как их ввёл пользователь (без геокодирования)"""
+    b_key = birth_key(date_str, time_str, place)
+    key = _birth_index.get(b_key)
+    if key is not None:
+        chart = get(key)
+        if chart is not None:
+            return chart
+    if not CHART_CACHE_PERSIST:
+        return None
+
+    try:
+        with db_connection() as (conn, db_type):
+            cursor = conn.cursor()
+            ph = '%s' if db_type == 'postgresql' else '?'
+            cursor.execute(f'SELECT chart_key, chart_data FROM chart_cache WHERE birth_key = {ph} LIMIT 1', (b_key,))
+            row = cursor.fetchone()
+    except Exception as e:
+        logger.error(f"❌ Ошибка чтения кэша карт: {e}", exc_info=True)
+        return None
+
+    _count(bool(row))
+    if not row:
+        return None
+    chart = json.loads(row[1])
+    _charts.set(row[0], chart)
+    _birth_index.set(b_key, row[0])
+    return copy.deepcopy(chart)
+
+
+def get_many(keys: list, chunk_size: int = 500) -> dict:
+    """Карты по многим ключам расчёта сразу (один запрос к БД на chunk_size ключей): {key: копия карты}"""
+    result = {}
+    missing = []
+    for key in dict.fromkeys(keys):
+        chart = _charts.get(key)
+        if chart is not None:
+            result[key] = copy.deepcopy(chart)
+        else:
+            missing.append(key)
+    if not CHART_CACHE_PERSIST:
+        return result
+
+    for start in range(0, len(missing), chunk_size):
+        chunk = missing[start:start + chunk_size]
+        versions = {key: _charts.version(key) for key in chunk}
+        try:
+            with db_connection() as (conn, db_type):
+                cursor = conn.cursor()
+                ph = '%s' if db_type == 'postgresql' else '?'
+                cursor.execute(
+                    f'SELECT chart_key, chart_data FROM chart_cache WHERE chart_key IN ({", ".join([ph] * len(chunk))})',
+                    chunk,
+                )
+                rows = cursor.fetchall()
+        except Exception as e:
+            logger.error(f"❌ Ошибка пакетного чтения кэша карт: {e}", exc_info=True)
+            continue
+
+        for key, data in rows:
+            chart = json.loads(data)
+            _charts.set(key, chart, version=versions[key])
+            result[key] = copy.deepcopy(chart)
+        for key in chunk:
+            _count(key in result)
+    return result
+
+
+# ===== ЗАПИСЬ И ИНВАЛИДАЦИЯ =====
+
+def put(key: str, chart: dict, date_str: str, time_str: str, place: str):
+    """Сохраняет рассчитанную карту и связь данных рождения с ключом расчёта"""
+    b_key = birth_key(date_str, time_str, place)
+    _charts.set(key, copy.deepcopy(chart))
+    _birth_index.set(b_key, key)
+    if not CHART_CACHE_PERSIST:
+        return
+
+    try:
+        with db_connection() as (conn, db_type):
+            cursor = conn.cursor()
+            ph = '%s' if db_type == 'postgresql' else '?'
+            cursor.execute(f'''
+                INSERT INTO chart_cache (chart_key, birth_key, chart_data)
+                VALUES ({ph}, {ph}, {ph})
+                ON CONFLICT (chart_key, birth_key) DO UPDATE SET
+                    chart_data = excluded.chart_data
+            ''', (key, b_key, json.dumps(chart, ensure_ascii=False)))
+            conn.commit()
+    except Exception as e:
+        logger.error(f"❌ Ошибка записи кэша карт: {e}", exc_info=True)
+
+
+def put_many(items: list):
+    """
+    Сохраняет много карт одной транзакцией.
+    items - список (key, chart, date_str, time_str, place), как аргументы put.
+    """
+    rows = []
+    for key, chart, date_str, time_str, place in items:
+        b_key = birth_key(date_str, time_str, place)
+        _charts.set(key, copy.deepcopy(chart))
+        _birth_index.set(b_key, key)
+        rows.append((key, b_key, json.dumps(chart, ensure_ascii=False)))
+    if not CHART_CACHE_PERSIST or not rows:
+        return
+
+    try:
+        with db_connection() as (conn, db_type):
+            cursor = conn.cursor()
+            ph = '%s' if db_type == 'postgresql' else '?'
+            cursor.executemany(f'''
+                INSERT INTO chart_cache (chart_key, birth_key, chart_data)
+                VALUES ({ph}, {ph}, {ph})
+                ON CONFLICT (chart_key, birth_key) DO UPDATE SET
+                    chart_data = excluded.chart_data
+            ''', rows)
+            conn.commit()
+    except Exception as e:
+        logger.error(f"❌ Ошибка пакетной записи кэша карт: {e}", exc_info=True)
+
+
+def remember_birth(key: str, date_str: str, time_str: str, place: str):
+    """Связывает другое написание тех же данных рождения с уже рассчитанной картой (только в памяти)"""
+    _birth_index.set(birth_key(date_str, time_str, place), key)
+
+
+def invalidate_birth(date_str: str, time_str: str, place: str):
+    """Удаляет карты, рассчитанные для этих данных рождения (память и БД)"""
+    b_key = birth_key(date_str, time_str, place)
+    key = _birth_index.get(b_key)
+    _birth_index.invalidate(b_key)
+    if key is not None:
+        _charts.invalidate(key)
+    if not CHART_CACHE_PERSIST:
+        return
+
+    try:
+        with db_connection() as (conn, db_type):
+            cursor = conn.cursor()
+            ph = '%s' if db_type == 'postgresql' else '?'
+            cursor.execute(f'SELECT chart_key FROM chart_cache WHERE birth_key = {ph}', (b_key,))
+            keys = [row[0] for row in cursor.fetchall()]
+            cursor.execute(f'DELETE FROM chart_cache WHERE birth_key = {ph}', (b_key,))
+            conn.commit()
+    except Exception as e:
+        logger.error(f"❌ Ошибка инвалидации кэша карт: {e}", exc_info=True)
+        return
+    for key in keys:
+        _charts.invalidate(key)
+
+
+def get_chart_cache_stats() -> dict:
+    """Метрики кэша для /health"""
+    with _stats_lock:
+        return {
+            'memory': _charts.stats(),
+            'birth_index': _birth_index.stats(),
+            'persist': CHART_CACHE_PERSIST,
+            'db_hits': _db_hits,
+            'db_misses': _db_misses,
+        }
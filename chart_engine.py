@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Векторизованный расчёт аспектов и домов натальной карты (NumPy).
+
+Вместо вложенного цикла по парам планет и каскада if/elif по видам аспектов
+строится матрица угловых расстояний между всеми точками сразу, и для каждой
+пары выбирается первый подходящий аспект из таблицы орбисов. Дома назначаются
+одним searchsorted по отсортированным куспидам. find_cross_aspects - та же
+классификация для пар из двух наборов точек (транзиты, синастрия).
+
+Результат совпадает с прежним расчётом в calculate_natal_chart (список
+aspects_data и словарь planets_in_houses), см. test_chart_engine.py.
+
+Настройки (переменные окружения):
+    CHART_MINOR_ASPECTS  - учитывать минорные аспекты: 0 (по умолчанию) или 1
+    CHART_ASPECT_POINTS  - аспекты к Северному узлу, ASC и MC: 0 (по умолчанию) или 1
+"""
+
+import os
+
+import numpy as np
+
+CHART_MINOR_ASPECTS = os.getenv('CHART_MINOR_ASPECTS', '0') == '1'
+CHART_ASPECT_POINTS = os.getenv('CHART_ASPECT_POINTS', '0') == '1'
+
+# (название, точный угол, орбис) - классическая астрология, узкие орбисы.
+# Порядок задаёт приоритет, если диапазоны пересекаются.
+MAJOR_ASPECTS = [
+    ('Соединение', 0.0, 6.0),
+    ('Оппозиция', 180.0, 5.0),
+    ('Квадрат', 90.0, 5.0),
+    ('Трин', 120.0, 4.0),
+    ('Секстиль', 60.0, 4.0),
+]
+
+MINOR_ASPECTS = [
+    ('Квинконс', 150.0, 3.0),
+    ('Полусекстиль', 30.0, 2.0),
+    ('Полуквадрат', 45.0, 2.0),
+    ('Полутораквадрат', 135.0, 2.0),
+    ('Квинтиль', 72.0, 2.0),
+]
+
+ASPECTS = MAJOR_ASPECTS + (MINOR_ASPECTS if CHART_MINOR_ASPECTS else [])
+
+# Транзиты: мажорные аспекты с орбисом 1° - аспект "действует" несколько дней, а не недель
+TRANSIT_ASPECTS = [(name, angle, 1.0) for name, angle, _ in MAJOR_ASPECTS]
+
+# Метка настроек для ключа кэша карт: другие настройки - другой набор аспектов
+CONFIG_TAG = ('+minor' if CHART_MINOR_ASPECTS else '') + ('+points' if CHART_ASPECT_POINTS else '')
+
+
+def angular_distances(longitudes) -> np.ndarray:
+    """Матрица углов между точками в диапазоне 0..180°"""
+    lon = np.asarray(longitudes, dtype=float)
+    diff = np.abs(lon[:, None] - lon[None, :])
+    return np.where(diff > 180, 360 - diff, diff)
+
+
+def find_aspects(names: list, longitudes, aspects: list = None) -> list:
+    """
+    Аспекты между всеми парами точек.
+
+    names и longitudes - в одном порядке; пары перечисляются как в прежнем цикле
+    (i < j по порядку names). Возвращает список словарей
+    {'planet1', 'planet2', 'aspect', 'angle', 'orb'}.
+    """
+    aspects = ASPECTS if aspects is None else aspects
+    if len(names) < 2 or not aspects:
+        return []
+
+    rows, cols = np.triu_indices(len(names), k=1)
+    angles = angular_distances(longitudes)[rows, cols]
+    return _aspects_for_pairs(names, names, rows, cols, angles, aspects)
+
+
+def find_cross_aspects(names_a: list, longitudes_a, names_b: list, longitudes_b, aspects: list = None) -> list:
+    """
+    Аспекты между точками двух наборов (транзиты к натальной карте, синастрия):
+    все пары (a, b), planet1 - из первого набора, planet2 - из второго.
+    """
+    aspects = ASPECTS if aspects is None else aspects
+    if not names_a or not names_b or not aspects:
+        return []
+
+    lon_a = np.asarray(longitudes_a, dtype=float)
+    lon_b = np.asarray(longitudes_b, dtype=float)
+    diff = np.abs(lon_a[:, None] - lon_b[None, :])
+    angles = np.where(diff > 180, 360 - diff, diff).ravel()
+    rows, cols = np.divmod(np.arange(len(names_a) * len(names_b)), len(names_b))
+    return _aspects_for_pairs(names_a, names_b, rows, cols, angles, aspects)
+
+
+def _aspects_for_pairs(names_a: list, names_b: list, rows, cols, angles, aspects: list) -> list:
+    """Первый подходящий аспект для каждой пары (names_a[rows[p]], names_b[cols[p]]) с углом angles[p]"""
+    exact = np.array([a[1] for a in aspects])
+    orbs = np.array([a[2] for a in aspects])
+    # matches[k, p] - пара p попадает в орбис аспекта k (границы включительно)
+    matches = (angles[None, :] >= exact[:, None] - orbs[:, None]) & (angles[None, :] <= exact[:, None] + orbs[:, None])
+    found = matches.any(axis=0)
+    kinds = matches.argmax(axis=0)
+
+    result = []
+    for p in np.flatnonzero(found):
+        kind = kinds[p]
+        angle = float(angles[p])
+        result.append({
+            'planet1': names_a[rows[p]],
+            'planet2': names_b[cols[p]],
+            'aspect': aspects[kind][0],
+            'angle': angle,
+            'orb': abs(angle - aspects[kind][1]),
+        })
+    return result
+
+
+def _assign_houses_by_scan(names: list, longitudes, cusps: list) -> dict:
+    """Прежний алгоритм: Cusp_n <= планета < Cusp_(n+1), с переходом через 0°"""
+    houses = {}
+    for name, planet_long in zip(names, longitudes):
+        for house_num in range(1, 13):
+            cusp_current = cusps[house_num - 1]
+            cusp_next = cusps[house_num % 12]
+            if cusp_current <= cusp_next:
+                if cusp_current <= planet_long < cusp_next:
+                    houses[name] = house_num
+                    break
+            elif planet_long >= cusp_current or planet_long < cusp_next:
+                houses[name] = house_num
+                break
+    return houses
+
+
+def assign_houses(names: list, longitudes, cusps: list) -> dict:
+    """
+    Номер дома (1-12) для каждой точки. cusps - 12 куспидов домов 1-12 в градусах.
+
+    Куспиды, идущие по кругу по возрастанию, после сортировки - это тот же круг,
+    начатый с наименьшего куспида; дом находится бинарным поиском по абсолютным
+    долготам (сравнения те же, что в прежнем переборе). Точка левее наименьшего
+    куспида принадлежит дому с наибольшим куспидом (переход через 0°).
+    Если куспиды не образуют возрастающий круг (расчёт домов не удался),
+    используется прежний перебор.
+    """
+    cusps = np.asarray(cusps, dtype=float)
+    descents = np.count_nonzero(np.roll(cusps, -1) <= cusps)
+    if descents != 1:
+        return _assign_houses_by_scan(names, list(longitudes), list(cusps))
+
+    order = np.argsort(cusps)
+    idx = np.searchsorted(cusps[order], np.asarray(longitudes, dtype=float), side='right') - 1
+    house_numbers = order[idx] + 1  # idx = -1 -> последний элемент, дом с наибольшим куспидом
+    return {name: int(house) for name, house in zip(names, house_numbers)}
+
+
+def chart_points(planets_data: dict, planet_order: list, north_node: float, asc: float, mc: float):
+    """
+    Имена и долготы точек для аспектов: планеты в порядке planet_order и,
+    если включено CHART_ASPECT_POINTS, Северный узел, ASC и MC.
+    """
+    names = [name for name in planet_order if name in planets_data]
+    longitudes = [planets_data[name]['longitude'] for name in names]
+    if CHART_ASPECT_POINTS:
+        names += ['NorthNode', 'Ascendant', 'MC']
+        longitudes += [north_node, asc, mc]
+    return names, longitudes
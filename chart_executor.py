@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Исполнители для блокирующих и вычислительных задач расчёта карты.
+
+Геокодирование (HTTP-запросы к Nominatim) и Swiss Ephemeris не должны выполняться
+в event loop: один медленный ответ геокодера останавливает бота для всех
+пользователей. Задачи отправляются в ограниченные пулы:
+
+    chart  - пул потоков для расчёта карты целиком (calculate_natal_chart)
+    geo    - пул потоков для запросов к геокодеру (прямой и обратный geocode)
+    cpu    - пул процессов для пакетного расчёта эфемерид (chart_batch.py; создаётся
+             при первом использовании, функция и аргументы должны сериализоваться pickle)
+
+У каждой задачи свой таймаут. Если очередь пула переполнена, задача сразу
+отклоняется с ExecutorOverloaded, а не ждёт минутами. Задачи пулов потоков
+выполняются в контексте вызывающего (contextvars), как в asyncio.to_thread.
+
+    chart_data = await chart_executor.run_chart(calculate_natal_chart, birth_data)
+    lat, lon = chart_executor.run_geocode_sync(get_coordinates_from_place, place)
+
+Настройки (переменные окружения):
+    CHART_EXECUTOR_WORKERS   - потоков для расчёта карт (по умолчанию 4)
+    CHART_JOB_TIMEOUT        - таймаут расчёта карты, секунды (по умолчанию 45)
+    GEOCODE_EXECUTOR_WORKERS - потоков для геокодирования (по умолчанию 4)
+    GEOCODE_JOB_TIMEOUT      - таймаут запроса к геокодеру, секунды (по умолчанию 15)
+    CPU_EXECUTOR_WORKERS     - процессов для вычислений (по умолчанию число CPU, не больше 4)
+    CPU_JOB_TIMEOUT          - таймаут вычислительной задачи, секунды (по умолчанию 120)
+    EXECUTOR_MAX_QUEUE       - максимум задач в очереди одного пула (по умолчанию 100)
+"""
+
+import asyncio
+import atexit
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+CHART_EXECUTOR_WORKERS = int(os.getenv('CHART_EXECUTOR_WORKERS', '4'))
+CHART_JOB_TIMEOUT = float(os.getenv('CHART_JOB_TIMEOUT', '45'))
+GEOCODE_EXECUTOR_WORKERS = int(os.getenv('GEOCODE_EXECUTOR_WORKERS', '4'))
+GEOCODE_JOB_TIMEOUT = float(os.getenv('GEOCODE_JOB_TIMEOUT', '15'))
+CPU_EXECUTOR_WORKERS = int(os.getenv('CPU_EXECUTOR_WORKERS', str(min(4, os.cpu_count() or 1))))
+CPU_JOB_TIMEOUT = float(os.getenv('CPU_JOB_TIMEOUT', '120'))
+EXECUTOR_MAX_QUEUE = int(os.getenv('EXECUTOR_MAX_QUEUE', '100'))
+
+
+class ExecutorOverloaded(RuntimeError):
+    """Очередь пула переполнена - задача не принята"""
+
+
+class JobTimeout(TimeoutError):
+    """Задача не завершилась за отведённое время"""
+
+
+class BoundedExecutor:
+    """
+    Пул потоков или процессов с ограниченной очередью, таймаутами и метриками.
+
+    Пул создаётся лениво. Задача, не дождавшаяся результата за timeout, отменяется,
+    если ещё стоит в очереди; уже выполняющуюся задачу прервать нельзя, она
+    досчитается в фоне (поэтому у сетевых вызовов внутри задач свои таймауты).
+    """
+
+    def __init__(self, name: str, max_workers: int, timeout: float,
+                 max_queue: int = EXECUTOR_MAX_QUEUE, use_processes: bool = False):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        self.max_queue = max(1, max_queue)
+        self.use_processes = use_processes
+
+        self._executor = None
+        self._lock = threading.Lock()
+
+        # Метрики
+        self._pending = 0  # в очереди + выполняются
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._timeouts = 0
+        self._rejected = 0
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+
+    def _get_executor(self):
+        """Ленивое создание пула (под self._lock)"""
+        if self._executor is None:
+            if self.use_processes:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+            logger.info(f"✅ Пул '{self.name}' создан ({'процессов' if self.use_processes else 'потоков'}: {self.max_workers})")
+        return self._executor
+
+    def submit(self, func, *args, **kwargs):
+        """Ставит задачу в пул без ожидания. Возвращает concurrent.futures.Future."""
+        with self._lock:
+            queued = self._pending - self.max_workers
+            if queued >= self.max_queue:
+                self._rejected += 1
+                raise ExecutorOverloaded(
+                    f"Пул '{self.name}' перегружен: в очереди {queued} задач (максимум {self.max_queue})"
+                )
+            if not self.use_processes:
+                # Контекст вызывающего (например, трасса задания generation_spans) доступен в потоке пула
+                func, args = contextvars.copy_context().run, (func, *args)
+            future = self._get_executor().submit(func, *args, **kwargs)
+            self._pending += 1
+            self._submitted += 1
+        started = time.monotonic()
+        future.add_done_callback(functools.partial(self._on_done, started))
+        return future
+
+    def _on_done(self, started, future):
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+            self._total_seconds += elapsed
+            self._max_seconds = max(self._max_seconds, elapsed)
+
+    def _on_timeout(self, future, timeout, func):
+        future.cancel()
+        with self._lock:
+            self._timeouts += 1
+        name = getattr(func, '__name__', repr(func))
+        logger.warning(f"⏱️ Пул '{self.name}': задача {name} не завершилась за {timeout:g} с")
+        return JobTimeout(f"{name} не завершилась за {timeout:g} с (пул '{self.name}')")
+
+    def run_sync(self, func, *args, timeout: float = None, **kwargs):
+        """Выполняет задачу в пуле и ждёт результат (для вызова из обычных потоков)"""
+        timeout = self.timeout if timeout is None else timeout
+        future = self.submit(func, *args, **kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # TimeoutError, выброшенный самой задачей, пробрасываем как есть
+            if future.cancelled() or not future.done():
+                raise self._on_timeout(future, timeout, func) from None
+            raise
+
+    async def run(self, func, *args, timeout: float = None, **kwargs):
+        """Выполняет задачу в пуле, не блокируя event loop"""
+        timeout = self.timeout if timeout is None else timeout
+        future = self.submit(func, *args, **kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            # TimeoutError, выброшенный самой задачей, пробрасываем как есть
+            if future.cancelled() or not future.done():
+                raise self._on_timeout(future, timeout, func) from None
+            raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                'kind': 'process' if self.use_processes else 'thread',
+                'workers': self.max_workers,
+                'running': min(self._pending, self.max_workers),
+                'queue_depth': max(0, self._pending - self.max_workers),
+                'max_queue': self.max_queue,
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'failed': self._failed,
+                'timeouts': self._timeouts,
+                'rejected': self._rejected,
+                'avg_seconds': round(self._total_seconds / finished, 3) if finished else 0.0,
+                'max_seconds': round(self._max_seconds, 3),
+            }
+
+    def shutdown(self, wait: bool = False):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+chart_pool = BoundedExecutor('chart', CHART_EXECUTOR_WORKERS, CHART_JOB_TIMEOUT)
+geocode_pool = BoundedExecutor('geo', GEOCODE_EXECUTOR_WORKERS, GEOCODE_JOB_TIMEOUT)
+cpu_pool = BoundedExecutor('cpu', CPU_EXECUTOR_WORKERS, CPU_JOB_TIMEOUT, use_processes=True)
+
+
+# ===== ПУБЛИЧНЫЙ ИНТЕРФЕЙС =====
+
+async def run_chart(func, *args, **kwargs):
+    """Расчёт карты (геокодирование + эфемериды) вне event loop"""
+    return await chart_pool.run(func, *args, **kwargs)
+
+
+async def run_geocode(func, *args, **kwargs):
+    """Запрос к геокодеру вне event loop"""
+    return await geocode_pool.run(func, *args, **kwargs)
+
+
+def run_geocode_sync(func, *args, **kwargs):
+    """Запрос к геокодеру из рабочего потока"""
+    return geocode_pool.run_sync(func, *args, **kwargs)
+
+
+def get_executor_stats() -> dict:
+    """Метрики пулов для /health: глубина очереди, таймауты, время выполнения"""
+    return {pool.name: pool.stats() for pool in (chart_pool, geocode_pool, cpu_pool)}
+
+
+def shutdown_executors(wait: bool = False):
+    """Останавливает пулы, задачи из очередей отменяются"""
+    for pool in (chart_pool, geocode_pool, cpu_pool):
+        pool.shutdown(wait=wait)
+
+
+atexit.register(shutdown_executors)
@@ -1,149 +1,101 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-"""Очистка зависших генераций натальной карты в базе данных Railway"""
-import os
+"""
+Очистка зависших генераций натальной карты в очереди generation_jobs.
+
+Задание с истёкшей арендой обычно продолжает следующий воркер - вмешиваться не нужно.
+Зависшим считается незавершённое задание, которое никто не обрабатывает (аренды
+нет или она истекла) дольше заданного числа минут: например, не запущен
+astral_worker. Такие задания помечаются failed с событием natal_chart_error
+(StuckGeneration), оплата пользователя сохраняется - он может повторить
+генерацию. Задания с действующей арендой не трогаются.
+
+Запуск:
+    python cleanup_stuck_generations.py        # простаивают дольше 10 минут
+    python cleanup_stuck_generations.py 30     # дольше 30 минут
+"""
+
 import sys
-from dotenv import load_dotenv
-from urllib.parse import urlparse
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from datetime import datetime, timezone, timedelta
-import json
-
-load_dotenv()
-
-DATABASE_URL = os.getenv('DATABASE_PUBLIC_URL') or os.getenv('DATABASE_URL')
-
-if not DATABASE_URL:
-    print("❌ DATABASE_PUBLIC_URL или DATABASE_URL не найдена!")
-    sys.exit(1)
-
-print("🔧 Очистка зависших генераций натальной карты\n")
-print("=" * 80)
-
-try:
-    result = urlparse(DATABASE_URL)
-    conn = psycopg2.connect(
-        database=result.path[1:],
-        user=result.username,
-        password=result.password,
-        host=result.hostname,
-        port=result.port
-    )
-    
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    print("✅ Подключение к базе данных успешно!\n")
-    
-    # Находим все незавершенные генерации старше 10 минут
-    now = datetime.now(timezone.utc)
-    ten_minutes_ago = now - timedelta(minutes=10)
-    
-    print(f"🔍 Поиск зависших генераций (старше 10 минут, до {ten_minutes_ago.isoformat()})...\n")
-    
-    cursor.execute("""
-        SELECT e1.user_id, e1.timestamp, e1.event_data
-        FROM events e1
-        WHERE e1.event_type = 'natal_chart_generation_start'
-        AND e1.timestamp < %s
-        AND NOT EXISTS (
-            SELECT 1 
-            FROM events e2 
-            WHERE e2.user_id = e1.user_id 
-            AND e2.event_type IN ('natal_chart_success', 'natal_chart_error')
-            AND e2.timestamp > e1.timestamp
-        )
-        ORDER BY e1.timestamp DESC
-    """, (ten_minutes_ago.isoformat(),))
-    
-    stuck_generations = cursor.fetchall()
-    
-    if not stuck_generations:
+
+import generation_queue
+import repository
+from generation_spans import seconds_since
+
+DEFAULT_IDLE_MINUTES = 10
+
+
+def find_stuck_jobs(idle_minutes: float) -> list:
+    """Незавершённые задания без действующей аренды, простаивающие дольше idle_minutes"""
+    stuck = []
+    for job in repository.list_active_generation_jobs():
+        lease_left = generation_queue.lease_seconds_left(job)
+        if lease_left is not None and lease_left > 0:
+            continue
+        if (seconds_since(job['updated_at']) or 0.0) >= idle_minutes * 60:
+            stuck.append(job)
+    return stuck
+
+
+def main():
+    try:
+        idle_minutes = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_IDLE_MINUTES
+    except ValueError:
+        print("❌ Число минут должно быть числом, например: python cleanup_stuck_generations.py 30")
+        return 1
+
+    print("🔧 Очистка зависших генераций натальной карты\n")
+    print("=" * 80)
+    print(f"🔍 Поиск заданий без воркера дольше {idle_minutes:g} минут...\n")
+
+    try:
+        stuck_jobs = find_stuck_jobs(idle_minutes)
+    except Exception as e:
+        print(f"❌ Ошибка: {e}")
+        import traceback
+        traceback.print_exc()
+        return 1
+
+    if not stuck_jobs:
         print("✅ Зависших генераций не найдено\n")
-    else:
-        print(f"⚠️ Найдено {len(stuck_generations)} зависших генераций:\n")
-        
-        for gen in stuck_generations:
-            user_id = gen['user_id']
-            # Парсим timestamp (может быть строкой или datetime объектом)
-            if isinstance(gen['timestamp'], str):
-                start_time_str = gen['timestamp'].replace('Z', '+00:00')
-                start_time = datetime.fromisoformat(start_time_str)
-                if start_time.tzinfo is None:
-                    start_time = start_time.replace(tzinfo=timezone.utc)
-            else:
-                start_time = gen['timestamp']
-                if start_time.tzinfo is None:
-                    start_time = start_time.replace(tzinfo=timezone.utc)
-            
-            duration_minutes = (now - start_time).total_seconds() / 60
-            
-            # Получаем имя пользователя
-            cursor.execute("SELECT first_name, username FROM users WHERE user_id = %s", (user_id,))
-            user_info = cursor.fetchone()
-            user_name = user_info['first_name'] if user_info else 'Неизвестно'
-            username = user_info['username'] if user_info else None
-            
-            print(f"   User ID: {user_id}")
-            if username:
-                print(f"   Username: @{username}")
-            print(f"   Имя: {user_name}")
-            print(f"   Начата: {gen['timestamp']}")
-            print(f"   Длительность: {duration_minutes:.1f} минут")
-            
-            # Проверяем, есть ли уже ошибка StuckGeneration
-            cursor.execute("""
-                SELECT COUNT(*) as count
-                FROM events
-                WHERE user_id = %s
-                AND event_type = 'natal_chart_error'
-                AND event_data::text LIKE %s
-            """, (user_id, '%StuckGeneration%'))
-            
-            has_stuck_error = cursor.fetchone()['count'] > 0
-            
-            if not has_stuck_error:
-                # Логируем зависшую генерацию как ошибку
-                error_data = {
-                    'error_type': 'StuckGeneration',
-                    'error_message': f'Генерация зависла и не завершилась за {duration_minutes:.1f} минут',
-                    'stage': 'generation',
-                    'stuck_duration_minutes': duration_minutes,
-                    'generation_start': gen['timestamp']
-                }
-                
-                cursor.execute("""
-                    INSERT INTO events (user_id, event_type, event_data, timestamp)
-                    VALUES (%s, 'natal_chart_error', %s, %s)
-                """, (user_id, json.dumps(error_data, ensure_ascii=False), now.isoformat()))
-                
-                print(f"   ✅ Залогирована ошибка StuckGeneration")
-            else:
-                print(f"   ℹ️ Ошибка StuckGeneration уже залогирована ранее")
-            
-            print()
-        
-        # Подтверждаем изменения
-        if not has_stuck_error:
-            response = input(f"\n💾 Сохранить изменения в базе данных? (y/n): ")
-            if response.lower() == 'y':
-                conn.commit()
-                print(f"✅ Изменения сохранены! Очищено {len(stuck_generations)} зависших генераций")
-            else:
-                conn.rollback()
-                print("❌ Изменения отменены")
-        else:
-            print("\nℹ️ Все зависшие генерации уже обработаны")
-    
-    conn.close()
+        return 0
+
+    print(f"⚠️ Найдено {len(stuck_jobs)} зависших генераций:\n")
+    for job in stuck_jobs:
+        idle = (seconds_since(job['updated_at']) or 0.0) / 60
+        print(f"   Задание {job['job_id']}, User ID: {job['user_id']}")
+        print(f"   Стадия: {job['state']}, попыток: {job['attempts']}")
+        print(f"   Поставлено: {job['created_at']}, простаивает {idle:.1f} минут")
+        print()
+
+    response = input("💾 Пометить задания как failed (оплата сохранится)? (y/n): ")
+    if response.lower() != 'y':
+        print("❌ Изменения отменены")
+        return 0
+
+    cleaned = 0
+    for job in stuck_jobs:
+        idle = (seconds_since(job['updated_at']) or 0.0) / 60
+        error = f"Генерация зависла: задание не обрабатывалось {idle:.1f} минут (стадия {job['state']})"
+        # Задание могли взять в работу, пока скрипт ждал подтверждения, - тогда не трогаем
+        if not repository.fail_idle_generation_job(job['job_id'], error):
+            print(f"   ℹ️ Задание {job['job_id']} уже в работе или завершено - пропущено")
+            continue
+        repository.log_event(job['user_id'], 'natal_chart_error', {
+            'error_type': 'StuckGeneration',
+            'error_message': error,
+            'stage': job['state'],
+            'job_id': job['job_id'],
+            'stuck_duration_minutes': idle,
+            'payment_kept': True
+        })
+        cleaned += 1
+        print(f"   ✅ Задание {job['job_id']} помечено failed")
+
+    repository.stop_event_buffer()
     print("\n" + "=" * 80)
-    print("✅ Анализ завершен")
+    print(f"✅ Очищено зависших генераций: {cleaned}")
+    return 0
 
-except psycopg2.Error as e:
-    print(f"❌ Ошибка PostgreSQL: {e}")
-    sys.exit(1)
-except Exception as e:
-    print(f"❌ Ошибка: {e}")
-    import traceback
-    traceback.print_exc()
-    sys.exit(1)
 
+if __name__ == '__main__':
+    sys.exit(main())
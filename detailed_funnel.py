@@ -13,6 +13,8 @@ from dotenv import load_dotenv
 from datetime import datetime
 import pytz
 
+from events_maintenance import report_today, refresh_rollups_for_day, rollup_unique_users
+
 load_dotenv()
 
 DATABASE_URL = os.getenv('DATABASE_PUBLIC_URL') or os.getenv('DATABASE_URL')
@@ -47,20 +49,11 @@ def get_detailed_funnel(date_filter):
     print(f"✅ Подключение к {'PostgreSQL' if db_type == 'postgresql' else 'SQLite'} установлено")
     print(f"📅 Фильтр по дате: {date_filter}\n")
     
-    # Формируем условие фильтрации по дате
-    if db_type == 'postgresql':
-        date_condition = """AND (
-            (timestamp::timestamp AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Moscow')::date = %s::date
-        )"""
-        date_params = (date_filter,)
-    else:
-        moscow_tz = pytz.timezone('Europe/Moscow')
-        date_start_msk = moscow_tz.localize(datetime.strptime(f"{date_filter} 00:00:00", "%Y-%m-%d %H:%M:%S"))
-        date_end_msk = moscow_tz.localize(datetime.strptime(f"{date_filter} 23:59:59.999999", "%Y-%m-%d %H:%M:%S.%f"))
-        date_start_utc = date_start_msk.astimezone(pytz.UTC).isoformat()
-        date_end_utc = date_end_msk.astimezone(pytz.UTC).isoformat()
-        date_condition = "AND timestamp >= ? AND timestamp <= ?"
-        date_params = (date_start_utc, date_end_utc)
+    # Читаем дневные агрегаты; текущий день досчитываем, он обновляется раз в час
+    day = datetime.strptime(date_filter, '%Y-%m-%d').date()
+    if day == report_today():
+        refresh_rollups_for_day(cursor, db_type, day)
+        conn.commit()
     
     # Этапы воронки
     stages = [
@@ -84,20 +77,7 @@ def get_detailed_funnel(date_filter):
     
     for i, (event_type, stage_name, stage_description) in enumerate(stages):
         # Получаем количество пользователей на этом этапе
-        if db_type == 'postgresql':
-            cursor.execute(f'''
-                SELECT COUNT(DISTINCT user_id)
-                FROM events
-                WHERE event_type = %s {date_condition}
-            ''', (event_type,) + date_params)
-        else:
-            cursor.execute(f'''
-                SELECT COUNT(DISTINCT user_id)
-                FROM events
-                WHERE event_type = ? {date_condition}
-            ''', (event_type,) + date_params)
-        
-        count = cursor.fetchone()[0] or 0
+        count = rollup_unique_users(cursor, db_type, event_type, day)
         
         if i == 0:
             total_start = count
@@ -164,20 +144,7 @@ def get_detailed_funnel(date_filter):
         
         previous_count = total_start
         for i, (event_type, stage_name, _) in enumerate(stages[1:], 1):
-            if db_type == 'postgresql':
-                cursor.execute(f'''
-                    SELECT COUNT(DISTINCT user_id)
-                    FROM events
-                    WHERE event_type = %s {date_condition}
-                ''', (event_type,) + date_params)
-            else:
-                cursor.execute(f'''
-                    SELECT COUNT(DISTINCT user_id)
-                    FROM events
-                    WHERE event_type = ? {date_condition}
-                ''', (event_type,) + date_params)
-            
-            current_count = cursor.fetchone()[0] or 0
+            current_count = rollup_unique_users(cursor, db_type, event_type, day)
             loss = previous_count - current_count
             loss_percentage = (loss / previous_count * 100) if previous_count > 0 else 0
             
@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Расчёт натальной карты Swiss Ephemeris по юлианской дате и координатам.
+
+Здесь только вычисления: без геокодирования, таймзон, кэшей и БД (положения
+планет - из таблицы ephemeris_table.py или Swiss Ephemeris). Поэтому
+модуль лёгкий и подходит для пула процессов (пакетный расчёт в chart_batch.py),
+а calculate_natal_chart в bot.py использует ту же функцию для одной карты.
+
+    naive_local_dt = parse_birth_datetime(date_str, time_str)
+    jd = julian_day_utc(naive_local_dt, tz)
+    chart_data = compute_chart(jd, lat, lon)
+
+Для нескольких продуктов по одним данным рождения - объект Chart: положения
+тел считаются один раз, из них строятся дома любой системы из HOUSE_SYSTEMS
+(Плацидус, Кох, целые знаки, равные дома), транзиты за период, синастрия
+двух карт и соляр.
+"""
+
+import copy
+import functools
+import logging
+from datetime import datetime
+
+import pytz
+import swisseph as swe
+
+import chart_engine
+import ephemeris_table
+
+logger = logging.getLogger(__name__)
+
+SIGNS = ['Овен', 'Телец', 'Близнецы', 'Рак', 'Лев', 'Дева',
+         'Весы', 'Скорпион', 'Стрелец', 'Козерог', 'Водолей', 'Рыбы']
+
+# Системы домов: код swe.houses -> название
+HOUSE_SYSTEMS = {
+    'P': 'Плацидус',
+    'K': 'Кох',
+    'W': 'Целые знаки',
+    'E': 'Равные дома',
+}
+
+# Константы планет в Swiss Ephemeris
+PLANETS = {
+    'Sun': swe.SUN,
+    'Moon': swe.MOON,
+    'Mercury': swe.MERCURY,
+    'Venus': swe.VENUS,
+    'Mars': swe.MARS,
+    'Jupiter': swe.JUPITER,
+    'Saturn': swe.SATURN,
+    'Uranus': swe.URANUS,
+    'Neptune': swe.NEPTUNE,
+    'Pluto': swe.PLUTO,
+}
+
+
+def parse_birth_datetime(date_str: str, time_str: str) -> datetime:
+    """Местные дата и время рождения из строк ДД.ММ.ГГГГ и ЧЧ:ММ; ValueError, если формат неверный"""
+    try:
+        day, month, year = map(int, date_str.split('.'))
+    except (ValueError, AttributeError):
+        raise ValueError(f"Некорректный формат даты: {date_str}. Ожидается ДД.ММ.ГГГГ")
+
+    try:
+        hour, minute = map(int, time_str.split(':'))
+    except (ValueError, AttributeError):
+        raise ValueError(f"Некорректный формат времени: {time_str}. Ожидается ЧЧ:ММ")
+
+    try:
+        datetime(year, month, day)
+    except ValueError:
+        raise ValueError(f"Некорректная дата: {day}.{month}.{year}")
+
+    if not (0 <= hour <= 23) or not (0 <= minute <= 59):
+        raise ValueError(f"Некорректное время: {hour}:{minute}")
+    return datetime(year, month, day, hour, minute)
+
+
+def julian_day_utc(naive_local_dt: datetime, tz) -> float:
+    """Юлианская дата (UT) для местного времени рождения в таймзоне tz (pytz)"""
+    utc_dt = tz.localize(naive_local_dt).astimezone(pytz.UTC)
+    hour_decimal = utc_dt.hour + utc_dt.minute / 60.0 + utc_dt.second / 3600.0
+    return swe.julday(utc_dt.year, utc_dt.month, utc_dt.day, hour_decimal, swe.GREG_CAL)
+
+
+def _point(longitude: float, sign_num: int) -> dict:
+    return {
+        'longitude': longitude,
+        'sign': SIGNS[sign_num],
+        'sign_degrees': longitude % 30,
+    }
+
+
+def body_positions(jd: float, precise: bool = False) -> dict:
+    """
+    Положения планет и истинного узла на момент jd (UT) - общая часть всех видов карт.
+    Возвращает {'planets': planets_data, 'retrograde_planets': [...], 'north_node': долгота}.
+    """
+    planets_data = {}
+    retrograde_planets = []
+
+    for planet_name, planet_id in PLANETS.items():
+        result = ephemeris_table.calc_ut(jd, planet_id, swe.FLG_SWIEPH | swe.FLG_SPEED, precise)
+        # В Swiss Ephemeris result[0] - это ТУПЛЬ с данными, result[1] - код возврата
+        if len(result) >= 2 and result[0] is not None and len(result[0]) >= 4:
+            longitude = result[0][0] % 360  # Долгота в градусах, 0-360
+            speed = result[0][3]            # Скорость (отрицательная = ретроградность)
+            sign_num = int(longitude / 30) % 12
+
+            is_retrograde = speed < 0
+            if is_retrograde:
+                retrograde_planets.append(planet_name)
+
+            planets_data[planet_name] = {
+                'longitude': longitude,
+                'latitude': result[0][1],
+                'distance': result[0][2],
+                'speed': speed,
+                'sign': SIGNS[sign_num],
+                'sign_degrees': longitude % 30,
+                'is_retrograde': is_retrograde,
+            }
+            logger.debug(f"{planet_name}: {SIGNS[sign_num]} {longitude % 30:.2f}° (долгота: {longitude:.2f}°), ретроградность: {is_retrograde}")
+        else:
+            logger.error(f"Ошибка расчета для планеты {planet_name}: некорректные данные в result = {result}")
+
+    # Расчет Лунных узлов
+    node_result = ephemeris_table.calc_ut(jd, swe.TRUE_NODE, swe.FLG_SWIEPH, precise)
+    if len(node_result) >= 2 and node_result[0] is not None and len(node_result[0]) >= 1:
+        north_node_longitude = node_result[0][0] % 360
+    else:
+        logger.error(f"Ошибка расчета лунных узлов: некорректные данные в result = {node_result}")
+        north_node_longitude = 0
+
+    return {
+        'planets': planets_data,
+        'retrograde_planets': retrograde_planets,
+        'north_node': north_node_longitude,
+    }
+
+
+class Chart:
+    """
+    Карта на момент jd (UT) в точке lat/lon. Положения тел считаются один раз при
+    создании; дома разных систем, chart_data, транзиты, синастрия и соляр
+    строятся из них без повторного расчёта эфемерид.
+
+        chart = Chart(jd, lat, lon)
+        natal = chart.chart_data('P')
+        koch = chart.chart_data('K')
+        grid = synastry(chart, partner_chart)
+    """
+
+    def __init__(self, jd: float, lat: float, lon: float, precise: bool = False):
+        self.jd = jd
+        self.lat = lat
+        self.lon = lon
+        self.precise = precise
+        bodies = body_positions(jd, precise)
+        self.planets = bodies['planets']
+        self.retrograde_planets = bodies['retrograde_planets']
+        self.north_node = bodies['north_node']
+        self._ascmc = None  # (ASC, MC) - не зависят от системы домов
+        self._houses = {}   # система -> (куспиды [0, 1..12], ASC, MC)
+
+    def _angles(self) -> tuple:
+        if self._ascmc is None:
+            # Равнодомная система считается на любой широте (Placidus и Koch - не за полярным кругом)
+            ascmc = swe.houses(self.jd, self.lat, self.lon, b'E')[1]
+            self._ascmc = (ascmc[0] % 360, ascmc[1] % 360)
+        return self._ascmc
+
+    def houses(self, system: str = 'P') -> tuple:
+        """
+        Куспиды домов (список из 13 элементов, индекс 0 не используется), ASC и MC.
+        P и K - Swiss Ephemeris (ошибка за полярным кругом), W и E - от асцендента.
+        """
+        if system in self._houses:
+            return self._houses[system]
+        if system not in HOUSE_SYSTEMS:
+            raise ValueError(f"Неизвестная система домов: {system}")
+
+        if system in ('P', 'K'):
+            houses_result = swe.houses(self.jd, self.lat, self.lon, system.encode())
+            # result[0] - куспиды домов 1-12, result[1] - ASC/MC и другие точки
+            if len(houses_result) >= 2 and houses_result[0] is not None and houses_result[1] is not None:
+                houses_cusps_tuple = houses_result[0]
+                ascmc = houses_result[1]
+                houses_cusps = [0] * 13  # Индекс 0 не используется
+                for i in range(min(12, len(houses_cusps_tuple))):
+                    houses_cusps[i+1] = houses_cusps_tuple[i] % 360
+                houses_asc = ascmc[0] % 360 if len(ascmc) > 0 else 0
+                houses_mc = ascmc[1] % 360 if len(ascmc) > 1 else 0
+                if self._ascmc is None:
+                    self._ascmc = (houses_asc, houses_mc)
+            else:
+                logger.error(f"Ошибка расчета домов: некорректные данные в result = {houses_result}")
+                houses_cusps = [0] * 13
+                houses_asc = 0
+                houses_mc = 0
+        else:
+            houses_asc, houses_mc = self._angles()
+            # Равные дома - по 30° от асцендента, целые знаки - от начала знака асцендента
+            first = houses_asc if system == 'E' else int(houses_asc / 30) * 30.0
+            houses_cusps = [0] + [(first + 30 * i) % 360 for i in range(12)]
+
+        logger.debug(f"Дома ({HOUSE_SYSTEMS[system]}) рассчитаны: ASC={houses_asc:.2f}°, MC={houses_mc:.2f}°")
+        self._houses[system] = (houses_cusps, houses_asc, houses_mc)
+        return self._houses[system]
+
+    def points(self) -> tuple:
+        """Имена и долготы точек карты для транзитов и синастрии: планеты, Северный узел, ASC, MC"""
+        asc, mc = self._angles()
+        names = list(self.planets) + ['NorthNode', 'Ascendant', 'MC']
+        longitudes = [planet['longitude'] for planet in self.planets.values()] + [self.north_node, asc, mc]
+        return names, longitudes
+
+    def chart_data(self, system: str = 'P') -> dict:
+        """chart_data в формате calculate_natal_chart для выбранной системы домов"""
+        houses_cusps, houses_asc, houses_mc = self.houses(system)
+        houses_ic = (houses_mc + 180) % 360
+        north_node_longitude = self.north_node
+        south_node_longitude = (north_node_longitude + 180) % 360
+        planets_data = copy.deepcopy(self.planets)
+
+        houses_data = {f'House{i}': _point(houses_cusps[i], int(houses_cusps[i] / 30)) for i in range(1, 13)}
+
+        # Аспекты между планетами (и, по настройке, узлом/ASC/MC) одной матрицей углов
+        aspect_names, aspect_longitudes = chart_engine.chart_points(
+            planets_data, list(PLANETS), north_node_longitude, houses_asc, houses_mc
+        )
+        aspects_data = chart_engine.find_aspects(aspect_names, aspect_longitudes)
+
+        # Планеты в домах: Cusp_n ≤ Planet < Cusp_(n+1) → планета в доме N
+        planet_names = list(planets_data)
+        planets_in_houses = chart_engine.assign_houses(
+            planet_names,
+            [planets_data[name]['longitude'] for name in planet_names],
+            houses_cusps[1:13],
+        )
+
+        return {
+            'planets': planets_data,
+            'houses': houses_data,
+            'ascendant': _point(houses_asc, int(houses_asc / 30)),
+            'mc': _point(houses_mc, int(houses_mc / 30)),
+            'ic': _point(houses_ic, int(houses_ic / 30)),
+            'north_node': _point(north_node_longitude, int(north_node_longitude / 30) % 12),
+            'south_node': _point(south_node_longitude, int(south_node_longitude / 30)),
+            'retrograde_planets': list(self.retrograde_planets),
+            'aspects': aspects_data,
+            'planets_in_houses': planets_in_houses,
+        }
+
+
+def compute_chart(jd: float, lat: float, lon: float, precise: bool = False, house_system: str = 'P') -> dict:
+    """
+    Планеты, узлы, дома, аспекты и планеты в домах для юлианской даты jd (UT).
+    Возвращает chart_data в формате calculate_natal_chart.
+
+    Положения тел берутся из предрасчитанной таблицы (ephemeris_table), если она
+    есть и покрывает дату; precise=True - всегда напрямую из Swiss Ephemeris.
+    """
+    return Chart(jd, lat, lon, precise).chart_data(house_system)
+
+
+# ===== ТРАНЗИТЫ, СИНАСТРИЯ, СОЛЯР =====
+
+TRANSIT_BODIES = list(PLANETS) + ['NorthNode']
+_TRANSIT_BODY_IDS = list(PLANETS.values()) + [swe.TRUE_NODE]
+
+
+@functools.lru_cache(maxsize=4096)
+def transit_longitudes(jd: float) -> tuple:
+    """Долготы TRANSIT_BODIES на момент jd; общие для всех карт в процессе"""
+    return tuple(
+        ephemeris_table.calc_ut(jd, body_id, swe.FLG_SWIEPH)[0][0] % 360
+        for body_id in _TRANSIT_BODY_IDS
+    )
+
+
+def transits(chart: Chart, start_jd: float, end_jd: float, step: float = 1.0, aspects: list = None) -> list:
+    """
+    Транзитные аспекты к точкам карты на сетке дат start_jd..end_jd с шагом step (сутки).
+    Список словарей {'jd', 'transit', 'natal', 'aspect', 'angle', 'orb'} по возрастанию jd.
+    """
+    aspects = chart_engine.TRANSIT_ASPECTS if aspects is None else aspects
+    natal_names, natal_longitudes = chart.points()
+    grid = [start_jd + k * step for k in range(int((end_jd - start_jd) / step) + 1)]
+    result = []
+    for jd in grid:
+        for aspect in chart_engine.find_cross_aspects(
+            TRANSIT_BODIES, transit_longitudes(jd), natal_names, natal_longitudes, aspects
+        ):
+            result.append({
+                'jd': jd,
+                'transit': aspect['planet1'],
+                'natal': aspect['planet2'],
+                'aspect': aspect['aspect'],
+                'angle': aspect['angle'],
+                'orb': aspect['orb'],
+            })
+    return result
+
+
+def synastry(chart_a: Chart, chart_b: Chart, aspects: list = None) -> list:
+    """Сетка аспектов между точками двух карт: planet1 - из chart_a, planet2 - из chart_b"""
+    names_a, longitudes_a = chart_a.points()
+    names_b, longitudes_b = chart_b.points()
+    return chart_engine.find_cross_aspects(names_a, longitudes_a, names_b, longitudes_b, aspects)
+
+
+def solar_return_jd(chart: Chart, year: int) -> float:
+    """Момент (jd UT) возвращения Солнца в натальную долготу в указанном году"""
+    natal_sun = chart.planets['Sun']['longitude']
+    # Дата рождения в году соляра: от неё Солнце уходит не больше чем на 2 суток
+    y, m, d, _ = swe.revjul(chart.jd, swe.GREG_CAL)
+    jd = swe.julday(year, m, min(d, 28), 12.0, swe.GREG_CAL)
+    for _ in range(10):
+        position = swe.calc_ut(jd, swe.SUN, swe.FLG_SWIEPH | swe.FLG_SPEED)[0]
+        delta = (natal_sun - position[0] + 180.0) % 360.0 - 180.0
+        jd += delta / position[3]
+        if abs(delta) < 1e-7:
+            break
+    return jd
+
+
+def solar_return(chart: Chart, year: int, lat: float = None, lon: float = None) -> Chart:
+    """Карта соляра: по умолчанию в месте рождения, lat/lon - место, где человек встречает день рождения"""
+    return Chart(
+        solar_return_jd(chart, year),
+        chart.lat if lat is None else lat,
+        chart.lon if lon is None else lon,
+        chart.precise,
+    )
+
+
+def compute_charts(jobs: list) -> list:
+    """
+    Несколько карт за один вызов: jobs - список (jd, lat, lon). Для пула процессов.
+    Карта, которую не удалось рассчитать (например, Placidus за полярным кругом), - None.
+    """
+    charts = []
+    for jd, lat, lon in jobs:
+        try:
+            charts.append(compute_chart(jd, lat, lon))
+        except Exception as e:
+            logger.warning(f"⚠️ Карта не рассчитана (jd={jd}, широта={lat}, долгота={lon}): {e}")
+            charts.append(None)
+    return charts
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Предрасчитанные эфемериды: положения и скорости планет и истинного узла по дням.
+
+Почти все пользователи родились в 1940-2015 годах, транзиты (transit_calendar.py)
+считаются на ближайшие годы, а для карты нужны десять планет и истинный узел. Таблица хранит для каждого дня (0h UT) и каждого тела
+долготу, широту, расстояние и их суточные скорости (как возвращает swe.calc_ut)
+в одном файле .npy, который открывается через memory map: процессы пула делят
+одни и те же страницы, в память читается только то, что нужно.
+
+Положение на момент рождения - кубическая интерполяция Эрмита между соседними
+днями по значениям и скоростям (погрешность меньше 1″, см. test_ephemeris_table.py).
+Все тела считаются одним векторным вызовом и запоминаются для последней даты,
+поэтому одиннадцать вызовов calc_ut для одной карты стоят как один.
+
+calc_ut(jd, body, flags) - замена swe.calc_ut с тем же результатом. К Swiss
+Ephemeris запрос уходит, если:
+    - таблицы нет, она выключена или дата вне её диапазона;
+    - тело или флаги не из таблицы (например, сидерический зодиак);
+    - нужна полная точность (precise=True);
+    - планета рядом со стоянием (скорость почти ноль) - чтобы не ошибиться с ретроградностью;
+    - планета в SUN_ELONGATION° от Солнца: отклонение света Солнцем меняется
+      быстрее, чем успевает суточная интерполяция.
+
+Сборка таблицы (по умолчанию 1940-2035, шаг 1 день, около 19 МБ):
+    python ephemeris_table.py build
+    python ephemeris_table.py build 1900 2030
+
+Настройки (переменные окружения):
+    EPHEMERIS_TABLE       - использовать таблицу, если файл есть: 1 (по умолчанию) или 0
+    EPHEMERIS_TABLE_PATH  - путь к таблице (по умолчанию data/ephemeris_table.npy,
+                            рядом - описание диапазона ephemeris_table.json)
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+from typing import Optional
+
+import numpy as np
+import swisseph as swe
+
+logger = logging.getLogger(__name__)
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+EPHEMERIS_TABLE = os.getenv('EPHEMERIS_TABLE', '1') == '1'
+EPHEMERIS_TABLE_PATH = os.getenv('EPHEMERIS_TABLE_PATH', os.path.join(_DATA_DIR, 'ephemeris_table.npy'))
+
+# Тела таблицы: планеты и истинный узел
+BODIES = [swe.SUN, swe.MOON, swe.MERCURY, swe.VENUS, swe.MARS,
+          swe.JUPITER, swe.SATURN, swe.URANUS, swe.NEPTUNE, swe.PLUTO, swe.TRUE_NODE]
+# Таблица строится с этими флагами; запросы с другими флагами (кроме FLG_SPEED) идут в swe
+TABLE_FLAGS = swe.FLG_SWIEPH | swe.FLG_SPEED
+# Скорость по долготе (°/сутки), ниже которой планета считается у стояния
+STATION_SPEED = 0.001
+# Ближе к Солнцу (°) отклонение света Солнцем меняется за часы и суточная интерполяция неточна
+SUN_ELONGATION = 1.5
+
+
+def _meta_path(path: str) -> str:
+    return os.path.splitext(path)[0] + '.json'
+
+
+class EphemerisTable:
+    """Таблица положений: массив (дни, тела, 6) в memory map и интерполяция Эрмита"""
+
+    def __init__(self, data: np.ndarray, start_jd: float, step: float, bodies: list):
+        self.data = data
+        self.start_jd = start_jd
+        self.step = step
+        self.end_jd = start_jd + step * (len(data) - 1)
+        self._index = {body: i for i, body in enumerate(bodies)}
+        self._last = (None, None, None)  # (jd, положения, признаки точного расчёта) последнего запроса
+
+    @classmethod
+    def load(cls, path: str) -> 'EphemerisTable':
+        with open(_meta_path(path), encoding='utf-8') as f:
+            meta = json.load(f)
+        data = np.load(path, mmap_mode='r')
+        return cls(data, meta['start_jd'], meta['step'], meta['bodies'])
+
+    def covers(self, jd: float) -> bool:
+        return self.start_jd <= jd < self.end_jd
+
+    def has_body(self, body: int) -> bool:
+        return body in self._index
+
+    def positions(self, jd: float) -> np.ndarray:
+        """Все тела на момент jd: массив (тела, 6) как result[0] у swe.calc_ut"""
+        x = (jd - self.start_jd) / self.step
+        i = int(x)
+        t = x - i
+        p0 = np.array(self.data[i, :, :3])
+        p1 = np.array(self.data[i + 1, :, :3])
+        m0 = self.data[i, :, 3:] * self.step
+        m1 = self.data[i + 1, :, 3:] * self.step
+        # Долгота через 360° -> 0°: продолжаем её за 360, чтобы интерполировать без скачка
+        p1[:, 0] = p0[:, 0] + (p1[:, 0] - p0[:, 0] + 180.0) % 360.0 - 180.0
+
+        t2 = t * t
+        t3 = t2 * t
+        value = ((2 * t3 - 3 * t2 + 1) * p0 + (t3 - 2 * t2 + t) * m0
+                 + (3 * t2 - 2 * t3) * p1 + (t3 - t2) * m1)
+        speed = ((6 * t2 - 6 * t) * p0 + (3 * t2 - 4 * t + 1) * m0
+                 + (6 * t - 6 * t2) * p1 + (3 * t2 - 2 * t) * m1) / self.step
+        value[:, 0] %= 360.0
+        return np.concatenate([value, speed], axis=1)
+
+    def _lookup(self, jd: float):
+        """Положения (кортежи) и признаки "нужен swe" для всех тел; запоминается для последней jd"""
+        last = self._last
+        if last[0] == jd:
+            return last[1], last[2]
+
+        positions = self.positions(jd)
+        # Интерполяция может ошибиться у стояния и рядом с Солнцем (кроме узла и самого Солнца)
+        precise = np.abs(positions[:, 3]) < STATION_SPEED
+        sun = self._index.get(swe.SUN)
+        if sun is not None:
+            elongation = np.abs((positions[:, 0] - positions[sun, 0] + 180.0) % 360.0 - 180.0)
+            near_sun = elongation < SUN_ELONGATION
+            near_sun[sun] = False
+            precise |= near_sun
+        node = self._index.get(swe.TRUE_NODE)
+        if node is not None:
+            precise[node] = False
+
+        rows = [tuple(row) for row in positions.tolist()]
+        flags = precise.tolist()
+        self._last = (jd, rows, flags)
+        return rows, flags
+
+    def calc(self, jd: float, body: int) -> tuple:
+        return self._lookup(jd)[0][self._index[body]]
+
+    def needs_precise(self, jd: float, body: int) -> bool:
+        """Интерполяция может ошибиться: планета у стояния или рядом с Солнцем"""
+        return self._lookup(jd)[1][self._index[body]]
+
+
+# ===== ОБЩИЙ ЭКЗЕМПЛЯР =====
+
+_table = None
+_load_lock = threading.Lock()
+_load_failed = False
+
+
+def get_table() -> Optional[EphemerisTable]:
+    """Таблица, открытая при первом обращении (None, если выключена или файла нет)"""
+    global _table, _load_failed
+    if _table is not None or _load_failed or not EPHEMERIS_TABLE:
+        return _table
+    with _load_lock:
+        if _table is None and not _load_failed:
+            if not os.path.exists(EPHEMERIS_TABLE_PATH):
+                _load_failed = True
+                logger.info(f"Таблица эфемерид {EPHEMERIS_TABLE_PATH} не найдена - используется Swiss Ephemeris")
+                return None
+            try:
+                _table = EphemerisTable.load(EPHEMERIS_TABLE_PATH)
+                logger.info(
+                    f"✅ Таблица эфемерид открыта: {len(_table.data)} дней, "
+                    f"JD {_table.start_jd:.1f}-{_table.end_jd:.1f}"
+                )
+            except Exception as e:
+                _load_failed = True
+                logger.error(f"❌ Не удалось открыть таблицу эфемерид {EPHEMERIS_TABLE_PATH}: {e}", exc_info=True)
+    return _table
+
+
+def calc_ut(jd: float, body: int, flags: int = TABLE_FLAGS, precise: bool = False):
+    """
+    Как swe.calc_ut: ((долгота, широта, расстояние, скорости...), флаги).
+    Из таблицы, если это возможно, иначе - Swiss Ephemeris.
+    """
+    table = None if precise else get_table()
+    if (table is not None and table.has_body(body) and table.covers(jd)
+            and flags | swe.FLG_SPEED == TABLE_FLAGS):
+        rows, needs_precise = table._lookup(jd)
+        i = table._index[body]
+        if not needs_precise[i]:
+            position = rows[i]
+            if not flags & swe.FLG_SPEED:
+                position = position[:3] + (0.0, 0.0, 0.0)
+            return position, flags
+    return swe.calc_ut(jd, body, flags)
+
+
+# ===== СБОРКА =====
+
+def build_table(path: str = EPHEMERIS_TABLE_PATH, start_year: int = 1940, end_year: int = 2035,
+                step: float = 1.0) -> int:
+    """Считает таблицу через swe.calc_ut с 1 января start_year по 1 января end_year + 1"""
+    start_jd = swe.julday(start_year, 1, 1, 0.0, swe.GREG_CAL)
+    end_jd = swe.julday(end_year + 1, 1, 1, 0.0, swe.GREG_CAL)
+    days = int(round((end_jd - start_jd) / step)) + 1
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    data = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=(days, len(BODIES), 6))
+    for i in range(days):
+        jd = start_jd + i * step
+        for j, body in enumerate(BODIES):
+            data[i, j] = swe.calc_ut(jd, body, TABLE_FLAGS)[0][:6]
+    data.flush()
+    del data
+
+    with open(_meta_path(path), 'w', encoding='utf-8') as f:
+        json.dump({
+            'start_jd': start_jd,
+            'step': step,
+            'bodies': BODIES,
+            'flags': TABLE_FLAGS,
+            'years': [start_year, end_year],
+            'swe_version': swe.version,
+        }, f, indent=2)
+    return days
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    if len(sys.argv) in (2, 4) and sys.argv[1] == 'build':
+        years = (int(sys.argv[2]), int(sys.argv[3])) if len(sys.argv) == 4 else (1940, 2035)
+        days = build_table(EPHEMERIS_TABLE_PATH, *years)
+        print(f"✅ Таблица эфемерид: {days} дней ({years[0]}-{years[1]}) -> {EPHEMERIS_TABLE_PATH}")
+    else:
+        print("Использование:")
+        print("  python ephemeris_table.py build [start_year end_year]")
+        sys.exit(1)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Буфер событий аналитики с пакетной записью в БД.
+
+log_event() больше не открывает соединение и не делает INSERT + COMMIT на каждый
+вызов: событие кладётся в ограниченный буфер в памяти, а фоновый поток пишет
+накопившиеся события одним пакетом - когда набралось EVENT_BATCH_SIZE событий
+или прошло EVENT_FLUSH_INTERVAL секунд.
+
+Буфер может терять события (переполнение, падение процесса), поэтому через него
+идут только события аналитики. События, по которым принимаются решения
+(repository.DURABLE_EVENT_TYPES, например payment_success), пишутся в БД сразу.
+
+Настройки (переменные окружения):
+    EVENT_BUFFER_MAX_SIZE   - максимум событий в памяти (по умолчанию 10000)
+    EVENT_BATCH_SIZE        - размер пакета записи (по умолчанию 200)
+    EVENT_FLUSH_INTERVAL    - максимальная задержка записи, секунды (по умолчанию 1.0)
+    EVENT_BUFFER_OVERFLOW   - что делать при переполнении: drop_oldest (по умолчанию)
+                              или drop_newest
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+EVENT_BUFFER_MAX_SIZE = int(os.getenv('EVENT_BUFFER_MAX_SIZE', '10000'))
+EVENT_BATCH_SIZE = int(os.getenv('EVENT_BATCH_SIZE', '200'))
+EVENT_FLUSH_INTERVAL = float(os.getenv('EVENT_FLUSH_INTERVAL', '1.0'))
+EVENT_BUFFER_OVERFLOW = os.getenv('EVENT_BUFFER_OVERFLOW', 'drop_oldest')
+
+
+class EventBuffer:
+    """
+    Потокобезопасный буфер строк для таблицы events.
+
+    writer(rows) получает список кортежей (user_id, event_type, event_data, timestamp)
+    и записывает их одной транзакцией. Если запись не удалась, пакет возвращается
+    в начало буфера и будет записан при следующей попытке.
+    """
+
+    def __init__(self, writer, max_size: int = EVENT_BUFFER_MAX_SIZE,
+                 batch_size: int = EVENT_BATCH_SIZE, flush_interval: float = EVENT_FLUSH_INTERVAL,
+                 overflow: str = EVENT_BUFFER_OVERFLOW):
+        self._writer = writer
+        self.max_size = max(1, max_size)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.overflow = overflow if overflow in ('drop_oldest', 'drop_newest') else 'drop_oldest'
+
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # одна запись в БД за раз
+        self._thread = None
+        self._stopping = False
+
+        # Метрики
+        self._enqueued = 0
+        self._flushed = 0
+        self._dropped = 0
+        self._batches = 0
+        self._flush_failures = 0
+        self._last_flush_seconds = 0.0
+
+    def _ensure_started(self):
+        """Ленивый запуск фонового потока записи (под self._cond)"""
+        if self._thread is None and not self._stopping:
+            self._thread = threading.Thread(target=self._run, name='event-buffer-flusher', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def put(self, row: tuple) -> bool:
+        """Кладёт событие в буфер без ожидания. Возвращает False, если событие отброшено."""
+        with self._cond:
+            self._ensure_started()
+            if len(self._items) >= self.max_size:
+                self._dropped += 1
+                if self.overflow == 'drop_newest':
+                    if self._dropped == 1 or self._dropped % 1000 == 0:
+                        logger.warning(f"⚠️ Буфер событий переполнен, событие отброшено (всего отброшено: {self._dropped})")
+                    return False
+                self._items.popleft()
+                if self._dropped == 1 or self._dropped % 1000 == 0:
+                    logger.warning(f"⚠️ Буфер событий переполнен, отброшено самое старое событие (всего отброшено: {self._dropped})")
+            self._items.append(row)
+            self._enqueued += 1
+            if len(self._items) >= self.batch_size:
+                self._cond.notify()
+            stopping = self._stopping
+        if stopping:
+            # Фоновый поток уже остановлен - пишем сразу
+            self.flush()
+        return True
+
+    def _take_batch(self) -> list:
+        with self._cond:
+            count = min(self.batch_size, len(self._items))
+            return [self._items.popleft() for _ in range(count)]
+
+    def _return_batch(self, batch: list):
+        """Возвращает неудавшийся пакет в начало буфера (сколько поместится)"""
+        with self._cond:
+            room = self.max_size - len(self._items)
+            keep = batch[:room] if room > 0 else []
+            self._dropped += len(batch) - len(keep)
+            self._items.extendleft(reversed(keep))
+
+    def _flush_once(self) -> bool:
+        """Записывает один пакет. Возвращает False при ошибке записи."""
+        batch = self._take_batch()
+        if not batch:
+            return True
+        started = time.monotonic()
+        try:
+            self._writer(batch)
+        except Exception as e:
+            with self._cond:
+                self._flush_failures += 1
+            logger.error(f"❌ Не удалось записать пакет из {len(batch)} событий: {e}", exc_info=True)
+            self._return_batch(batch)
+            return False
+        with self._cond:
+            self._flushed += len(batch)
+            self._batches += 1
+            self._last_flush_seconds = time.monotonic() - started
+        logger.debug(f"📊 Записано событий: {len(batch)}")
+        return True
+
+    def flush(self) -> bool:
+        """Синхронно записывает всё, что накопилось в буфере"""
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    if not self._items:
+                        return True
+                if not self._flush_once():
+                    return False
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopping and len(self._items) < self.batch_size:
+                    self._cond.wait(timeout=self.flush_interval)
+                stopping = self._stopping
+            if not self.flush() and not stopping:
+                # БД недоступна - не крутимся в цикле, ждём до следующей попытки
+                time.sleep(self.flush_interval)
+            if stopping:
+                return
+
+    def stop(self, timeout: float = 10.0):
+        """Останавливает фоновый поток и дописывает оставшиеся события"""
+        with self._cond:
+            already_stopped = self._stopping
+            self._stopping = True
+            thread = self._thread
+            self._cond.notify_all()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=timeout)
+        self.flush()
+        if already_stopped:
+            return
+        with self._cond:
+            remaining = len(self._items)
+        if remaining:
+            logger.warning(f"⚠️ При остановке не записано событий: {remaining}")
+        else:
+            logger.info(f"✅ Буфер событий сброшен в БД (всего записано: {self._flushed}, отброшено: {self._dropped})")
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'buffered': len(self._items),
+                'max_size': self.max_size,
+                'enqueued': self._enqueued,
+                'flushed': self._flushed,
+                'dropped': self._dropped,
+                'batches': self._batches,
+                'flush_failures': self._flush_failures,
+                'last_flush_seconds': round(self._last_flush_seconds, 4),
+            }
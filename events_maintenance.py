@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Обслуживание таблицы events: месячные партиции, дневные агрегаты и срок хранения.
+
+PostgreSQL: events секционирована по месяцам (events_YYYY_MM, см. миграцию 0004),
+партиции создаются заранее на EVENTS_PARTITIONS_AHEAD месяцев вперёд. Старые
+события удаляются целыми партициями (DROP TABLE), без DELETE по всей таблице.
+SQLite (локальная разработка): старые события удаляются DELETE по индексу timestamp.
+
+Агрегаты для отчётов (скрипты воронки читают их, а не сырые события):
+    event_daily_rollups(day, event_type, events_count, unique_users, amount_total)
+    event_daily_users(day, event_type, user_id) - для точного числа уникальных
+                                                  пользователей за период из нескольких дней
+День считается по московскому времени, как и в отчётах.
+
+Перед удалением старых событий агрегаты за эти дни досчитываются, поэтому
+отчёты за удалённые периоды продолжают работать.
+
+Настройки (переменные окружения):
+    EVENTS_RETENTION_DAYS        - сколько дней хранить сырые события (по умолчанию 0 - хранить всё)
+    EVENTS_PARTITIONS_AHEAD      - на сколько месяцев вперёд создавать партиции (по умолчанию 2)
+    EVENTS_MAINTENANCE_INTERVAL  - период обслуживания в боте, секунды (по умолчанию 3600, 0 - выключено)
+
+Запуск вручную:
+    python events_maintenance.py              # партиции + агрегаты за 2 дня + срок хранения
+    python events_maintenance.py --backfill   # пересчитать агрегаты за всю историю
+"""
+
+import logging
+import os
+import sys
+from datetime import date, datetime, time, timedelta
+
+import pytz
+
+from db_pool import db_connection
+
+logger = logging.getLogger(__name__)
+
+EVENTS_RETENTION_DAYS = int(os.getenv('EVENTS_RETENTION_DAYS', '0'))
+EVENTS_PARTITIONS_AHEAD = int(os.getenv('EVENTS_PARTITIONS_AHEAD', '2'))
+EVENTS_MAINTENANCE_INTERVAL = float(os.getenv('EVENTS_MAINTENANCE_INTERVAL', '3600'))
+
+# Часовой пояс, по которому считаются дни в отчётах
+REPORT_TIMEZONE = pytz.timezone('Europe/Moscow')
+
+# Ключ advisory-блокировки: несколько реплик не пересчитывают агрегаты одновременно
+MAINTENANCE_LOCK_ID = 74291502
+
+
+# ===== ДНИ И ГРАНИЦЫ =====
+
+def report_today() -> date:
+    """Текущий день по московскому времени"""
+    return datetime.now(REPORT_TIMEZONE).date()
+
+
+def day_bounds(day: date, db_type: str):
+    """
+    Границы московских суток [start, end) в формате колонки events.timestamp:
+    timestamptz для PostgreSQL, ISO-строка UTC без часового пояса для SQLite.
+    """
+    start = REPORT_TIMEZONE.localize(datetime.combine(day, time.min))
+    end = REPORT_TIMEZONE.localize(datetime.combine(day + timedelta(days=1), time.min))
+    if db_type == 'postgresql':
+        return start, end
+    return (start.astimezone(pytz.UTC).replace(tzinfo=None).isoformat(),
+            end.astimezone(pytz.UTC).replace(tzinfo=None).isoformat())
+
+
+def _day_param(day: date, db_type: str):
+    """Значение колонки day: DATE в PostgreSQL, строка 'YYYY-MM-DD' в SQLite"""
+    return day if db_type == 'postgresql' else day.isoformat()
+
+
+def _days(start_day: date, end_day: date) -> list:
+    return [start_day + timedelta(days=i) for i in range((end_day - start_day).days + 1)]
+
+
+def _parse_day(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+# ===== АГРЕГАТЫ =====
+
+def refresh_rollups_for_day(cursor, db_type: str, day: date):
+    """Пересчитывает агрегаты за один день (вызывающий делает commit)"""
+    ph = '%s' if db_type == 'postgresql' else '?'
+    start, end = day_bounds(day, db_type)
+    day_value = _day_param(day, db_type)
+    if db_type == 'postgresql':
+        amount_expr = "(event_data::json->>'total_amount')::numeric"
+    else:
+        amount_expr = "CAST(json_extract(event_data, '$.total_amount') AS REAL)"
+
+    cursor.execute(f'DELETE FROM event_daily_rollups WHERE day = {ph}', (day_value,))
+    cursor.execute(f'DELETE FROM event_daily_users WHERE day = {ph}', (day_value,))
+    cursor.execute(f'''
+        INSERT INTO event_daily_rollups (day, event_type, events_count, unique_users, amount_total)
+        SELECT {ph}, event_type, COUNT(*), COUNT(DISTINCT user_id),
+               COALESCE(SUM(CASE WHEN event_type = 'payment_success' AND event_data IS NOT NULL
+                                 THEN {amount_expr} END), 0)
+        FROM events
+        WHERE timestamp >= {ph} AND timestamp < {ph}
+        GROUP BY event_type
+    ''', (day_value, start, end))
+    cursor.execute(f'''
+        INSERT INTO event_daily_users (day, event_type, user_id)
+        SELECT DISTINCT {ph}, event_type, user_id
+        FROM events
+        WHERE timestamp >= {ph} AND timestamp < {ph} AND user_id IS NOT NULL
+    ''', (day_value, start, end))
+
+
+def refresh_event_rollups(days: int = 2, start_day: date = None, end_day: date = None) -> int:
+    """
+    Пересчитывает агрегаты за последние days дней (или за [start_day, end_day]).
+    Каждый день - отдельная транзакция. Возвращает число пересчитанных дней.
+    """
+    end_day = end_day or report_today()
+    start_day = start_day or end_day - timedelta(days=max(1, days) - 1)
+    refreshed = 0
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        for day in _days(start_day, end_day):
+            try:
+                if db_type == 'postgresql':
+                    cursor.execute('SELECT pg_advisory_xact_lock(%s)', (MAINTENANCE_LOCK_ID,))
+                refresh_rollups_for_day(cursor, db_type, day)
+                conn.commit()
+                refreshed += 1
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"❌ Ошибка пересчёта агрегатов событий за {day}: {e}", exc_info=True)
+                raise
+    return refreshed
+
+
+def backfill_event_rollups() -> int:
+    """Пересчитывает агрегаты за всю историю событий"""
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        cursor.execute('SELECT MIN(timestamp) FROM events')
+        row = cursor.fetchone()
+    if not row or not row[0]:
+        return 0
+    first = row[0]
+    if isinstance(first, datetime) and first.tzinfo is not None:
+        first_day = first.astimezone(REPORT_TIMEZONE).date()
+    else:
+        first_day = _parse_day(first)
+    return refresh_event_rollups(start_day=first_day, end_day=report_today())
+
+
+# ===== ПАРТИЦИИ (POSTGRESQL) =====
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _next_month(month: date) -> date:
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def create_month_partition(cursor, month: date):
+    """Создаёт партицию events_YYYY_MM для месяца (границы по UTC)"""
+    name = f'events_{month.year:04d}_{month.month:02d}'
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {name} PARTITION OF events
+        FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{_next_month(month).isoformat()} 00:00:00+00')
+    ''')
+    return name
+
+
+def ensure_event_partitions(months_ahead: int = EVENTS_PARTITIONS_AHEAD) -> list:
+    """Создаёт недостающие партиции на текущий и months_ahead следующих месяцев"""
+    created = []
+    with db_connection() as (conn, db_type):
+        if db_type != 'postgresql':
+            return created
+        cursor = conn.cursor()
+        month = _month_start(datetime.now(pytz.UTC).date())
+        for _ in range(months_ahead + 1):
+            try:
+                created.append(create_month_partition(cursor, month))
+                conn.commit()
+            except Exception as e:
+                # Например, в events_default уже есть строки за этот месяц
+                conn.rollback()
+                logger.error(f"❌ Не удалось создать партицию events за {month:%Y-%m}: {e}", exc_info=True)
+            month = _next_month(month)
+    return created
+
+
+def _list_month_partitions(cursor) -> list:
+    """[(name, month)] для партиций events_YYYY_MM"""
+    cursor.execute('''
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'events'
+    ''')
+    partitions = []
+    for (name,) in cursor.fetchall():
+        parts = name.split('_')
+        if len(parts) == 3 and parts[1].isdigit() and parts[2].isdigit():
+            partitions.append((name, date(int(parts[1]), int(parts[2]), 1)))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+# ===== СРОК ХРАНЕНИЯ =====
+
+def _rollup_days_before(cutoff_day: date):
+    """Досчитывает агрегаты за дни до cutoff_day, за которые их ещё нет"""
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        ph = '%s' if db_type == 'postgresql' else '?'
+        cursor.execute('SELECT MIN(timestamp) FROM events')
+        row = cursor.fetchone()
+        if not row or not row[0]:
+            return
+        first = row[0]
+        first_day = first.astimezone(REPORT_TIMEZONE).date() if isinstance(first, datetime) and first.tzinfo else _parse_day(first)
+        cursor.execute(f'SELECT DISTINCT day FROM event_daily_rollups WHERE day >= {ph} AND day < {ph}',
+                       (_day_param(first_day, db_type), _day_param(cutoff_day, db_type)))
+        done = {_parse_day(r[0]) for r in cursor.fetchall()}
+    missing = [day for day in _days(first_day, cutoff_day - timedelta(days=1)) if day not in done]
+    for day in missing:
+        refresh_event_rollups(start_day=day, end_day=day)
+
+
+def apply_events_retention(retention_days: int = EVENTS_RETENTION_DAYS) -> int:
+    """
+    Удаляет сырые события старше retention_days дней (агрегаты сохраняются).
+    PostgreSQL: удаляются только целые месячные партиции, полностью старше срока.
+    Возвращает число удалённых партиций (PostgreSQL) или строк (SQLite).
+    """
+    if retention_days <= 0:
+        return 0
+    cutoff_day = report_today() - timedelta(days=retention_days)
+    _rollup_days_before(cutoff_day)
+
+    removed = 0
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        if db_type == 'postgresql':
+            for name, month in _list_month_partitions(cursor):
+                if _next_month(month) > cutoff_day:
+                    break
+                cursor.execute(f'ALTER TABLE events DETACH PARTITION {name}')
+                cursor.execute(f'DROP TABLE {name}')
+                conn.commit()
+                removed += 1
+                logger.info(f"🗑 Удалена партиция {name} (срок хранения {retention_days} дней)")
+        else:
+            cutoff, _ = day_bounds(cutoff_day, db_type)
+            cursor.execute('DELETE FROM events WHERE timestamp < ?', (cutoff,))
+            removed = cursor.rowcount
+            conn.commit()
+            if removed:
+                logger.info(f"🗑 Удалено событий старше {cutoff_day}: {removed}")
+    return removed
+
+
+# ===== ЧТЕНИЕ АГРЕГАТОВ (ДЛЯ ОТЧЁТОВ) =====
+
+def _period_condition(db_type: str, day_from: date = None, day_to: date = None):
+    """Условие по колонке day и параметры; без дат - вся история"""
+    if not day_from:
+        return '', ()
+    ph = '%s' if db_type == 'postgresql' else '?'
+    day_to = day_to or day_from
+    return f'AND day >= {ph} AND day <= {ph}', (_day_param(day_from, db_type), _day_param(day_to, db_type))
+
+
+def rollup_unique_users(cursor, db_type: str, event_type: str = None, day_from: date = None, day_to: date = None) -> int:
+    """Уникальные пользователи с событием event_type (None - с любым событием) за период"""
+    ph = '%s' if db_type == 'postgresql' else '?'
+    condition, params = _period_condition(db_type, day_from, day_to)
+    if event_type:
+        condition = f'AND event_type = {ph} ' + condition
+        params = (event_type,) + params
+    cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM event_daily_users WHERE 1=1 {condition}', params)
+    return cursor.fetchone()[0] or 0
+
+
+def rollup_event_totals(cursor, db_type: str, event_type: str, day_from: date = None, day_to: date = None):
+    """(число событий, сумма total_amount) по event_type за период"""
+    ph = '%s' if db_type == 'postgresql' else '?'
+    condition, params = _period_condition(db_type, day_from, day_to)
+    cursor.execute(f'''
+        SELECT COALESCE(SUM(events_count), 0), COALESCE(SUM(amount_total), 0)
+        FROM event_daily_rollups
+        WHERE event_type = {ph} {condition}
+    ''', (event_type,) + params)
+    count, amount = cursor.fetchone()
+    return int(count), float(amount)
+
+
+def run_events_maintenance():
+    """Полный цикл обслуживания: партиции, агрегаты за сегодня и вчера, срок хранения"""
+    created = ensure_event_partitions()
+    refreshed = refresh_event_rollups(days=2)
+    removed = apply_events_retention()
+    logger.info(f"✅ Обслуживание events: партиций проверено {len(created)}, дней агрегатов {refreshed}, удалено {removed}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    from db_pool import close_pool
+    try:
+        if len(sys.argv) > 1 and sys.argv[1] == '--backfill':
+            ensure_event_partitions()
+            print(f"✅ Агрегаты пересчитаны, дней: {backfill_event_rollups()}")
+        elif len(sys.argv) == 1:
+            run_events_maintenance()
+        else:
+            print("Использование:")
+            print("  python events_maintenance.py")
+            print("  python events_maintenance.py --backfill")
+            sys.exit(1)
+    finally:
+        close_pool()
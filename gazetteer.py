@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Офлайн-справочник городов и определение таймзоны по координатам без сети.
+
+Прямое геокодирование места рождения и выбор таймзоны раньше требовали запросов
+к Nominatim (до 10 с каждый), а таймзона для стран с несколькими поясами
+угадывалась по долготе. Теперь на критическом пути используется справочник:
+
+    data/gazetteer.tsv      - города (формат GeoNames: имя, страна, координаты,
+                              таймзона, население, альтернативные имена)
+    data/timezones.geojson  - необязательно: полигоны таймзон
+                              (timezone-boundary-builder, см. build_gazetteer.py)
+
+При первом обращении справочник загружается в память: отсортированный массив
+ключей имён (кириллица транслитерируется, регистр и диакритика убираются) и
+сетка 1x1 градус для поиска по координатам. Поиск - бинарный по массиву и
+только точный (после нормализации имени): неточное совпадение среди ~250 городов
+справочника чаще находит другой реальный город ("Кировск" -> Киров), чем
+исправляет опечатку. Если справочник места не знает, bot.py использует кэш
+и сетевое геокодирование.
+
+Таймзона по координатам: точка в полигоне, если файл полигонов есть, иначе
+таймзона ближайшего города справочника той же страны не дальше
+GAZETTEER_TZ_MAX_KM (без кода страны ближайший город может оказаться за
+границей пояса или страны - тогда таймзона не определяется).
+
+Настройки (переменные окружения):
+    GAZETTEER_PATH          - путь к справочнику городов (по умолчанию data/gazetteer.tsv)
+    TIMEZONE_POLYGONS_PATH  - путь к полигонам таймзон (по умолчанию data/timezones.geojson)
+    GAZETTEER_TZ_MAX_KM     - максимальное расстояние до ближайшего города, км (по умолчанию 100)
+"""
+
+import bisect
+import json
+import logging
+import math
+import os
+import re
+import threading
+import unicodedata
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+GAZETTEER_PATH = os.getenv('GAZETTEER_PATH', os.path.join(_DATA_DIR, 'gazetteer.tsv'))
+TIMEZONE_POLYGONS_PATH = os.getenv('TIMEZONE_POLYGONS_PATH', os.path.join(_DATA_DIR, 'timezones.geojson'))
+GAZETTEER_TZ_MAX_KM = float(os.getenv('GAZETTEER_TZ_MAX_KM', '100'))
+
+_TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya',
+    # украинский, белорусский, казахский
+    'і': 'i', 'ї': 'i', 'є': 'e', 'ґ': 'g', 'ў': 'u', 'ә': 'a', 'ғ': 'g', 'қ': 'k',
+    'ң': 'n', 'ө': 'o', 'ұ': 'u', 'ү': 'u', 'һ': 'h',
+}
+
+# Слова перед названием: "г. Москва", "пос. Северный", "city of London"
+_PLACE_PREFIXES = {'г', 'гор', 'город', 'пгт', 'пос', 'поселок', 'посёлок', 'с', 'село', 'д', 'дер',
+                   'деревня', 'ст', 'станица', 'city', 'of'}
+
+# Названия стран в строке места -> код страны (ключи в форме name_key)
+COUNTRY_NAMES = {
+    'rossiya': 'RU', 'russia': 'RU', 'rf': 'RU', 'russian federation': 'RU', 'rossiyskaya federatsiya': 'RU',
+    'ukraina': 'UA', 'ukraine': 'UA', 'belarus': 'BY', 'belorussiya': 'BY', 'respublika belarus': 'BY',
+    'kazakhstan': 'KZ', 'uzbekistan': 'UZ', 'kyrgyzstan': 'KG', 'kirgiziya': 'KG', 'tadzhikistan': 'TJ',
+    'tajikistan': 'TJ', 'turkmenistan': 'TM', 'azerbaydzhan': 'AZ', 'azerbaijan': 'AZ', 'gruziya': 'GE',
+    'georgia': 'GE', 'armeniya': 'AM', 'armenia': 'AM', 'moldova': 'MD', 'moldaviya': 'MD',
+    'latviya': 'LV', 'latvia': 'LV', 'litva': 'LT', 'lithuania': 'LT', 'estoniya': 'EE', 'estonia': 'EE',
+    'sssr': None, 'ussr': None,
+    'germaniya': 'DE', 'germany': 'DE', 'frantsiya': 'FR', 'france': 'FR', 'italiya': 'IT', 'italy': 'IT',
+    'ispaniya': 'ES', 'spain': 'ES', 'velikobritaniya': 'GB', 'angliya': 'GB', 'uk': 'GB',
+    'united kingdom': 'GB', 'england': 'GB', 'ssha': 'US', 'usa': 'US', 'united states': 'US',
+    'kanada': 'CA', 'canada': 'CA', 'izrail': 'IL', 'israel': 'IL', 'turtsiya': 'TR', 'turkey': 'TR',
+    'polsha': 'PL', 'poland': 'PL', 'chekhiya': 'CZ', 'czech republic': 'CZ', 'czechia': 'CZ',
+    'kitay': 'CN', 'china': 'CN', 'yaponiya': 'JP', 'japan': 'JP',
+}
+
+_WORD_RE = re.compile(r'[^a-z0-9]+')
+_EARTH_RADIUS_KM = 6371.0
+
+
+def name_key(text: str) -> str:
+    """Ключ имени: нижний регистр, транслитерация кириллицы, без диакритики и знаков"""
+    text = (text or '').lower()
+    text = ''.join(_TRANSLIT.get(ch, ch) for ch in text)
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(_WORD_RE.sub(' ', text).split())
+
+
+def _strip_prefixes(part: str) -> str:
+    words = re.sub(r'[.]', ' ', part.lower()).split()
+    while len(words) > 1 and words[0] in _PLACE_PREFIXES:
+        words = words[1:]
+    return ' '.join(words)
+
+
+def _distance_km(lat1, lon1, lat2, lon2) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * _EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _point_in_ring(lat, lon, ring) -> bool:
+    """Алгоритм трассировки луча; ring - список [lon, lat]"""
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i][0], ring[i][1]
+        xj, yj = ring[j][0], ring[j][1]
+        if (yi > lat) != (yj > lat) and lon < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+class Gazetteer:
+    """Справочник городов с поиском по имени и по координатам"""
+
+    def __init__(self, cities: list):
+        # cities: словари name, country_code, latitude, longitude, timezone, population
+        self.cities = cities
+        pairs = set()
+        for idx, city in enumerate(cities):
+            for name in [city['name']] + city.get('alternate_names', []):
+                key = name_key(name)
+                if key:
+                    pairs.add((key, idx))
+        pairs = sorted(pairs)
+        self._keys = [key for key, _ in pairs]
+        self._ids = [idx for _, idx in pairs]
+
+        self._grid = {}
+        for idx, city in enumerate(cities):
+            cell = (math.floor(city['latitude']), math.floor(city['longitude']))
+            self._grid.setdefault(cell, []).append(idx)
+
+        self._polygons = []  # (tzid, (min_lon, min_lat, max_lon, max_lat), [rings])
+
+    @classmethod
+    def from_file(cls, path: str) -> 'Gazetteer':
+        cities = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip() or line.startswith('#'):
+                    continue
+                fields = line.rstrip('\n').split('\t')
+                cities.append({
+                    'name': fields[0],
+                    'country_code': fields[1],
+                    'latitude': float(fields[2]),
+                    'longitude': float(fields[3]),
+                    'timezone': fields[4],
+                    'population': int(fields[5] or 0),
+                    'alternate_names': [n for n in fields[6].split(',') if n] if len(fields) > 6 else [],
+                })
+        return cls(cities)
+
+    def load_polygons(self, path: str):
+        """Полигоны таймзон из GeoJSON (properties.tzid, Polygon/MultiPolygon)"""
+        with open(path, encoding='utf-8') as f:
+            features = json.load(f).get('features', [])
+        for feature in features:
+            tzid = (feature.get('properties') or {}).get('tzid')
+            geometry = feature.get('geometry') or {}
+            if not tzid:
+                continue
+            polygons = geometry.get('coordinates', [])
+            if geometry.get('type') == 'Polygon':
+                polygons = [polygons]
+            for rings in polygons:
+                lons = [point[0] for point in rings[0]]
+                lats = [point[1] for point in rings[0]]
+                self._polygons.append((tzid, (min(lons), min(lats), max(lons), max(lats)), rings))
+
+    # ===== ПОИСК ПО ИМЕНИ =====
+
+    def _exact(self, key: str) -> list:
+        lo = bisect.bisect_left(self._keys, key)
+        hi = bisect.bisect_right(self._keys, key, lo)
+        return [self._ids[i] for i in range(lo, hi)]
+
+    def find(self, place: str) -> Optional[dict]:
+        """
+        Город по строке места рождения ("Москва", "г. Казань, Россия", "Kyiv, Ukraine").
+        Части через запятую проверяются по очереди; название страны ограничивает поиск.
+        """
+        parts = []
+        country = None
+        for raw in (place or '').split(','):
+            key = name_key(_strip_prefixes(raw))
+            if not key:
+                continue
+            if key in COUNTRY_NAMES:
+                country = country or COUNTRY_NAMES[key]
+                continue
+            # "Москва Россия" без запятой
+            words = key.split()
+            for n in (2, 1):
+                tail = ' '.join(words[-n:])
+                if len(words) > n and tail in COUNTRY_NAMES:
+                    country = country or COUNTRY_NAMES[tail]
+                    key = ' '.join(words[:-n])
+                    break
+            parts.append(key)
+
+        def best(ids):
+            if country:
+                ids = [i for i in ids if self.cities[i]['country_code'] == country]
+            if not ids:
+                return None
+            return self.cities[max(ids, key=lambda i: self.cities[i]['population'])]
+
+        for key in parts:
+            city = best(self._exact(key))
+            if city:
+                return city
+        return None
+
+    # ===== ТАЙМЗОНА ПО КООРДИНАТАМ =====
+
+    def _polygon_timezone(self, lat: float, lon: float) -> Optional[str]:
+        for tzid, (min_lon, min_lat, max_lon, max_lat), rings in self._polygons:
+            if not (min_lon <= lon <= max_lon and min_lat <= lat <= max_lat):
+                continue
+            if _point_in_ring(lat, lon, rings[0]) and not any(_point_in_ring(lat, lon, hole) for hole in rings[1:]):
+                return tzid
+        return None
+
+    def nearest(self, lat: float, lon: float, max_km: float = GAZETTEER_TZ_MAX_KM,
+                country_code: Optional[str] = None) -> Optional[dict]:
+        """Ближайший город справочника не дальше max_km (только страны country_code, если задана)"""
+        lat_cells = int(math.ceil(max_km / 111.0))
+        lon_cells = int(math.ceil(max_km / max(1.0, 111.0 * math.cos(math.radians(min(abs(lat), 89.0))))))
+        lon_cells = min(lon_cells, 180)
+        base_lat, base_lon = math.floor(lat), math.floor(lon)
+        best, best_km = None, max_km
+        for dlat in range(-lat_cells, lat_cells + 1):
+            for dlon in range(-lon_cells, lon_cells + 1):
+                cell_lon = (base_lon + dlon + 180) % 360 - 180
+                for idx in self._grid.get((base_lat + dlat, cell_lon), ()):
+                    city = self.cities[idx]
+                    if country_code and city['country_code'] != country_code:
+                        continue
+                    km = _distance_km(lat, lon, city['latitude'], city['longitude'])
+                    if km <= best_km:
+                        best, best_km = city, km
+        return best
+
+    def timezone_at(self, lat: float, lon: float, country_code: Optional[str] = None) -> Optional[str]:
+        """
+        Таймзона из полигонов; без них - ближайшего города страны country_code.
+        Без полигонов и кода страны - None: ближайший город может быть в другом поясе.
+        """
+        if self._polygons:
+            tzid = self._polygon_timezone(lat, lon)
+            if tzid:
+                return tzid
+        if not country_code:
+            return None
+        city = self.nearest(lat, lon, country_code=country_code)
+        return city['timezone'] if city else None
+
+
+# ===== ОБЩИЙ ЭКЗЕМПЛЯР =====
+
+_gazetteer = None
+_load_lock = threading.Lock()
+_load_failed = False
+
+
+def get_gazetteer() -> Optional[Gazetteer]:
+    """Справочник, загруженный при первом обращении (None, если файла нет)"""
+    global _gazetteer, _load_failed
+    if _gazetteer is not None or _load_failed:
+        return _gazetteer
+    with _load_lock:
+        if _gazetteer is None and not _load_failed:
+            try:
+                gazetteer = Gazetteer.from_file(GAZETTEER_PATH)
+                if os.path.exists(TIMEZONE_POLYGONS_PATH):
+                    gazetteer.load_polygons(TIMEZONE_POLYGONS_PATH)
+                _gazetteer = gazetteer
+                logger.info(
+                    f"✅ Справочник городов загружен: {len(gazetteer.cities)} городов, "
+                    f"{len(gazetteer._keys)} имён, полигонов таймзон: {len(gazetteer._polygons)}"
+                )
+            except Exception as e:
+                _load_failed = True
+                logger.error(f"❌ Не удалось загрузить справочник городов {GAZETTEER_PATH}: {e}", exc_info=True)
+    return _gazetteer
+
+
+def find_place(place: str) -> Optional[dict]:
+    """Город из справочника по строке места или None"""
+    gazetteer = get_gazetteer()
+    return gazetteer.find(place) if gazetteer else None
+
+
+def timezone_at(lat: float, lon: float, country_code: Optional[str] = None) -> Optional[str]:
+    """Имя таймзоны (IANA) для координат (в стране country_code, если известна) или None"""
+    gazetteer = get_gazetteer()
+    return gazetteer.timezone_at(lat, lon, country_code) if gazetteer else None
@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Очередь генераций натальной карты в БД (таблица generation_jobs) и воркеры,
+которые её разбирают.
+
+Обработчики бота только ставят задание в очередь (async_repository.enqueue_generation_job)
+и будят воркеров. Воркер берёт задание в аренду на GENERATION_JOB_LEASE секунд и,
+пока обрабатывает его, продлевает аренду каждые GENERATION_JOB_HEARTBEAT секунд.
+Стадии задания и их результаты пишутся в БД:
+
+    queued -> computing -> llm -> rendering -> delivering -> done (или failed)
+
+Если процесс упал или контейнер перезапущен, аренда истекает и задание берёт
+другой воркер (в этом или новом процессе) - обработчик продолжает с последней
+пройденной стадии по stage_data. При штатной остановке аренда снимается сразу.
+Задание, которое брали больше GENERATION_JOB_MAX_ATTEMPTS раз (например, каждый
+раз роняет процесс), помечается failed.
+
+    pool = generation_queue.start_workers(handler, on_abandoned)  # в event loop бота
+    generation_queue.wake_workers()                              # после постановки задания
+    await generation_queue.stop_workers()
+
+Воркеры работают в процессе бота (по умолчанию - во всех конфигурациях
+развёртывания) и/или отдельным процессом astral_worker.py на своих репликах,
+задания между ними делятся через аренду. Чтобы вынести генерации из бота,
+запускают astral_worker (Procfile: generator, Railway: второй сервис с
+railway.generator.json) и задают боту GENERATION_IN_BOT=0 - тогда бот только
+ставит задания в очередь, а PDF доставляет воркер через Bot API. Каждый пул
+воркеров отмечается в generation_workers; бот без воркеров пишет ошибку в лог
+при старте и при постановке задания, если отметок нет (check_workers_alive).
+Воркеры других процессов будить нельзя - они берут новое задание при
+следующем опросе очереди.
+
+handler(lease) - корутина, обрабатывающая lease.job; стадии отмечаются через
+await lease.advance(state, **результаты). Ошибку, о которой пользователь уже
+уведомлён, обработчик записывает в lease.error - задание станет failed.
+
+Настройки (переменные окружения):
+    GENERATION_IN_BOT               - запускать воркеров в процессе бота (по умолчанию 1; 0 - только astral_worker,
+                                      который нужно запустить отдельно)
+    GENERATION_WORKERS              - одновременных генераций на процесс (по умолчанию 4)
+    GENERATION_JOB_LEASE            - аренда задания, секунды (по умолчанию 120)
+    GENERATION_JOB_HEARTBEAT        - продление аренды, секунды (по умолчанию 30)
+    GENERATION_JOB_POLL_INTERVAL    - опрос очереди без пробуждения, секунды (по умолчанию 5)
+    GENERATION_JOB_MAX_ATTEMPTS     - сколько раз задание можно взять в работу (по умолчанию 3)
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+import async_repository as arepo
+
+logger = logging.getLogger(__name__)
+
+GENERATION_IN_BOT = os.getenv('GENERATION_IN_BOT', '1') != '0'
+GENERATION_WORKERS = int(os.getenv('GENERATION_WORKERS', '4'))
+GENERATION_JOB_LEASE = float(os.getenv('GENERATION_JOB_LEASE', '120'))
+GENERATION_JOB_HEARTBEAT = float(os.getenv('GENERATION_JOB_HEARTBEAT', '30'))
+GENERATION_JOB_POLL_INTERVAL = float(os.getenv('GENERATION_JOB_POLL_INTERVAL', '5'))
+GENERATION_JOB_MAX_ATTEMPTS = int(os.getenv('GENERATION_JOB_MAX_ATTEMPTS', '3'))
+
+# Стадии задания
+JOB_QUEUED = 'queued'
+JOB_COMPUTING = 'computing'
+JOB_LLM = 'llm'
+JOB_RENDERING = 'rendering'
+JOB_DELIVERING = 'delivering'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+
+class LeaseLost(Exception):
+    """Аренда задания перешла к другому воркеру - продолжать обработку нельзя"""
+
+
+class JobLease:
+    """Задание, взятое воркером в аренду"""
+
+    def __init__(self, job: dict, worker_id: str):
+        self.job = job
+        self.worker_id = worker_id
+        self.error = None  # ошибка, о которой пользователь уже уведомлён -> failed
+        self.finished = False
+        self.lost = False
+
+    @property
+    def job_id(self) -> int:
+        return self.job['job_id']
+
+    @property
+    def state(self) -> str:
+        return self.job['state']
+
+    @property
+    def stage_data(self) -> dict:
+        return self.job['stage_data']
+
+    @property
+    def resumed(self) -> bool:
+        """Задание уже брали в работу раньше (перезапуск процесса или истёкшая аренда)"""
+        return self.job['attempts'] > 1
+
+    async def advance(self, state: str, **stage_data):
+        """Переход к стадии state; stage_data добавляются к результатам пройденных стадий"""
+        merged = {**self.job['stage_data'], **stage_data}
+        if not await arepo.update_generation_job(self.job_id, self.worker_id, state, merged):
+            raise LeaseLost(f"Задание {self.job_id} больше не принадлежит воркеру {self.worker_id}")
+        self.job['state'] = state
+        self.job['stage_data'] = merged
+
+    async def finish(self, state: str = JOB_DONE, error: Optional[str] = None):
+        """Конечное состояние (done или failed), аренда снимается"""
+        if not await arepo.update_generation_job(self.job_id, self.worker_id, state, self.job['stage_data'], error):
+            logger.warning(f"⚠️ Задание {self.job_id}: аренда потеряна, состояние {state} не записано")
+        self.job['state'] = state
+        self.finished = True
+
+
+def lease_seconds_left(job: dict) -> Optional[float]:
+    """
+    Сколько ещё действует аренда задания (строка generation_jobs): None - аренды нет,
+    отрицательное число - аренда истекла и задание заберёт следующий воркер.
+    """
+    expires_at = job.get('lease_expires_at')
+    if expires_at is None:
+        return None
+    if isinstance(expires_at, str):
+        expires_at = datetime.fromisoformat(expires_at)
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return (expires_at - datetime.now(timezone.utc)).total_seconds()
+
+
+class GenerationWorkerPool:
+    """Воркеры очереди генераций в текущем event loop"""
+
+    def __init__(self, handler, on_abandoned=None, workers: int = GENERATION_WORKERS):
+        self.handler = handler
+        self.on_abandoned = on_abandoned
+        self.workers = max(1, workers)
+        self._prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._loop = None
+        self._wakeup = None
+        self._stopping = False
+        self._tasks = []
+        self._presence_task = None
+        self._jobs = {}  # worker_id -> задача текущего задания
+        self._lock = threading.Lock()
+        self._claimed = 0
+        self._completed = 0
+        self._failed = 0
+        self._resumed = 0
+        self._lost = 0
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._worker(f"{self._prefix}:{number}"))
+            for number in range(self.workers)
+        ]
+        self._presence_task = asyncio.create_task(self._presence())
+        logger.info(f"✅ Воркеры очереди генераций запущены: {self.workers}")
+
+    def wake(self):
+        """Будит воркеров (из любого потока) - новое задание берётся без ожидания опроса"""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def stop(self):
+        """Останавливает воркеров; аренда текущих заданий снимается, их продолжит другой процесс"""
+        self._stopping = True
+        self._wakeup.set()
+        for task in list(self._jobs.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._presence_task.cancel()
+        await asyncio.gather(self._presence_task, return_exceptions=True)
+        try:
+            await arepo.remove_generation_worker(self._prefix)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось снять отметку воркеров {self._prefix}: {e}")
+        logger.info("✅ Воркеры очереди генераций остановлены")
+
+    async def _presence(self):
+        """Отметка в generation_workers: процессы без воркеров видят, что очередь разбирают"""
+        while True:
+            try:
+                await arepo.touch_generation_worker(self._prefix)
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось отметить воркеров {self._prefix}: {e}")
+            await asyncio.sleep(GENERATION_JOB_HEARTBEAT)
+
+    async def _worker(self, worker_id: str):
+        while not self._stopping:
+            try:
+                job = await arepo.claim_generation_job(worker_id, GENERATION_JOB_LEASE)
+            except Exception as e:
+                logger.error(f"❌ Очередь генераций: не удалось взять задание: {e}", exc_info=True)
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), GENERATION_JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            # Могли прийти сразу несколько заданий - пусть проверят очередь и остальные воркеры
+            self._wakeup.set()
+            await self._run_job(JobLease(job, worker_id))
+
+    async def _run_job(self, lease: JobLease):
+        with self._lock:
+            self._claimed += 1
+            self._resumed += lease.resumed
+        if lease.resumed:
+            logger.warning(
+                f"🔁 Задание {lease.job_id} (пользователь {lease.job['user_id']}) продолжается "
+                f"со стадии {lease.state}, попытка {lease.job['attempts']}"
+            )
+        if lease.job['attempts'] > GENERATION_JOB_MAX_ATTEMPTS:
+            await self._abandon(lease)
+            return
+
+        job_task = asyncio.create_task(self.handler(lease))
+        self._jobs[lease.worker_id] = job_task
+        heartbeat = asyncio.create_task(self._heartbeat(lease, job_task))
+        try:
+            await job_task
+            if not lease.finished:
+                await lease.finish(JOB_FAILED if lease.error else JOB_DONE, lease.error)
+            with self._lock:
+                if lease.error:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+        except asyncio.CancelledError:
+            if lease.lost:
+                with self._lock:
+                    self._lost += 1
+                logger.warning(f"⚠️ Задание {lease.job_id}: аренда потеряна, обработка прервана")
+            else:
+                # Остановка процесса: задание сразу доступно другим воркерам
+                job_task.cancel()
+                await arepo.release_generation_job(lease.job_id, lease.worker_id)
+                logger.info(f"⏸️ Задание {lease.job_id} возвращено в очередь на стадии {lease.state}")
+                if not self._stopping:
+                    raise
+        except LeaseLost as e:
+            with self._lock:
+                self._lost += 1
+            logger.warning(f"⚠️ {e}")
+        except Exception as e:
+            logger.error(f"❌ Задание {lease.job_id} завершилось ошибкой: {e}", exc_info=True)
+            with self._lock:
+                self._failed += 1
+            if not lease.finished:
+                await lease.finish(JOB_FAILED, f"{type(e).__name__}: {e}")
+        finally:
+            heartbeat.cancel()
+            self._jobs.pop(lease.worker_id, None)
+
+    async def _heartbeat(self, lease: JobLease, job_task: asyncio.Task):
+        """Продлевает аренду, пока задание обрабатывается; при потере аренды прерывает его"""
+        while True:
+            await asyncio.sleep(GENERATION_JOB_HEARTBEAT)
+            try:
+                alive = await arepo.heartbeat_generation_job(lease.job_id, lease.worker_id, GENERATION_JOB_LEASE)
+            except Exception as e:
+                # Временная ошибка БД: аренда ещё действует, попробуем при следующем продлении
+                logger.warning(f"⚠️ Задание {lease.job_id}: не удалось продлить аренду: {e}")
+                continue
+            if not alive:
+                lease.lost = True
+                job_task.cancel()
+                return
+
+    async def _abandon(self, lease: JobLease):
+        """Задание исчерпало попытки: failed и уведомление пользователя"""
+        error = f"Задание брали в работу {lease.job['attempts']} раз(а) и не завершили (стадия {lease.state})"
+        logger.error(f"❌ Задание {lease.job_id} (пользователь {lease.job['user_id']}): {error}")
+        await lease.finish(JOB_FAILED, error)
+        with self._lock:
+            self._failed += 1
+        if self.on_abandoned is not None:
+            try:
+                await self.on_abandoned(lease, error)
+            except Exception as e:
+                logger.error(f"❌ Не удалось уведомить о прерванном задании {lease.job_id}: {e}", exc_info=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'busy': len(self._jobs),
+                'claimed': self._claimed,
+                'completed': self._completed,
+                'failed': self._failed,
+                'resumed': self._resumed,
+                'lease_lost': self._lost,
+            }
+
+
+# ===== ОБЩИЙ ЭКЗЕМПЛЯР =====
+
+_pool = None
+
+
+def start_workers(handler, on_abandoned=None, workers: int = GENERATION_WORKERS) -> GenerationWorkerPool:
+    """Запускает воркеров в текущем event loop (один пул на процесс)"""
+    global _pool
+    if _pool is None:
+        _pool = GenerationWorkerPool(handler, on_abandoned, workers)
+        _pool.start()
+    return _pool
+
+
+def wake_workers():
+    """Будит воркеров процесса после постановки задания (если они запущены)"""
+    if _pool is not None:
+        _pool.wake()
+
+
+async def check_workers_alive(reason: str) -> bool:
+    """
+    Есть ли запущенные воркеры (в этом или другом процессе). Если нет - ошибка в лог:
+    задания из очереди никто не выполнит, пока не запущен astral_worker
+    или бот без GENERATION_IN_BOT=0.
+    """
+    if _pool is not None:
+        return True
+    try:
+        alive = await arepo.count_live_generation_workers(GENERATION_JOB_LEASE)
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось проверить воркеров очереди генераций: {e}")
+        return True
+    if alive:
+        return True
+    logger.error(
+        f"❌ {reason}: нет запущенных воркеров очереди генераций (GENERATION_IN_BOT=0, а astral_worker "
+        f"не отмечался {GENERATION_JOB_LEASE:.0f} с) - задания ждут в очереди. "
+        f"Запустите python -m astral_worker или уберите GENERATION_IN_BOT=0"
+    )
+    return False
+
+
+async def stop_workers():
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.stop()
+
+
+def get_generation_queue_stats() -> dict:
+    """Счётчики воркеров для /health"""
+    return _pool.stats() if _pool is not None else {'workers': 0}
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тайминги стадий генерации натальной карты (таблица generation_spans).
+
+Каждое задание очереди генераций записывает спаны - длительность стадии и её метрики:
+
+    queue_wait   - от постановки задания в очередь до начала обработки
+    chart        - расчёт карты целиком (кэш, геокодирование, эфемериды)
+    geocode      - координаты места рождения
+    tz           - часовой пояс места рождения
+    ephemeris    - Swiss Ephemeris (планеты, дома, аспекты)
+    llm          - все разделы отчёта
+    llm_section  - раздел отчёта (section): ожидание в очереди шлюза OpenAI,
+                   первый токен, токены промпта (из кэша) и ответа
+    pdf          - сборка PDF целиком (шрифты, диаграмма, разметка)
+    pdf_build    - ReportLab doc.build
+    upload       - отправка PDF (send_document)
+    total        - задание целиком; ok - PDF доставлен
+
+Спаны копятся в памяти задания (JobTrace) и пишутся в БД одной вставкой в конце.
+Стадии в глубине кода (геокодирование и эфемериды в пулах chart_executor) находят
+трассу задания через contextvars - пулы потоков переносят контекст вызывающего.
+Вне задания (например, кнопка "планеты") span() ничего не записывает.
+
+    trace = generation_spans.start_trace(job_id, user_id)
+    with generation_spans.span('upload'):
+        await bot.send_document(...)
+    with generation_spans.span('llm_section', section=3) as metrics:
+        metrics['prompt_tokens'] = ...
+    await generation_spans.finish_trace(trace)
+
+Отчёт с p50/p95/p99 по стадиям: python view_generation_timings.py
+"""
+
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from db_pool import db_connection
+
+logger = logging.getLogger(__name__)
+
+# Стадии в порядке выполнения (порядок строк в отчёте)
+STAGES = ('queue_wait', 'chart', 'geocode', 'tz', 'ephemeris', 'llm', 'llm_section',
+          'pdf', 'pdf_build', 'upload', 'total')
+# Метрики спана помимо длительности (колонки generation_spans)
+SPAN_METRICS = ('queue_seconds', 'first_token_seconds', 'prompt_tokens', 'cached_tokens', 'completion_tokens')
+
+_current = contextvars.ContextVar('generation_trace', default=None)
+
+
+class JobTrace:
+    """Спаны одного задания; add() можно вызывать из любых потоков"""
+
+    def __init__(self, job_id: int, user_id: int):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.spans = []
+        self._lock = threading.Lock()
+        self._token = None
+
+    def add(self, stage: str, seconds: float, started_at: datetime, ok: bool = True,
+            section: Optional[int] = None, **metrics):
+        span = {
+            'stage': stage,
+            'section': section,
+            'started_at': started_at,
+            'duration_seconds': round(seconds, 4),
+            'ok': ok,
+            **{name: metrics.get(name) for name in SPAN_METRICS},
+        }
+        with self._lock:
+            self.spans.append(span)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def start_trace(job_id: int, user_id: int) -> JobTrace:
+    """Трасса задания для текущего контекста (задачи event loop и всего, что она запускает)"""
+    trace = JobTrace(job_id, user_id)
+    trace._token = _current.set(trace)
+    return trace
+
+
+async def finish_trace(trace: JobTrace):
+    """Отключает трассу и пишет её спаны в БД; ошибка записи не влияет на задание"""
+    if trace._token is not None:
+        _current.reset(trace._token)
+        trace._token = None
+    try:
+        await asyncio.to_thread(save_spans, trace)
+    except Exception as e:
+        logger.error(f"❌ Не удалось записать тайминги задания {trace.job_id}: {e}", exc_info=True)
+
+
+@contextmanager
+def span(stage: str, section: Optional[int] = None):
+    """
+    Спан стадии в трассе текущего задания. Возвращает словарь метрик, который
+    можно дополнить внутри блока (SPAN_METRICS); исключение отмечает спан ok=False.
+    """
+    trace = _current.get()
+    metrics = {}
+    if trace is None:
+        yield metrics
+        return
+    started_at = _utcnow()
+    started = time.monotonic()
+    ok = False
+    try:
+        yield metrics
+        ok = True
+    finally:
+        trace.add(stage, time.monotonic() - started, started_at, ok, section, **metrics)
+
+
+def record(stage: str, seconds: float, ok: bool = True, section: Optional[int] = None, **metrics):
+    """Спан с уже известной длительностью, закончившийся сейчас"""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(stage, seconds, _utcnow() - timedelta(seconds=seconds), ok, section, **metrics)
+
+
+def seconds_since(value) -> Optional[float]:
+    """Секунды с момента value (datetime или ISO-строка UTC из SQLite)"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return max(0.0, (_utcnow() - value).total_seconds())
+
+
+# ===== ХРАНЕНИЕ =====
+
+_COLUMNS = ('job_id', 'user_id', 'stage', 'section', 'started_at', 'duration_seconds', 'ok') + SPAN_METRICS
+
+
+def save_spans(trace: JobTrace) -> int:
+    """Пишет спаны задания одной вставкой; возвращает число записанных"""
+    with trace._lock:
+        spans = list(trace.spans)
+    if not spans:
+        return 0
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        ph = '%s' if db_type == 'postgresql' else '?'
+        rows = []
+        for item in spans:
+            started_at = item['started_at']
+            if db_type != 'postgresql':
+                started_at = started_at.replace(tzinfo=None).isoformat()
+            ok = item['ok'] if db_type == 'postgresql' else int(item['ok'])
+            rows.append((trace.job_id, trace.user_id, item['stage'], item['section'], started_at,
+                         item['duration_seconds'], ok) + tuple(item[name] for name in SPAN_METRICS))
+        cursor.executemany(
+            f"INSERT INTO generation_spans ({', '.join(_COLUMNS)}) VALUES ({', '.join([ph] * len(_COLUMNS))})",
+            rows
+        )
+        conn.commit()
+    return len(rows)
+
+
+def load_spans(cursor, db_type: str, start=None, end=None) -> list:
+    """
+    Спаны за период [start, end) по started_at (значения в формате колонки,
+    см. events_maintenance.day_bounds): список словарей с колонками generation_spans.
+    """
+    ph = '%s' if db_type == 'postgresql' else '?'
+    conditions, params = [], []
+    if start is not None:
+        conditions.append(f'started_at >= {ph}')
+        params.append(start)
+    if end is not None:
+        conditions.append(f'started_at < {ph}')
+        params.append(end)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    columns = ('stage', 'section', 'duration_seconds', 'ok') + SPAN_METRICS
+    cursor.execute(f"SELECT {', '.join(columns)} FROM generation_spans {where}", params)
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Двухуровневый кэш геокодирования мест рождения: LRU в памяти процесса + таблица
+geocode_cache в БД (общая для всех реплик и переживает перезапуск).
+
+Большинство пользователей родились в нескольких сотнях городов, а публичный
+Nominatim разрешает один запрос в секунду. Поэтому координаты, country_code и
+таймзона места сохраняются по нормализованной строке места, а запросы к
+Nominatim, которые всё же нужны, идут не чаще GEOCODE_MIN_INTERVAL.
+
+Места, которые геокодер не нашёл, тоже кэшируются (отрицательный кэш) на
+меньший срок. Ошибки сети и таймауты не кэшируются.
+
+Настройки (переменные окружения):
+    GEOCODE_CACHE_MAX_SIZE     - максимум мест в памяти (по умолчанию 2000)
+    GEOCODE_MEMORY_TTL         - время жизни записи в памяти, секунды (по умолчанию 3600)
+    GEOCODE_CACHE_TTL_DAYS     - срок жизни найденного места в БД, дни (по умолчанию 180)
+    GEOCODE_NEGATIVE_TTL_HOURS - срок жизни "не найдено", часы (по умолчанию 24)
+    GEOCODE_MIN_INTERVAL       - минимальный интервал между запросами к Nominatim, секунды (по умолчанию 1.0)
+
+Прогрев кэша местами рождения существующих пользователей:
+    python geocode_cache.py --prewarm
+    python geocode_cache.py --prewarm 100    # не больше 100 мест за запуск
+"""
+
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from db_pool import db_connection
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+GEOCODE_CACHE_MAX_SIZE = int(os.getenv('GEOCODE_CACHE_MAX_SIZE', '2000'))
+GEOCODE_MEMORY_TTL = float(os.getenv('GEOCODE_MEMORY_TTL', '3600'))
+GEOCODE_CACHE_TTL_DAYS = float(os.getenv('GEOCODE_CACHE_TTL_DAYS', '180'))
+GEOCODE_NEGATIVE_TTL_HOURS = float(os.getenv('GEOCODE_NEGATIVE_TTL_HOURS', '24'))
+GEOCODE_MIN_INTERVAL = float(os.getenv('GEOCODE_MIN_INTERVAL', '1.0'))
+
+_memory = TTLCache(max_size=GEOCODE_CACHE_MAX_SIZE, ttl=GEOCODE_MEMORY_TTL)
+
+_stats_lock = threading.Lock()
+_db_hits = 0
+_db_misses = 0
+_remote_requests = 0
+
+_throttle_lock = threading.Lock()
+_last_request_at = 0.0
+
+
+def normalize_place(place: str) -> str:
+    """Ключ кэша: нижний регистр, ё -> е, без знаков препинания и лишних пробелов"""
+    text = (place or '').lower().replace('ё', 'е')
+    return ' '.join(re.sub(r'[,.;:()"«»]+', ' ', text).split())
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _to_db_time(value: datetime, db_type: str):
+    """TIMESTAMPTZ для PostgreSQL, ISO-строка UTC без часового пояса для SQLite"""
+    if db_type == 'postgresql':
+        return value
+    return value.replace(tzinfo=None).isoformat()
+
+
+def _from_db_time(value) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _count(name: str):
+    global _db_hits, _db_misses, _remote_requests
+    with _stats_lock:
+        if name == 'db_hit':
+            _db_hits += 1
+        elif name == 'db_miss':
+            _db_misses += 1
+        else:
+            _remote_requests += 1
+
+
+# ===== ЧТЕНИЕ =====
+
+def lookup(place: str) -> Optional[dict]:
+    """
+    Запись кэша для места или None, если места нет или срок истёк.
+
+    Запись: {'place', 'found', 'latitude', 'longitude', 'country_code', 'timezone', 'expires_at'}
+    """
+    key = normalize_place(place)
+    if not key:
+        return None
+
+    entry = _memory.get(key)
+    if entry is not None:
+        if entry['expires_at'] > _utcnow():
+            return entry
+        _memory.invalidate(key)
+
+    version = _memory.version(key)
+    try:
+        with db_connection() as (conn, db_type):
+            cursor = conn.cursor()
+            ph = '%s' if db_type == 'postgresql' else '?'
+            cursor.execute(f'''
+                SELECT place, found, latitude, longitude, country_code, timezone, expires_at
+                FROM geocode_cache WHERE place_key = {ph}
+            ''', (key,))
+            row = cursor.fetchone()
+    except Exception as e:
+        logger.error(f"❌ Ошибка чтения кэша геокодирования для '{place}': {e}", exc_info=True)
+        return None
+
+    if not row or _from_db_time(row[6]) <= _utcnow():
+        _count('db_miss')
+        return None
+
+    _count('db_hit')
+    entry = _entry_from_row(row)
+    _memory.set(key, entry, version=version)
+    return entry
+
+
+def lookup_many(places: list, chunk_size: int = 500) -> dict:
+    """
+    Записи кэша для многих мест сразу (для пакетного расчёта карт): память, затем
+    один запрос к БД на chunk_size мест. Возвращает {normalize_place(place): запись}
+    только для найденных в кэше мест; записи из БД попадают и в память.
+    """
+    result = {}
+    missing = []
+    now = _utcnow()
+    for place in places:
+        key = normalize_place(place)
+        if not key or key in result or key in missing:
+            continue
+        entry = _memory.get(key)
+        if entry is not None and entry['expires_at'] > now:
+            result[key] = entry
+        else:
+            missing.append(key)
+
+    for start in range(0, len(missing), chunk_size):
+        keys = missing[start:start + chunk_size]
+        versions = {key: _memory.version(key) for key in keys}
+        try:
+            with db_connection() as (conn, db_type):
+                cursor = conn.cursor()
+                ph = '%s' if db_type == 'postgresql' else '?'
+                cursor.execute(f'''
+                    SELECT place_key, place, found, latitude, longitude, country_code, timezone, expires_at
+                    FROM geocode_cache WHERE place_key IN ({', '.join([ph] * len(keys))})
+                ''', keys)
+                rows = cursor.fetchall()
+        except Exception as e:
+            logger.error(f"❌ Ошибка пакетного чтения кэша геокодирования: {e}", exc_info=True)
+            continue
+
+        for row in rows:
+            entry = _entry_from_row(row[1:])
+            if entry['expires_at'] <= now:
+                continue
+            result[row[0]] = entry
+            _memory.set(row[0], entry, version=versions[row[0]])
+        for key in keys:
+            _count('db_hit' if key in result else 'db_miss')
+    return result
+
+
+def _entry_from_row(row) -> dict:
+    """(place, found, latitude, longitude, country_code, timezone, expires_at) -> запись кэша"""
+    return {
+        'place': row[0],
+        'found': bool(row[1]),
+        'latitude': row[2],
+        'longitude': row[3],
+        'country_code': row[4],
+        'timezone': row[5],
+        'expires_at': _from_db_time(row[6]),
+    }
+
+
+# ===== ЗАПИСЬ =====
+
+def store_coordinates(place: str, latitude: Optional[float], longitude: Optional[float]):
+    """
+    Сохраняет результат прямого геокодирования. latitude=None - место не найдено
+    (отрицательный кэш). Уже известные country_code/timezone места не затираются.
+    """
+    key = normalize_place(place)
+    if not key:
+        return
+    found = latitude is not None and longitude is not None
+    now = _utcnow()
+    ttl = timedelta(days=GEOCODE_CACHE_TTL_DAYS) if found else timedelta(hours=GEOCODE_NEGATIVE_TTL_HOURS)
+    expires_at = now + ttl
+    try:
+        with db_connection() as (conn, db_type):
+            cursor = conn.cursor()
+            ph = '%s' if db_type == 'postgresql' else '?'
+            cursor.execute(f'''
+                INSERT INTO geocode_cache (place_key, place, found, latitude, longitude, expires_at, updated_at)
+                VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph})
+                ON CONFLICT (place_key) DO UPDATE SET
+                    place = excluded.place,
+                    found = excluded.found,
+                    latitude = excluded.latitude,
+                    longitude = excluded.longitude,
+                    expires_at = excluded.expires_at,
+                    updated_at = excluded.updated_at
+            ''', (key, place, found if db_type == 'postgresql' else int(found), latitude, longitude,
+                  _to_db_time(expires_at, db_type), _to_db_time(now, db_type)))
+            conn.commit()
+    except Exception as e:
+        logger.error(f"❌ Ошибка записи кэша геокодирования для '{place}': {e}", exc_info=True)
+    # Следующее чтение возьмёт запись из БД вместе с country_code/timezone
+    _memory.invalidate(key)
+
+
+def store_timezone(place: str, country_code: str, tz_name: Optional[str] = None):
+    """
+    Сохраняет результат обратного геокодирования для найденного места.
+    tz_name передаётся, только если таймзона не зависит от даты рождения.
+    """
+    key = normalize_place(place)
+    if not key:
+        return
+    try:
+        with db_connection() as (conn, db_type):
+            cursor = conn.cursor()
+            if db_type == 'postgresql':
+                cursor.execute('''
+                    UPDATE geocode_cache SET country_code = %s, timezone = %s, updated_at = %s
+                    WHERE place_key = %s AND found
+                ''', (country_code, tz_name, _utcnow(), key))
+            else:
+                cursor.execute('''
+                    UPDATE geocode_cache SET country_code = ?, timezone = ?, updated_at = ?
+                    WHERE place_key = ? AND found = 1
+                ''', (country_code, tz_name, _to_db_time(_utcnow(), db_type), key))
+            conn.commit()
+    except Exception as e:
+        logger.error(f"❌ Ошибка записи таймзоны в кэш геокодирования для '{place}': {e}", exc_info=True)
+    _memory.invalidate(key)
+
+
+# ===== ОГРАНИЧЕНИЕ ЧАСТОТЫ ЗАПРОСОВ =====
+
+def throttle_remote():
+    """
+    Ждёт, пока с предыдущего запроса к Nominatim пройдёт GEOCODE_MIN_INTERVAL.
+    Вызывается перед каждым сетевым geocode/reverse (во всех потоках процесса).
+    """
+    global _last_request_at
+    with _throttle_lock:
+        wait = _last_request_at + GEOCODE_MIN_INTERVAL - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        _last_request_at = time.monotonic()
+    _count('remote')
+
+
+def get_geocode_cache_stats() -> dict:
+    """Метрики кэша для /health"""
+    with _stats_lock:
+        return {
+            'memory': _memory.stats(),
+            'db_hits': _db_hits,
+            'db_misses': _db_misses,
+            'remote_requests': _remote_requests,
+        }
+
+
+# ===== ПРОГРЕВ =====
+
+def list_uncached_places(limit: int = None) -> list:
+    """Места рождения пользователей, которых ещё нет в кэше (или срок записи истёк)"""
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT birth_place FROM users WHERE birth_place IS NOT NULL AND birth_place <> ''")
+        places = [row[0] for row in cursor.fetchall()]
+
+    seen = set()
+    uncached = []
+    for place in places:
+        key = normalize_place(place)
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        if lookup(place) is None:
+            uncached.append(place)
+            if limit and len(uncached) >= limit:
+                break
+    return uncached
+
+
+def prewarm_from_users(resolve, limit: int = None) -> dict:
+    """
+    Заполняет кэш местами рождения существующих пользователей.
+    resolve(place) выполняет полное геокодирование места и сохраняет результат в кэш.
+    """
+    places = list_uncached_places(limit)
+    logger.info(f"🔥 Прогрев кэша геокодирования: {len(places)} мест без записи в кэше")
+    resolved = 0
+    failed = 0
+    for i, place in enumerate(places, 1):
+        try:
+            resolve(place)
+            resolved += 1
+        except Exception as e:
+            failed += 1
+            logger.warning(f"⚠️ Не удалось геокодировать '{place}': {e}")
+        if i % 50 == 0:
+            logger.info(f"   ... обработано {i}/{len(places)}")
+    return {'places': len(places), 'resolved': resolved, 'failed': failed}
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    if len(sys.argv) < 2 or sys.argv[1] != '--prewarm':
+        print("Использование:")
+        print("  python geocode_cache.py --prewarm [limit]")
+        sys.exit(1)
+
+    from bot import get_coordinates_from_place, resolve_timezone_from_place
+
+    def _resolve(place):
+        lat, lon = get_coordinates_from_place(place)
+        if lat is not None and lon is not None:
+            resolve_timezone_from_place(place, lat, lon, datetime.now())
+
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    result = prewarm_from_users(_resolve, limit)
+    print(f"✅ Прогрев завершён: мест {result['places']}, геокодировано {result['resolved']}, ошибок {result['failed']}")
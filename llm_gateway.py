@@ -0,0 +1,451 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Общий шлюз к OpenAI для всех генераций отчётов.
+
+Один асинхронный клиент (AsyncOpenAI, общий пул HTTP-соединений) и один
+ограничитель запросов на весь процесс:
+
+    - token bucket на запросы в минуту (RPM) и токены в минуту (TPM): запрос
+      списывает оценку токенов промпта + max_tokens, как считает лимиты OpenAI
+    - не больше LLM_MAX_CONCURRENCY запросов одновременно
+    - очередь с приоритетом: оплаченные генерации (PRIORITY_PAID) проходят
+      раньше остальных (PRIORITY_DEFAULT)
+    - 429, 5xx и сетевые ошибки повторяются с экспоненциальной задержкой и
+      случайным разбросом (Retry-After от OpenAI имеет приоритет); после 429
+      ограничитель приостанавливает выдачу всем
+    - метрики: время в очереди, до первого токена и ответа, токены промпта,
+      из кэша промптов OpenAI и ответа (usage из потока) на каждый запрос
+
+Генерации запускаются в разных event loop (основной цикл бота, отдельные
+потоки после оплаты), поэтому шлюз работает в своём цикле в фоновом потоке,
+а complete() можно вызывать из любого цикла, complete_sync() - из потока:
+
+    text = await llm_gateway.complete(messages, priority=llm_gateway.PRIORITY_PAID, label="Раздел 1")
+    result = await llm_gateway.complete_detailed(messages, ...)  # + токены и задержки
+
+Настройки (переменные окружения):
+    LLM_RPM              - запросов в минуту (по умолчанию 500, 0 - без ограничения)
+    LLM_TPM              - токенов в минуту (по умолчанию 450000, 0 - без ограничения)
+    LLM_MAX_CONCURRENCY  - одновременных запросов к OpenAI на весь бот (по умолчанию 8)
+    LLM_MAX_ATTEMPTS     - попыток на запрос при 429/5xx/сетевых ошибках (по умолчанию 5)
+    LLM_REQUEST_TIMEOUT  - таймаут одного запроса, секунды (по умолчанию 180)
+    LLM_BACKOFF_BASE     - базовая задержка повтора, секунды (по умолчанию 1)
+    LLM_BACKOFF_MAX      - максимальная задержка повтора, секунды (по умолчанию 60)
+"""
+
+import asyncio
+import atexit
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+LLM_RPM = int(os.getenv('LLM_RPM', '500'))
+LLM_TPM = int(os.getenv('LLM_TPM', '450000'))
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+LLM_MAX_ATTEMPTS = int(os.getenv('LLM_MAX_ATTEMPTS', '5'))
+LLM_REQUEST_TIMEOUT = float(os.getenv('LLM_REQUEST_TIMEOUT', '180'))
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', '1'))
+LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', '60'))
+
+# Приоритеты очереди: меньше - раньше
+PRIORITY_PAID = 0
+PRIORITY_DEFAULT = 1
+
+# Оценка токенов без токенизатора: русский текст - около 2.5 символа на токен
+CHARS_PER_TOKEN = 2.5
+
+
+class EmptyCompletion(RuntimeError):
+    """OpenAI вернул пустой ответ"""
+
+
+def estimate_tokens(messages: list) -> int:
+    """Оценка токенов промпта (с запасом, чтобы не превышать TPM)"""
+    chars = sum(len(message.get('content') or '') for message in messages)
+    return int(chars / CHARS_PER_TOKEN) + 4 * len(messages)
+
+
+def _usage_value(usage, *path) -> int:
+    """Поле usage из потока (словарь или объект SDK), 0 - если его нет"""
+    value = usage
+    for key in path:
+        if value is None:
+            return 0
+        value = value.get(key) if isinstance(value, dict) else getattr(value, key, None)
+    return int(value or 0)
+
+
+def _status_code(error: Exception):
+    return getattr(error, 'status_code', None)
+
+
+def _is_retryable(error: Exception) -> bool:
+    """429, 5xx, таймауты и обрывы соединения, пустой ответ"""
+    if isinstance(error, (APIConnectionError, EmptyCompletion)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def _retry_after(error: Exception):
+    """Retry-After из ответа OpenAI, секунды (None, если заголовка нет)"""
+    response = getattr(error, 'response', None)
+    value = response.headers.get('retry-after') if response is not None else None
+    try:
+        return min(float(value), LLM_BACKOFF_MAX) if value is not None else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Экспоненциальная задержка с полным случайным разбросом (attempt с 1)"""
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+class _TokenBucket:
+    """Ведро на per_minute единиц в минуту; пополняется непрерывно"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+
+class _RateLimiter:
+    """RPM/TPM, предел одновременных запросов и очередь с приоритетом (только в цикле шлюза)"""
+
+    def __init__(self, rpm: int, tpm: int, max_concurrency: int):
+        self.requests = _TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = _TokenBucket(tpm) if tpm > 0 else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._waiters = []  # куча (приоритет, номер)
+        self._seq = itertools.count()
+        self._cond = asyncio.Condition()
+
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _delay(self, tokens: float):
+        """0 - можно выполнять; число - подождать секунд; None - ждать освобождения слота"""
+        if self.in_flight >= self.max_concurrency:
+            return None
+        now = time.monotonic()
+        delay = max(0.0, self.paused_until - now)
+        for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+            if bucket is not None:
+                bucket.refill(now)
+                delay = max(delay, bucket.wait_time(min(amount, bucket.capacity)))
+        return delay
+
+    async def acquire(self, tokens: float, priority: int):
+        entry = (priority, next(self._seq))
+        heapq.heappush(self._waiters, entry)
+        try:
+            async with self._cond:
+                while True:
+                    delay = self._delay(tokens) if self._waiters[0] == entry else None
+                    if delay == 0:
+                        heapq.heappop(self._waiters)
+                        if self.requests is not None:
+                            self.requests.level -= 1
+                        if self.tokens is not None:
+                            self.tokens.level -= min(tokens, self.tokens.capacity)
+                        self.in_flight += 1
+                        # Следующий в очереди проверит свои условия
+                        self._cond.notify_all()
+                        return
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+        except BaseException:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                asyncio.get_running_loop().create_task(self._notify())
+            raise
+
+    async def release(self):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def pause(self, seconds: float):
+        """После 429 новые запросы не выдаются seconds секунд"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def _notify(self):
+        async with self._cond:
+            self._cond.notify_all()
+
+
+class LLMGateway:
+    """Клиент AsyncOpenAI и ограничитель в собственном event loop (фоновый поток)"""
+
+    def __init__(self, api_key: str = None):
+        self.api_key = api_key or os.getenv('OPENAI_API_KEY')
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._limiter = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        # Метрики
+        self._requests = 0
+        self._completed = 0
+        self._failed = 0
+        self._retries = 0
+        self._rate_limited = 0
+        self._queue_seconds = 0.0
+        self._max_queue_seconds = 0.0
+        self._response_seconds = 0.0
+        self._prompt_tokens = 0
+        self._cached_tokens = 0
+        self._completion_tokens = 0
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=loop.run_forever, name='llm-gateway', daemon=True)
+                self._thread.start()
+                self._loop = loop
+                logger.info(
+                    f"✅ LLM-шлюз запущен: RPM={LLM_RPM or '∞'}, TPM={LLM_TPM or '∞'}, "
+                    f"одновременно {LLM_MAX_CONCURRENCY}"
+                )
+            return self._loop
+
+    def _setup(self):
+        """Клиент и ограничитель создаются в цикле шлюза"""
+        if self._client is None:
+            # Повторы делает шлюз (с общей паузой после 429), а не клиент
+            self._client = AsyncOpenAI(api_key=self.api_key, timeout=LLM_REQUEST_TIMEOUT, max_retries=0)
+            self._limiter = _RateLimiter(LLM_RPM, LLM_TPM, LLM_MAX_CONCURRENCY)
+
+    async def complete_detailed(self, messages: list, **kwargs) -> dict:
+        """
+        Ответ и метрики запроса; можно вызывать из любого event loop:
+        {'text', 'prompt_tokens', 'cached_tokens', 'completion_tokens', 'queue_seconds',
+         'first_token_seconds', 'response_seconds', 'attempts'}
+        """
+        future = asyncio.run_coroutine_threadsafe(self._complete(messages, **kwargs), self._ensure_loop())
+        return await asyncio.wrap_future(future)
+
+    async def complete(self, messages: list, **kwargs) -> str:
+        """Текст ответа; можно вызывать из любого event loop"""
+        return (await self.complete_detailed(messages, **kwargs))['text']
+
+    def complete_sync(self, messages: list, **kwargs) -> str:
+        """То же из обычного потока (не из цикла шлюза)"""
+        return asyncio.run_coroutine_threadsafe(self._complete(messages, **kwargs), self._ensure_loop()).result()['text']
+
+    async def _stream(self, messages: list, model: str, max_tokens: int, temperature: float,
+                      on_first_token=None) -> tuple:
+        """
+        Потоковый ответ: (текст, usage, секунд до первого токена, число фрагментов).
+        usage приходит последним событием потока (stream_options.include_usage).
+        """
+        started = time.monotonic()
+        stream = await self._client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            extra_body={"stream_options": {"include_usage": True}},
+        )
+        collected = []
+        usage = None
+        first_token_seconds = None
+        async for event in stream:
+            usage = getattr(event, "usage", None) or usage
+            try:
+                piece = getattr(event.choices[0].delta, "content", None)
+            except (AttributeError, IndexError):
+                # Событие без choices (usage) или нестандартное (finish_reason и т.п.)
+                continue
+            if piece:
+                if first_token_seconds is None:
+                    first_token_seconds = time.monotonic() - started
+                    if on_first_token is not None:
+                        # Промпт обработан (и попал в кэш промптов OpenAI)
+                        on_first_token()
+                collected.append(piece)
+        return "".join(collected).strip(), usage, first_token_seconds, len(collected)
+
+    async def _complete(self, messages: list, model: str = "gpt-4.1", max_tokens: int = 10000,
+                        temperature: float = 0.4, priority: int = PRIORITY_DEFAULT, label: str = "запрос",
+                        max_attempts: int = None, on_first_token=None) -> dict:
+        self._setup()
+        max_attempts = max_attempts or LLM_MAX_ATTEMPTS
+        estimated_tokens = estimate_tokens(messages)
+        queue_total = 0.0
+        for attempt in range(1, max_attempts + 1):
+            queued = time.monotonic()
+            await self._limiter.acquire(estimated_tokens + max_tokens, priority)
+            started = time.monotonic()
+            queue_seconds = started - queued
+            queue_total += queue_seconds
+            error = None
+            try:
+                text, usage, first_token_seconds, chunks = await self._stream(
+                    messages, model, max_tokens, temperature, on_first_token
+                )
+                if not text:
+                    error = EmptyCompletion(f"Пустой ответ OpenAI ({label})")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = e
+            finally:
+                await self._limiter.release()
+            response_seconds = time.monotonic() - started
+
+            if error is None:
+                result = {
+                    'text': text,
+                    # Без usage в потоке - оценка промпта и число фрагментов ответа
+                    'prompt_tokens': _usage_value(usage, 'prompt_tokens') or estimated_tokens,
+                    'cached_tokens': _usage_value(usage, 'prompt_tokens_details', 'cached_tokens'),
+                    'completion_tokens': _usage_value(usage, 'completion_tokens') or chunks,
+                    'queue_seconds': round(queue_total, 3),
+                    'first_token_seconds': round(first_token_seconds or 0.0, 3),
+                    'response_seconds': round(response_seconds, 3),
+                    'attempts': attempt,
+                }
+                self._record(queue_seconds, response_seconds, None, result)
+                logger.info(
+                    f"🤖 LLM [{label}]: очередь {queue_total:.1f} с, первый токен {result['first_token_seconds']:.1f} с, "
+                    f"ответ {response_seconds:.1f} с, токены {result['prompt_tokens']} "
+                    f"(из кэша {result['cached_tokens']}) + {result['completion_tokens']}"
+                )
+                return result
+            self._record(queue_seconds, response_seconds, error, None)
+            if not _is_retryable(error) or attempt == max_attempts:
+                logger.error(f"❌ LLM [{label}]: {type(error).__name__}: {error} (попытка {attempt}/{max_attempts})")
+                raise error
+
+            delay = _retry_after(error) or backoff_delay(attempt)
+            if _status_code(error) == 429:
+                # Лимит аккаунта исчерпан - паузу соблюдают все запросы, а не только этот
+                self._limiter.pause(delay)
+                with self._stats_lock:
+                    self._rate_limited += 1
+            with self._stats_lock:
+                self._retries += 1
+            logger.warning(
+                f"⚠️ LLM [{label}]: {type(error).__name__}: {error}; "
+                f"повтор {attempt + 1}/{max_attempts} через {delay:.1f} с"
+            )
+            await asyncio.sleep(delay)
+
+    def _record(self, queue_seconds: float, response_seconds: float, error, result):
+        with self._stats_lock:
+            self._requests += 1
+            if error is None:
+                self._completed += 1
+                self._prompt_tokens += result['prompt_tokens']
+                self._cached_tokens += result['cached_tokens']
+                self._completion_tokens += result['completion_tokens']
+            else:
+                self._failed += 1
+            self._queue_seconds += queue_seconds
+            self._max_queue_seconds = max(self._max_queue_seconds, queue_seconds)
+            self._response_seconds += response_seconds
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            requests = self._requests
+            return {
+                'requests': requests,
+                'completed': self._completed,
+                'failed': self._failed,
+                'retries': self._retries,
+                'rate_limited': self._rate_limited,
+                'in_flight': self._limiter.in_flight if self._limiter else 0,
+                'waiting': self._limiter.waiting() if self._limiter else 0,
+                'avg_queue_seconds': round(self._queue_seconds / requests, 3) if requests else 0.0,
+                'max_queue_seconds': round(self._max_queue_seconds, 3),
+                'avg_response_seconds': round(self._response_seconds / requests, 3) if requests else 0.0,
+                'prompt_tokens': self._prompt_tokens,
+                'cached_tokens': self._cached_tokens,
+                'completion_tokens': self._completion_tokens,
+            }
+
+    def shutdown(self):
+        loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        if self._client is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self._client.close(), loop).result(timeout=5)
+            except Exception as e:
+                logger.warning(f"Не удалось закрыть клиент OpenAI: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout=5)
+        self._client = None
+        self._limiter = None
+
+
+# ===== ОБЩИЙ ЭКЗЕМПЛЯР =====
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway(api_key: str = None) -> LLMGateway:
+    """Шлюз процесса (создаётся при первом обращении с ключом api_key или OPENAI_API_KEY)"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway(api_key)
+    return _gateway
+
+
+async def complete(messages: list, api_key: str = None, **kwargs) -> str:
+    """
+    Ответ OpenAI через общий шлюз (model, max_tokens, temperature, priority, label,
+    max_attempts, on_first_token - вызывается из потока шлюза)
+    """
+    return await get_gateway(api_key).complete(messages, **kwargs)
+
+
+async def complete_detailed(messages: list, api_key: str = None, **kwargs) -> dict:
+    """Как complete, но с токенами (промпт, из кэша, ответ) и задержками запроса"""
+    return await get_gateway(api_key).complete_detailed(messages, **kwargs)
+
+
+def get_llm_gateway_stats() -> dict:
+    """Метрики шлюза для /health"""
+    return get_gateway().stats()
+
+
+def shutdown_gateway():
+    if _gateway is not None:
+        _gateway.shutdown()
+
+
+atexit.register(shutdown_gateway)
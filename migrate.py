@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Применение миграций схемы БД (см. пакет migrations).
+
+Запускается при деплое перед стартом бота:
+
+    python migrate.py               # применить все новые миграции
+    python migrate.py --status      # текущая версия и ожидающие миграции
+    python migrate.py --target 2    # применить миграции до версии 2 включительно
+"""
+
+import logging
+import sys
+
+from db_pool import close_pool
+from migrations import get_migrations, get_schema_version, migrate
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+
+
+def print_status():
+    current = get_schema_version()
+    print(f"Текущая версия схемы: {current}")
+    pending = [(version, name) for version, name, _ in get_migrations() if version > current]
+    if not pending:
+        print("✅ Схема актуальна, новых миграций нет")
+        return
+    print(f"Ожидают применения ({len(pending)}):")
+    for version, name in pending:
+        print(f"  {version:04d}_{name}")
+
+
+if __name__ == '__main__':
+    try:
+        if len(sys.argv) > 1 and sys.argv[1] == '--status':
+            print_status()
+        elif len(sys.argv) > 2 and sys.argv[1] == '--target':
+            applied = migrate(target=int(sys.argv[2]))
+            print(f"✅ Применено миграций: {len(applied)}, версия схемы: {get_schema_version()}")
+        elif len(sys.argv) == 1:
+            applied = migrate()
+            print(f"✅ Применено миграций: {len(applied)}, версия схемы: {get_schema_version()}")
+        else:
+            print("Использование:")
+            print("  python migrate.py")
+            print("  python migrate.py --status")
+            print("  python migrate.py --target <version>")
+            sys.exit(1)
+    except Exception as e:
+        print(f"❌ Ошибка миграции: {e}")
+        sys.exit(1)
+    finally:
+        close_pool()
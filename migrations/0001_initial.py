@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Базовая схема: таблицы users, events, payments и индексы events.
+
+Раньше эти таблицы создавал init_db() при каждом запуске. CREATE TABLE IF NOT EXISTS
+оставлен, чтобы миграция безопасно применялась к уже существующим БД.
+"""
+
+
+def upgrade(cursor, db_type):
+    if db_type == 'postgresql':
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id BIGINT PRIMARY KEY,
+                first_name TEXT,
+                last_name TEXT,
+                country TEXT,
+                city TEXT,
+                birth_date TEXT,
+                birth_time TEXT,
+                updated_at TEXT,
+                has_paid INTEGER DEFAULT 0,
+                birth_place TEXT
+            )
+        ''')
+
+        # Таблица для аналитики событий
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS events (
+                id SERIAL PRIMARY KEY,
+                user_id BIGINT,
+                event_type TEXT NOT NULL,
+                event_data TEXT,
+                timestamp TEXT NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            )
+        ''')
+
+        # Таблица для платежей (ЮKassa)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS payments (
+                id SERIAL PRIMARY KEY,
+                user_id BIGINT NOT NULL,
+                yookassa_payment_id TEXT UNIQUE,
+                internal_payment_id TEXT UNIQUE,
+                amount REAL NOT NULL,
+                status TEXT DEFAULT 'pending',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            )
+        ''')
+    else:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                first_name TEXT,
+                last_name TEXT,
+                country TEXT,
+                city TEXT,
+                birth_date TEXT,
+                birth_time TEXT,
+                updated_at TEXT,
+                has_paid INTEGER DEFAULT 0,
+                birth_place TEXT
+            )
+        ''')
+
+        # Таблица для аналитики событий
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                event_type TEXT NOT NULL,
+                event_data TEXT,
+                timestamp TEXT NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            )
+        ''')
+
+        # Таблица для платежей (ЮKassa)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS payments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                yookassa_payment_id TEXT UNIQUE,
+                internal_payment_id TEXT UNIQUE,
+                amount REAL NOT NULL,
+                status TEXT DEFAULT 'pending',
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            )
+        ''')
+
+    # Индексы (одинаковые для обеих БД)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_user_id ON events(user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_type ON events(event_type)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events(timestamp)')
@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Колонки users, добавленные после первой версии: birth_place, has_paid, username.
+
+Заменяет проверки information_schema / неудачные ALTER в init_db() и скрипт
+migrate_add_username.py. На БД, где колонки уже есть, ничего не делает.
+"""
+
+from migrations import column_exists
+
+COLUMNS = [
+    ('birth_place', 'TEXT'),
+    ('has_paid', 'INTEGER DEFAULT 0'),
+    ('username', 'TEXT'),
+]
+
+
+def upgrade(cursor, db_type):
+    for column, definition in COLUMNS:
+        if not column_exists(cursor, db_type, 'users', column):
+            cursor.execute(f'ALTER TABLE users ADD COLUMN {column} {definition}')
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Типизированные метки времени и индексы под горячие запросы events и payments.
+
+PostgreSQL:
+    events.timestamp TEXT -> TIMESTAMPTZ (строки без часового пояса считаются UTC,
+    как и раньше в скриптах воронки), payments.created_at/updated_at TIMESTAMP -> TIMESTAMPTZ.
+    Фильтры по времени теперь сравнивают саму колонку, без приведения типов,
+    поэтому индексы по timestamp используются.
+
+Индексы (обе БД):
+    events(event_type, timestamp)           - воронка по дням
+    events(user_id, event_type, timestamp)  - события пользователя, payment_success
+    payments(user_id, status, created_at)   - последний (ожидающий) платёж пользователя
+    payments(created_at) WHERE pending      - периодическая проверка ожидающих платежей
+
+idx_events_user_id и idx_events_type удаляются: они являются префиксами новых индексов.
+"""
+
+# Строки с явным смещением ('Z', '+03:00') приводим как есть, остальные считаем UTC
+EVENTS_TIMESTAMP_USING = r"""
+    CASE
+        WHEN timestamp ~ '(Z|[+-]\d{2}:?\d{2})$' THEN timestamp::timestamptz
+        ELSE timestamp::timestamp AT TIME ZONE 'UTC'
+    END
+"""
+
+
+def upgrade(cursor, db_type):
+    if db_type == 'postgresql':
+        cursor.execute(f'ALTER TABLE events ALTER COLUMN timestamp TYPE TIMESTAMPTZ USING {EVENTS_TIMESTAMP_USING}')
+        cursor.execute('''
+            ALTER TABLE payments
+                ALTER COLUMN created_at TYPE TIMESTAMPTZ USING created_at AT TIME ZONE 'UTC',
+                ALTER COLUMN updated_at TYPE TIMESTAMPTZ USING updated_at AT TIME ZONE 'UTC'
+        ''')
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_type_timestamp ON events(event_type, timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_user_type_timestamp ON events(user_id, event_type, timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_payments_user_status_created ON payments(user_id, status, created_at)')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_pending_created ON payments(created_at) WHERE status = 'pending'")
+
+    cursor.execute('DROP INDEX IF EXISTS idx_events_user_id')
+    cursor.execute('DROP INDEX IF EXISTS idx_events_type')
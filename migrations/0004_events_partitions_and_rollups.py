@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Месячные партиции events (PostgreSQL) и таблицы дневных агрегатов (обе БД).
+
+PostgreSQL: events пересоздаётся как PARTITION BY RANGE (timestamp) с партициями
+events_YYYY_MM от первого месяца с событиями до текущего + 2, и events_default
+для строк вне диапазона. Данные копируются, последовательность id сохраняется.
+Первичный ключ секционированной таблицы обязан включать ключ секционирования,
+поэтому он становится (id, timestamp).
+
+Агрегаты за историю заполняются отдельно: python events_maintenance.py --backfill
+"""
+
+from datetime import date, datetime, timedelta, timezone
+
+
+def _next_month(month: date) -> date:
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _partition_events(cursor):
+    # Индексы старой таблицы освобождают имена для индексов новой
+    for index in ('idx_events_type_timestamp', 'idx_events_user_type_timestamp', 'idx_events_timestamp'):
+        cursor.execute(f'DROP INDEX IF EXISTS {index}')
+    cursor.execute('ALTER TABLE events RENAME TO events_unpartitioned')
+    cursor.execute('ALTER TABLE events_unpartitioned RENAME CONSTRAINT events_pkey TO events_unpartitioned_pkey')
+
+    cursor.execute('ALTER SEQUENCE events_id_seq AS BIGINT')
+    cursor.execute('''
+        CREATE TABLE events (
+            id BIGINT NOT NULL DEFAULT nextval('events_id_seq'),
+            user_id BIGINT REFERENCES users(user_id),
+            event_type TEXT NOT NULL,
+            event_data TEXT,
+            timestamp TIMESTAMPTZ NOT NULL,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    ''')
+    cursor.execute('ALTER SEQUENCE events_id_seq OWNED BY events.id')
+    cursor.execute('CREATE TABLE events_default PARTITION OF events DEFAULT')
+
+    cursor.execute("SELECT MIN(timestamp AT TIME ZONE 'UTC') FROM events_unpartitioned")
+    first = cursor.fetchone()[0]
+    today = datetime.now(timezone.utc).date()
+    month = (first.date() if first else today).replace(day=1)
+    last = _next_month(_next_month(today.replace(day=1)))
+    while month <= last:
+        cursor.execute(f'''
+            CREATE TABLE events_{month.year:04d}_{month.month:02d} PARTITION OF events
+            FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{_next_month(month).isoformat()} 00:00:00+00')
+        ''')
+        month = _next_month(month)
+
+    cursor.execute('CREATE INDEX idx_events_timestamp ON events(timestamp)')
+    cursor.execute('CREATE INDEX idx_events_type_timestamp ON events(event_type, timestamp)')
+    cursor.execute('CREATE INDEX idx_events_user_type_timestamp ON events(user_id, event_type, timestamp)')
+
+    cursor.execute('''
+        INSERT INTO events (id, user_id, event_type, event_data, timestamp)
+        SELECT id, user_id, event_type, event_data, timestamp FROM events_unpartitioned
+    ''')
+    cursor.execute('DROP TABLE events_unpartitioned')
+
+
+def upgrade(cursor, db_type):
+    if db_type == 'postgresql':
+        _partition_events(cursor)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS event_daily_rollups (
+                day DATE NOT NULL,
+                event_type TEXT NOT NULL,
+                events_count INTEGER NOT NULL,
+                unique_users INTEGER NOT NULL,
+                amount_total NUMERIC NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, event_type)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS event_daily_users (
+                day DATE NOT NULL,
+                event_type TEXT NOT NULL,
+                user_id BIGINT NOT NULL,
+                PRIMARY KEY (day, event_type, user_id)
+            )
+        ''')
+    else:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS event_daily_rollups (
+                day TEXT NOT NULL,
+                event_type TEXT NOT NULL,
+                events_count INTEGER NOT NULL,
+                unique_users INTEGER NOT NULL,
+                amount_total REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, event_type)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS event_daily_users (
+                day TEXT NOT NULL,
+                event_type TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                PRIMARY KEY (day, event_type, user_id)
+            )
+        ''')
+
+    # Уникальные пользователи по типу события за период
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_event_daily_users_type_day ON event_daily_users(event_type, day)')
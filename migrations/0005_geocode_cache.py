@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Таблица geocode_cache - кэш геокодирования мест рождения (см. geocode_cache.py).
+
+Ключ - нормализованная строка места. found = false означает, что геокодер место
+не нашёл (отрицательный кэш, живёт меньше). timezone заполняется, только если
+таймзона однозначна (в стране одна таймзона); иначе она выбирается по
+country_code и дате рождения без запроса к геокодеру.
+"""
+
+
+def upgrade(cursor, db_type):
+    if db_type == 'postgresql':
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS geocode_cache (
+                place_key TEXT PRIMARY KEY,
+                place TEXT NOT NULL,
+                found BOOLEAN NOT NULL,
+                latitude DOUBLE PRECISION,
+                longitude DOUBLE PRECISION,
+                country_code TEXT,
+                timezone TEXT,
+                expires_at TIMESTAMPTZ NOT NULL,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+        ''')
+    else:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS geocode_cache (
+                place_key TEXT PRIMARY KEY,
+                place TEXT NOT NULL,
+                found INTEGER NOT NULL,
+                latitude REAL,
+                longitude REAL,
+                country_code TEXT,
+                timezone TEXT,
+                expires_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        ''')
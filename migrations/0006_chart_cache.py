@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Таблица chart_cache - рассчитанные натальные карты (см. chart_cache.py).
+
+chart_key - версия расчёта, локальные дата и время рождения, координаты,
+таймзона и система домов; birth_key - дата, время и нормализованное место в
+том виде, как их ввёл пользователь (по нему повторный расчёт не геокодирует место).
+"""
+
+
+def upgrade(cursor, db_type):
+    if db_type == 'postgresql':
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chart_cache (
+                chart_key TEXT PRIMARY KEY,
+                birth_key TEXT NOT NULL,
+                chart_data TEXT NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+        ''')
+    else:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chart_cache (
+                chart_key TEXT PRIMARY KEY,
+                birth_key TEXT NOT NULL,
+                chart_data TEXT NOT NULL,
+                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chart_cache_birth_key ON chart_cache(birth_key)')
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Таблица generation_jobs - очередь генераций натальной карты (см. generation_queue.py).
+
+state - стадия задания: queued -> computing -> llm -> rendering -> delivering -> done
+(или failed). stage_data - JSON с результатами пройденных стадий (текст отчёта,
+путь к PDF), по ним задание продолжается после перезапуска. lease_owner и
+lease_expires_at - аренда воркера: задание с истёкшей арендой забирает другой воркер.
+
+Индексы (обе БД, частичные - только по незавершённым заданиям):
+    generation_jobs(user_id)          - не больше одного активного задания на пользователя
+    generation_jobs(priority, job_id) - выбор следующего задания воркером
+"""
+
+
+def upgrade(cursor, db_type):
+    if db_type == 'postgresql':
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS generation_jobs (
+                job_id BIGSERIAL PRIMARY KEY,
+                user_id BIGINT NOT NULL,
+                chat_id BIGINT NOT NULL,
+                message_id BIGINT,
+                birth_data TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 1,
+                state TEXT NOT NULL DEFAULT 'queued',
+                stage_data TEXT NOT NULL DEFAULT '{}',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires_at TIMESTAMPTZ,
+                error TEXT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                finished_at TIMESTAMPTZ
+            )
+        ''')
+    else:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS generation_jobs (
+                job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                chat_id INTEGER NOT NULL,
+                message_id INTEGER,
+                birth_data TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 1,
+                state TEXT NOT NULL DEFAULT 'queued',
+                stage_data TEXT NOT NULL DEFAULT '{}',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires_at TEXT,
+                error TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                finished_at TEXT
+            )
+        ''')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_generation_jobs_active_user
+        ON generation_jobs(user_id) WHERE state NOT IN ('done', 'failed')
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_generation_jobs_claim
+        ON generation_jobs(priority, job_id) WHERE state NOT IN ('done', 'failed')
+    ''')
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Таблица report_section_checkpoints - готовые разделы отчёта (см. report_checkpoints.py).
+
+Ключ - пользователь, хэш карты (данные рождения и рассчитанная карта в промпте),
+версия промпта и номер раздела. Повторная генерация того же отчёта (кнопка
+"Попробовать снова" или продолженное задание очереди) запрашивает у OpenAI только
+недостающие разделы. Записи живут до expires_at и удаляются периодической очисткой.
+
+Индексы (обе БД):
+    report_section_checkpoints(expires_at) - удаление просроченных разделов
+"""
+
+
+def upgrade(cursor, db_type):
+    if db_type == 'postgresql':
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS report_section_checkpoints (
+                user_id BIGINT NOT NULL,
+                chart_hash TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                section INTEGER NOT NULL,
+                markdown TEXT NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                expires_at TIMESTAMPTZ NOT NULL,
+                PRIMARY KEY (user_id, chart_hash, prompt_version, section)
+            )
+        ''')
+    else:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS report_section_checkpoints (
+                user_id INTEGER NOT NULL,
+                chart_hash TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                section INTEGER NOT NULL,
+                markdown TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                expires_at TEXT NOT NULL,
+                PRIMARY KEY (user_id, chart_hash, prompt_version, section)
+            )
+        ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_report_section_checkpoints_expires
+        ON report_section_checkpoints(expires_at)
+    ''')
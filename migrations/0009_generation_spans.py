@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Таблица generation_spans - тайминги стадий генерации натальной карты (см. generation_spans.py).
+
+Одна строка - одна стадия задания очереди (generation_jobs.job_id): длительность,
+успех и метрики запроса к OpenAI для разделов отчёта (section, ожидание в очереди
+шлюза, первый токен, токены). Отчёт по перцентилям - view_generation_timings.py.
+
+Индексы (обе БД):
+    generation_spans(started_at) - выборка за период для отчёта
+    generation_spans(job_id)     - стадии одного задания
+"""
+
+
+def upgrade(cursor, db_type):
+    if db_type == 'postgresql':
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS generation_spans (
+                span_id BIGSERIAL PRIMARY KEY,
+                job_id BIGINT NOT NULL,
+                user_id BIGINT NOT NULL,
+                stage TEXT NOT NULL,
+                section INTEGER,
+                started_at TIMESTAMPTZ NOT NULL,
+                duration_seconds DOUBLE PRECISION NOT NULL,
+                ok BOOLEAN NOT NULL,
+                queue_seconds DOUBLE PRECISION,
+                first_token_seconds DOUBLE PRECISION,
+                prompt_tokens INTEGER,
+                cached_tokens INTEGER,
+                completion_tokens INTEGER
+            )
+        ''')
+    else:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS generation_spans (
+                span_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                stage TEXT NOT NULL,
+                section INTEGER,
+                started_at TEXT NOT NULL,
+                duration_seconds REAL NOT NULL,
+                ok INTEGER NOT NULL,
+                queue_seconds REAL,
+                first_token_seconds REAL,
+                prompt_tokens INTEGER,
+                cached_tokens INTEGER,
+                completion_tokens INTEGER
+            )
+        ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_generation_spans_started_at ON generation_spans(started_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_generation_spans_job ON generation_spans(job_id)')
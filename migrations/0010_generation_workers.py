@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Таблица generation_workers - процессы с воркерами очереди генераций (см. generation_queue.py).
+
+Одна строка - один запущенный пул воркеров (бот или astral_worker): seen_at
+обновляется каждые GENERATION_JOB_HEARTBEAT секунд, при штатной остановке строка
+удаляется. Бот с GENERATION_IN_BOT=0 по ней проверяет, что задания из очереди
+кто-то разбирает.
+"""
+
+
+def upgrade(cursor, db_type):
+    if db_type == 'postgresql':
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS generation_workers (
+                worker_id TEXT PRIMARY KEY,
+                started_at TIMESTAMPTZ NOT NULL,
+                seen_at TIMESTAMPTZ NOT NULL
+            )
+        ''')
+    else:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS generation_workers (
+                worker_id TEXT PRIMARY KEY,
+                started_at TEXT NOT NULL,
+                seen_at TEXT NOT NULL
+            )
+        ''')
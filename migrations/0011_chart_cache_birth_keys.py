@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Первичный ключ chart_cache - (chart_key, birth_key) вместо chart_key.
+
+Разные написания одних данных рождения дают один chart_key. С ключом по
+chart_key запись второго написания перезаписывала birth_key первого, и
+invalidate_birth по первому написанию (save_user_profile) ничего не находил в
+БД - устаревшая карта оставалась. Теперь у каждого написания своя строка.
+
+Индексы (обе БД):
+    chart_cache(chart_key, birth_key) - первичный ключ, чтение по chart_key
+    chart_cache(birth_key)            - lookup_birth и invalidate_birth (из 0006)
+"""
+
+
+def upgrade(cursor, db_type):
+    if db_type == 'postgresql':
+        cursor.execute('ALTER TABLE chart_cache DROP CONSTRAINT IF EXISTS chart_cache_pkey')
+        cursor.execute('ALTER TABLE chart_cache ADD PRIMARY KEY (chart_key, birth_key)')
+        return
+
+    # SQLite не меняет первичный ключ - таблица пересоздаётся
+    cursor.execute('''
+        CREATE TABLE chart_cache_new (
+            chart_key TEXT NOT NULL,
+            birth_key TEXT NOT NULL,
+            chart_data TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (chart_key, birth_key)
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO chart_cache_new (chart_key, birth_key, chart_data, created_at)
+        SELECT chart_key, birth_key, chart_data, created_at FROM chart_cache
+    ''')
+    cursor.execute('DROP TABLE chart_cache')
+    cursor.execute('ALTER TABLE chart_cache_new RENAME TO chart_cache')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chart_cache_birth_key ON chart_cache(birth_key)')
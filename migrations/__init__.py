@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Версионированные миграции схемы БД (PostgreSQL и SQLite).
+
+Каждая миграция - модуль NNNN_описание.py в этом пакете с функцией
+upgrade(cursor, db_type). Номер миграции берётся из имени файла, применённые
+версии записываются в таблицу schema_version. Миграции применяются по порядку,
+каждая в своей транзакции.
+
+Применять миграции нужно при деплое:
+
+    python migrate.py           # применить все новые миграции
+    python migrate.py --status  # текущая версия и список ожидающих миграций
+
+При запуске бота вызывается ensure_schema(): один запрос версии и никакого DDL,
+если схема актуальна. Если миграции не применены (локальный запуск, деплой без
+шага миграции), они применяются при старте.
+"""
+
+import importlib
+import logging
+import os
+import pkgutil
+import re
+from datetime import datetime
+
+from db_pool import db_connection
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки PostgreSQL: несколько реплик не применяют миграции одновременно
+MIGRATION_LOCK_ID = 74291501
+
+_MIGRATION_NAME = re.compile(r'^(\d{4})_(\w+)$')
+_migrations = None
+
+
+def column_exists(cursor, db_type: str, table: str, column: str) -> bool:
+    """Есть ли колонка в таблице (для миграций, которые должны работать на старых БД)"""
+    if db_type == 'postgresql':
+        cursor.execute(
+            "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = %s",
+            (table, column)
+        )
+        return cursor.fetchone() is not None
+    cursor.execute(f"PRAGMA table_info({table})")
+    return any(row[1] == column for row in cursor.fetchall())
+
+
+def get_migrations() -> list:
+    """Список миграций пакета, отсортированный по версии: [(version, name, module)]"""
+    global _migrations
+    if _migrations is None:
+        found = []
+        for module_info in pkgutil.iter_modules([os.path.dirname(__file__)]):
+            match = _MIGRATION_NAME.match(module_info.name)
+            if not match:
+                continue
+            module = importlib.import_module(f'{__name__}.{module_info.name}')
+            found.append((int(match.group(1)), match.group(2), module))
+        found.sort(key=lambda m: m[0])
+        versions = [m[0] for m in found]
+        if len(versions) != len(set(versions)):
+            raise RuntimeError(f"Повторяющиеся номера миграций: {versions}")
+        _migrations = found
+    return _migrations
+
+
+def latest_version() -> int:
+    """Номер последней миграции в пакете"""
+    migrations = get_migrations()
+    return migrations[-1][0] if migrations else 0
+
+
+def _current_version(conn, cursor) -> int:
+    """Текущая версия схемы (0, если таблицы schema_version ещё нет)"""
+    try:
+        cursor.execute('SELECT MAX(version) FROM schema_version')
+        row = cursor.fetchone()
+        return (row[0] or 0) if row else 0
+    except Exception:
+        conn.rollback()
+        return 0
+
+
+def get_schema_version() -> int:
+    """Текущая версия схемы в БД"""
+    with db_connection() as (conn, db_type):
+        return _current_version(conn, conn.cursor())
+
+
+def migrate(target: int = None) -> list:
+    """
+    Применяет все миграции новее текущей версии (или до target включительно).
+
+    Возвращает список применённых версий.
+    """
+    target = latest_version() if target is None else target
+    applied = []
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        if db_type == 'postgresql':
+            cursor.execute('SELECT pg_advisory_lock(%s)', (MIGRATION_LOCK_ID,))
+        try:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TEXT NOT NULL
+                )
+            ''')
+            conn.commit()
+
+            current = _current_version(conn, cursor)
+            for version, name, module in get_migrations():
+                if version <= current or version > target:
+                    continue
+                logger.info(f"🔄 Применяем миграцию {version:04d}_{name} ({db_type})...")
+                try:
+                    module.upgrade(cursor, db_type)
+                    if db_type == 'postgresql':
+                        cursor.execute(
+                            'INSERT INTO schema_version (version, name, applied_at) VALUES (%s, %s, %s)',
+                            (version, name, datetime.now().isoformat())
+                        )
+                    else:
+                        cursor.execute(
+                            'INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)',
+                            (version, name, datetime.now().isoformat())
+                        )
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    logger.error(f"❌ Ошибка миграции {version:04d}_{name}: {e}", exc_info=True)
+                    raise
+                applied.append(version)
+                logger.info(f"✅ Миграция {version:04d}_{name} применена")
+        finally:
+            if db_type == 'postgresql':
+                cursor.execute('SELECT pg_advisory_unlock(%s)', (MIGRATION_LOCK_ID,))
+                conn.commit()
+    return applied
+
+
+def ensure_schema():
+    """Проверка схемы при запуске бота: один SELECT, если схема актуальна"""
+    current = get_schema_version()
+    latest = latest_version()
+    if current >= latest:
+        logger.info(f"✅ Схема БД актуальна (версия {current})")
+        return
+    logger.warning(f"⚠️ Схема БД устарела (версия {current}, последняя {latest}) - применяем миграции при запуске")
+    migrate()
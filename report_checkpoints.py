@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Контрольные точки генерации отчёта: готовые разделы в таблице report_section_checkpoints.
+
+Отчёт состоит из семи разделов, каждый - отдельный запрос к OpenAI. Если один
+раздел упал или не уложился в таймаут, раньше весь отчёт выбрасывался и
+"Попробовать снова" генерировал все семь разделов заново. Теперь каждый готовый
+раздел сохраняется сразу, а повторная генерация запрашивает только недостающие.
+
+Ключ раздела:
+    user_id         - чей отчёт
+    chart_hash      - хэш общей части промпта (данные рождения и рассчитанная карта):
+                      другие данные рождения - другой отчёт
+    prompt_version  - хэш заданий и примеров разделов, модели и параметров
+                      + REPORT_PROMPT_VERSION: после изменения промпта старые разделы
+                      перестают совпадать по ключу
+    section         - номер раздела
+
+После доставки полного отчёта разделы пользователя удаляются (discard) - новая
+оплата даёт новый отчёт. Разделы недоставленных отчётов живут
+REPORT_CHECKPOINT_TTL_HOURS и удаляются периодической очисткой (start_cleanup -
+в процессе, где работают воркеры генераций).
+
+Настройки (переменные окружения):
+    REPORT_CHECKPOINT_TTL_HOURS         - срок жизни готового раздела, часы (по умолчанию 72, 0 - не сохранять)
+    REPORT_CHECKPOINT_CLEANUP_INTERVAL  - период очистки просроченных разделов, секунды (по умолчанию 3600)
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from db_pool import db_connection
+
+logger = logging.getLogger(__name__)
+
+REPORT_CHECKPOINT_TTL_HOURS = float(os.getenv('REPORT_CHECKPOINT_TTL_HOURS', '72'))
+REPORT_CHECKPOINT_CLEANUP_INTERVAL = float(os.getenv('REPORT_CHECKPOINT_CLEANUP_INTERVAL', '3600'))
+
+# Версия обработки ответа: увеличить при изменении того, что не попадает в промпт
+# (очистка текста раздела, заголовки), чтобы старые разделы не переиспользовались
+REPORT_PROMPT_VERSION = 1
+
+_stats_lock = threading.Lock()
+_reused = 0
+_saved = 0
+_purged = 0
+_cleanup_task = None
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+
+
+def chart_hash(common_prompt: str) -> str:
+    """Хэш общей части промпта (данные рождения + рассчитанная карта)"""
+    return _digest(common_prompt)
+
+
+def prompt_version(*prompt_parts) -> str:
+    """Версия промпта разделов: REPORT_PROMPT_VERSION и хэш заданий, примеров и параметров модели"""
+    return f"v{REPORT_PROMPT_VERSION}:{_digest(prompt_parts)}"
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _to_db_time(value: datetime, db_type: str):
+    """TIMESTAMPTZ для PostgreSQL, ISO-строка UTC без часового пояса для SQLite"""
+    if db_type == 'postgresql':
+        return value
+    return value.replace(tzinfo=None).isoformat()
+
+
+# ===== РАЗДЕЛЫ =====
+
+def load(user_id: int, chart_hash: str, prompt_version: str) -> dict:
+    """Непросроченные готовые разделы отчёта: {номер раздела: markdown}"""
+    if REPORT_CHECKPOINT_TTL_HOURS <= 0:
+        return {}
+    global _reused
+    try:
+        with db_connection() as (conn, db_type):
+            cursor = conn.cursor()
+            ph = '%s' if db_type == 'postgresql' else '?'
+            cursor.execute(f'''
+                SELECT section, markdown FROM report_section_checkpoints
+                WHERE user_id = {ph} AND chart_hash = {ph} AND prompt_version = {ph} AND expires_at > {ph}
+            ''', (user_id, chart_hash, prompt_version, _to_db_time(_utcnow(), db_type)))
+            sections = {row[0]: row[1] for row in cursor.fetchall()}
+    except Exception as e:
+        logger.error(f"❌ Ошибка чтения готовых разделов отчёта пользователя {user_id}: {e}", exc_info=True)
+        return {}
+    with _stats_lock:
+        _reused += len(sections)
+    return sections
+
+
+def save(user_id: int, chart_hash: str, prompt_version: str, section: int, markdown: str):
+    """Сохраняет готовый раздел; ошибка записи не прерывает генерацию"""
+    if REPORT_CHECKPOINT_TTL_HOURS <= 0:
+        return
+    global _saved
+    now = _utcnow()
+    expires_at = now + timedelta(hours=REPORT_CHECKPOINT_TTL_HOURS)
+    try:
+        with db_connection() as (conn, db_type):
+            cursor = conn.cursor()
+            ph = '%s' if db_type == 'postgresql' else '?'
+            cursor.execute(f'''
+                INSERT INTO report_section_checkpoints
+                    (user_id, chart_hash, prompt_version, section, markdown, created_at, expires_at)
+                VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph})
+                ON CONFLICT (user_id, chart_hash, prompt_version, section) DO UPDATE SET
+                    markdown = excluded.markdown,
+                    created_at = excluded.created_at,
+                    expires_at = excluded.expires_at
+            ''', (user_id, chart_hash, prompt_version, section, markdown,
+                  _to_db_time(now, db_type), _to_db_time(expires_at, db_type)))
+            conn.commit()
+    except Exception as e:
+        logger.error(f"❌ Ошибка записи раздела {section} отчёта пользователя {user_id}: {e}", exc_info=True)
+        return
+    with _stats_lock:
+        _saved += 1
+
+
+def discard(user_id: int) -> int:
+    """Удаляет разделы пользователя (отчёт доставлен); возвращает число удалённых"""
+    try:
+        with db_connection() as (conn, db_type):
+            cursor = conn.cursor()
+            ph = '%s' if db_type == 'postgresql' else '?'
+            cursor.execute(f'DELETE FROM report_section_checkpoints WHERE user_id = {ph}', (user_id,))
+            conn.commit()
+            return cursor.rowcount
+    except Exception as e:
+        logger.error(f"❌ Ошибка удаления разделов отчёта пользователя {user_id}: {e}", exc_info=True)
+        return 0
+
+
+# ===== ОЧИСТКА =====
+
+def purge_expired() -> int:
+    """Удаляет просроченные разделы; возвращает число удалённых"""
+    global _purged
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        ph = '%s' if db_type == 'postgresql' else '?'
+        cursor.execute(f'DELETE FROM report_section_checkpoints WHERE expires_at <= {ph}',
+                       (_to_db_time(_utcnow(), db_type),))
+        conn.commit()
+        deleted = cursor.rowcount
+    with _stats_lock:
+        _purged += deleted
+    if deleted:
+        logger.info(f"🧹 Удалено просроченных разделов отчётов: {deleted}")
+    return deleted
+
+
+async def cleanup_periodically():
+    """Периодическая очистка просроченных разделов"""
+    while True:
+        try:
+            await asyncio.to_thread(purge_expired)
+        except Exception as e:
+            logger.error(f"❌ Ошибка очистки разделов отчётов: {e}", exc_info=True)
+        await asyncio.sleep(REPORT_CHECKPOINT_CLEANUP_INTERVAL)
+
+
+def start_cleanup():
+    """Запускает очистку в текущем event loop (одна задача на процесс)"""
+    global _cleanup_task
+    if _cleanup_task is None and REPORT_CHECKPOINT_CLEANUP_INTERVAL > 0:
+        _cleanup_task = asyncio.create_task(cleanup_periodically())
+
+
+async def stop_cleanup():
+    global _cleanup_task
+    if _cleanup_task is not None:
+        task, _cleanup_task = _cleanup_task, None
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+def get_report_checkpoint_stats() -> dict:
+    """Метрики для /health"""
+    with _stats_lock:
+        return {
+            'reused_sections': _reused,
+            'saved_sections': _saved,
+            'purged_sections': _purged,
+        }
@@ -0,0 +1,976 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Репозиторий: функции доступа к таблицам users, events, payments и generation_jobs.
+
+Все функции синхронные и берут соединение из общего пула (см. db_pool.py).
+Из асинхронных обработчиков их нужно вызывать через async_repository,
+чтобы запросы к БД не блокировали event loop.
+"""
+
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from psycopg2.extras import execute_values
+
+import chart_cache
+from db_pool import db_connection
+from event_buffer import EventBuffer
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Кэш нормализованных профилей (результат load_user_profile) по user_id.
+# Запись в users через функции этого модуля обновляет или сбрасывает кэш;
+# TTL ограничивает устаревание при изменениях из внешних скриптов.
+PROFILE_CACHE_MAX_SIZE = int(os.getenv('PROFILE_CACHE_MAX_SIZE', '5000'))
+PROFILE_CACHE_TTL = float(os.getenv('PROFILE_CACHE_TTL', '300'))
+_profile_cache = TTLCache(PROFILE_CACHE_MAX_SIZE, PROFILE_CACHE_TTL)
+
+
+# ===== ПОЛЬЗОВАТЕЛИ =====
+
+# Никнеймы с бесплатной генерацией (не списываем плату)
+FREE_GENERATION_USERNAMES = {'nina_swan'}
+
+
+def save_user_profile(user_id, user_data):
+    """Сохранение профиля пользователя в базу данных"""
+    cache_version = _profile_cache.version(user_id)
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+
+        # Сначала загружаем текущие данные пользователя, чтобы не потерять существующие поля
+        if db_type == 'postgresql':
+            cursor.execute('SELECT first_name, birth_date, birth_time, birth_place, has_paid FROM users WHERE user_id = %s', (user_id,))
+            row = cursor.fetchone()
+            if row:
+                current_data = {
+                    'first_name': row[0] or '',
+                    'birth_date': row[1] or '',
+                    'birth_time': row[2] or '',
+                    'birth_place': row[3] or '',
+                    'has_paid': row[4] or 0
+                }
+            else:
+                current_data = {}
+        else:
+            # Для SQLite используем явный список колонок
+            cursor.execute('SELECT first_name, birth_date, birth_time, birth_place, has_paid FROM users WHERE user_id = ?', (user_id,))
+            row = cursor.fetchone()
+            if row:
+                current_data = {
+                    'first_name': row[0] or '',
+                    'birth_date': row[1] or '',
+                    'birth_time': row[2] or '',
+                    'birth_place': row[3] or '',
+                    'has_paid': row[4] or 0
+                }
+            else:
+                current_data = {}
+
+        # Объединяем текущие данные с новыми (новые данные имеют приоритет)
+        # Обновляем только те поля, которые переданы в user_data
+        merged_data = {
+            'first_name': user_data.get('birth_name') if 'birth_name' in user_data else current_data.get('first_name', ''),
+            'birth_date': user_data.get('birth_date') if 'birth_date' in user_data else current_data.get('birth_date', ''),
+            'birth_time': user_data.get('birth_time') if 'birth_time' in user_data else current_data.get('birth_time', ''),
+            'birth_place': user_data.get('birth_place') if 'birth_place' in user_data else current_data.get('birth_place', ''),
+            'has_paid': current_data.get('has_paid', 0)
+        }
+
+        # Обрабатываем место рождения (разделяем на city и country)
+        birth_place = merged_data.get('birth_place', '')
+        if ',' in birth_place:
+            parts = birth_place.split(',')
+            city = parts[0].strip()
+            country = ','.join(parts[1:]).strip() if len(parts) > 1 else ''
+        else:
+            city = birth_place
+            country = ''
+
+        # Сохраняем профиль (не трогаем username, он обновляется отдельно через save_user_username)
+        if db_type == 'postgresql':
+            cursor.execute('''
+                INSERT INTO users 
+                (user_id, first_name, country, city, birth_date, birth_time, birth_place, has_paid, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    first_name = EXCLUDED.first_name,
+                    country = EXCLUDED.country,
+                    city = EXCLUDED.city,
+                    birth_date = EXCLUDED.birth_date,
+                    birth_time = EXCLUDED.birth_time,
+                    birth_place = EXCLUDED.birth_place,
+                    updated_at = EXCLUDED.updated_at
+            ''', (
+                user_id,
+                merged_data['first_name'],
+                country,
+                city,
+                merged_data['birth_date'],
+                merged_data['birth_time'],
+                birth_place,
+                merged_data['has_paid'],
+                datetime.now().isoformat()
+            ))
+        else:
+            cursor.execute('''
+                INSERT INTO users 
+                (user_id, first_name, country, city, birth_date, birth_time, birth_place, has_paid, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    first_name = excluded.first_name,
+                    country = excluded.country,
+                    city = excluded.city,
+                    birth_date = excluded.birth_date,
+                    birth_time = excluded.birth_time,
+                    birth_place = excluded.birth_place,
+                    updated_at = excluded.updated_at
+            ''', (
+                user_id,
+                merged_data['first_name'],
+                country,
+                city,
+                merged_data['birth_date'],
+                merged_data['birth_time'],
+                birth_place,
+                merged_data['has_paid'],
+                datetime.now().isoformat()
+            ))
+        conn.commit()
+    
+    # Данные рождения изменились - рассчитанная по старым данным карта больше не нужна
+    birth_fields = ('birth_date', 'birth_time', 'birth_place')
+    if current_data and any(current_data.get(f) != merged_data.get(f) for f in birth_fields):
+        chart_cache.invalidate_birth(current_data['birth_date'], current_data['birth_time'], current_data['birth_place'])
+    
+    # Обновляем кэш профиля теми же данными, что записаны в БД.
+    # Если профиль успели изменить параллельно (например, mark_user_paid), просто сбрасываем кэш
+    cached = _profile_cache.set(user_id, _normalize_profile({
+        'first_name': merged_data['first_name'],
+        'birth_date': merged_data['birth_date'],
+        'birth_time': merged_data['birth_time'],
+        'birth_place': birth_place,
+        'city': city,
+        'country': country,
+        'has_paid': merged_data['has_paid'],
+    }), version=cache_version)
+    if not cached:
+        _profile_cache.invalidate(user_id)
+    
+    # Логируем сохранение профиля
+    log_event(user_id, 'profile_saved', {
+        'has_birth_name': bool(user_data.get('birth_name')),
+        'has_birth_date': bool(user_data.get('birth_date')),
+        'has_birth_time': bool(user_data.get('birth_time')),
+        'has_birth_place': bool(user_data.get('birth_place')),
+        'is_complete': all(key in user_data for key in ['birth_name', 'birth_date', 'birth_time', 'birth_place'])
+    })
+
+
+def _normalize_profile(result: dict) -> dict:
+    """Преобразует строку таблицы users в user_data (birth_name, birth_date, birth_time, birth_place, has_paid)"""
+    user_data = {}
+    if result.get('first_name'):
+        user_data['birth_name'] = result['first_name']
+    if result.get('birth_date'):
+        user_data['birth_date'] = result['birth_date']
+    if result.get('birth_time'):
+        user_data['birth_time'] = result['birth_time']
+    
+    # Используем birth_place если есть, иначе собираем из city и country
+    if result.get('birth_place'):
+        user_data['birth_place'] = result['birth_place']
+    elif result.get('city') and result.get('country'):
+        user_data['birth_place'] = f"{result['city']}, {result['country']}"
+    elif result.get('city'):
+        user_data['birth_place'] = result['city']
+    
+    if result.get('has_paid'):
+        user_data['has_paid'] = bool(result['has_paid'])
+    return user_data
+
+
+def load_user_profile(user_id):
+    """Загрузка профиля пользователя (из кэша, при промахе - из базы данных)"""
+    cached = _profile_cache.get(user_id)
+    if cached is not None:
+        return dict(cached)
+    
+    cache_version = _profile_cache.version(user_id)
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        
+        if db_type == 'postgresql':
+            cursor.execute('SELECT * FROM users WHERE user_id = %s', (user_id,))
+            row = cursor.fetchone()
+            if row:
+                columns = [desc[0] for desc in cursor.description]
+                result = dict(zip(columns, row))
+            else:
+                result = None
+        else:
+            cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
+            row = cursor.fetchone()
+            if row:
+                columns = ['user_id', 'first_name', 'last_name', 'country', 'city', 
+                           'birth_date', 'birth_time', 'updated_at', 'has_paid', 'birth_place']
+                result = dict(zip(columns, row))
+            else:
+                result = None
+    
+    user_data = _normalize_profile(result) if result else {}
+    _profile_cache.set(user_id, user_data, version=cache_version)
+    return dict(user_data)
+
+
+def get_profile_cache_stats() -> dict:
+    """Статистика кэша профилей: попадания, промахи, размер"""
+    return _profile_cache.stats()
+
+
+def _is_free_generation_username(username: Optional[str]) -> bool:
+    """Входит ли username в список бесплатных генераций"""
+    username = (username or '').strip()
+    return bool(username) and username.lstrip('@').lower() in FREE_GENERATION_USERNAMES
+
+
+def get_user_state(user_id: int) -> dict:
+    """
+    Состояние пользователя одним запросом к users.
+
+    Возвращает:
+        profile         - нормализованный профиль (как load_user_profile)
+        has_paid        - флаг оплаты в БД
+        username        - username из Telegram или None
+        free_generation - username в FREE_GENERATION_USERNAMES
+        can_generate    - оплачено или генерация бесплатная (как user_has_paid)
+
+    Флаг оплаты всегда читается из БД; заодно обновляется кэш профилей.
+    """
+    cache_version = _profile_cache.version(user_id)
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        
+        query = '''
+            SELECT first_name, country, city, birth_date, birth_time, birth_place, has_paid, username
+            FROM users WHERE user_id = {ph}
+        '''
+        if db_type == 'postgresql':
+            cursor.execute(query.format(ph='%s'), (user_id,))
+        else:
+            cursor.execute(query.format(ph='?'), (user_id,))
+        row = cursor.fetchone()
+    
+    if row:
+        columns = ['first_name', 'country', 'city', 'birth_date', 'birth_time', 'birth_place', 'has_paid', 'username']
+        result = dict(zip(columns, row))
+        profile = _normalize_profile(result)
+    else:
+        result = {}
+        profile = {}
+    _profile_cache.set(user_id, profile, version=cache_version)
+    
+    username = (result.get('username') or '').strip() or None
+    has_paid = bool(result.get('has_paid'))
+    free_generation = _is_free_generation_username(username)
+    return {
+        'profile': dict(profile),
+        'has_paid': has_paid,
+        'username': username,
+        'free_generation': free_generation,
+        'can_generate': has_paid or free_generation,
+    }
+
+
+def user_has_paid(user_id: int) -> bool:
+    """Проверяет, оплачена ли генерация (или пользователь в списке бесплатных)"""
+    return get_user_state(user_id)['can_generate']
+
+
+def mark_user_paid(user_id: int):
+    """Помечает пользователя как оплатившего"""
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        
+        try:
+            if db_type == 'postgresql':
+                # Используем CURRENT_TIMESTAMP для PostgreSQL
+                cursor.execute('''
+                    UPDATE users
+                    SET has_paid = 1, updated_at = CURRENT_TIMESTAMP
+                    WHERE user_id = %s
+                ''', (user_id,))
+                # Если пользователя нет, создаем запись
+                if cursor.rowcount == 0:
+                    cursor.execute('''
+                        INSERT INTO users (user_id, has_paid, updated_at)
+                        VALUES (%s, 1, CURRENT_TIMESTAMP)
+                    ''', (user_id,))
+            else:
+                now = datetime.now().isoformat()
+                cursor.execute('''
+                    UPDATE users
+                    SET has_paid = 1, updated_at = ?
+                    WHERE user_id = ?
+                ''', (now, user_id))
+                # Если пользователя нет, создаем запись
+                if cursor.rowcount == 0:
+                    cursor.execute('''
+                        INSERT INTO users (user_id, has_paid, updated_at)
+                        VALUES (?, 1, ?)
+                    ''', (user_id, now))
+            
+            conn.commit()
+            _profile_cache.update(user_id, lambda profile: {**profile, 'has_paid': True})
+            logger.info(f"✅ Пользователь {user_id} помечен как оплативший")
+        except Exception as e:
+            logger.error(f"❌ Ошибка при пометке пользователя как оплатившего: {e}", exc_info=True)
+            conn.rollback()
+
+
+def save_user_username(user_id: int, username: Optional[str], first_name: Optional[str]):
+    """Сохраняет username и first_name пользователя в базу данных.
+    ВАЖНО: Не перезаписывает first_name, если оно уже заполнено пользователем (birth_name)"""
+    try:
+        if not username and not first_name:
+            return  # Нет данных для сохранения
+        
+        with db_connection() as (conn, db_type):
+            cursor = conn.cursor()
+            now = datetime.now().isoformat()
+            
+            # Проверяем, есть ли уже заполненный профиль
+            # Если first_name уже заполнено пользователем (birth_name), не перезаписываем его
+            if db_type == 'postgresql':
+                cursor.execute('SELECT first_name FROM users WHERE user_id = %s', (user_id,))
+            else:
+                cursor.execute('SELECT first_name FROM users WHERE user_id = ?', (user_id,))
+            
+            existing_row = cursor.fetchone()
+            existing_first_name = existing_row[0] if existing_row and existing_row[0] else None
+            
+            # Если first_name уже заполнено (пользователь ввел birth_name), не перезаписываем его
+            # Сохраняем только username и обновляем updated_at
+            if existing_first_name and existing_first_name.strip():
+                # Пользователь уже заполнил имя, сохраняем только username
+                if db_type == 'postgresql':
+                    cursor.execute('''
+                        INSERT INTO users (user_id, username, updated_at)
+                        VALUES (%s, %s, %s)
+                        ON CONFLICT(user_id) DO UPDATE SET
+                            username = COALESCE(EXCLUDED.username, users.username),
+                            updated_at = EXCLUDED.updated_at
+                    ''', (user_id, username, now))
+                else:
+                    cursor.execute('''
+                        INSERT INTO users (user_id, username, updated_at)
+                        VALUES (?, ?, ?)
+                        ON CONFLICT(user_id) DO UPDATE SET
+                            username = COALESCE(excluded.username, users.username),
+                            updated_at = excluded.updated_at
+                    ''', (user_id, username, now))
+            else:
+                # Имени еще нет, можем сохранить first_name из Telegram (как начальное значение)
+                if db_type == 'postgresql':
+                    cursor.execute('''
+                        INSERT INTO users (user_id, username, first_name, updated_at)
+                        VALUES (%s, %s, %s, %s)
+                        ON CONFLICT(user_id) DO UPDATE SET
+                            username = COALESCE(EXCLUDED.username, users.username),
+                            first_name = COALESCE(EXCLUDED.first_name, users.first_name),
+                            updated_at = EXCLUDED.updated_at
+                    ''', (user_id, username, first_name, now))
+                else:
+                    cursor.execute('''
+                        INSERT INTO users (user_id, username, first_name, updated_at)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT(user_id) DO UPDATE SET
+                            username = COALESCE(excluded.username, users.username),
+                            first_name = COALESCE(excluded.first_name, users.first_name),
+                            updated_at = excluded.updated_at
+                    ''', (user_id, username, first_name, now))
+            
+            conn.commit()
+        
+        if not (existing_first_name and existing_first_name.strip()):
+            # first_name мог измениться - профиль в кэше больше не актуален
+            _profile_cache.invalidate(user_id)
+    except Exception as e:
+        # Логируем ошибку, но не прерываем выполнение команды /start
+        logger.warning(f"Не удалось сохранить username для пользователя {user_id}: {e}")
+
+
+def reset_user_payment(user_id: int):
+    """Сбрасывает статус оплаты после выдачи натальной карты."""
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        now = datetime.now().isoformat()
+        
+        if db_type == 'postgresql':
+            cursor.execute('''
+                INSERT INTO users (user_id, has_paid, updated_at)
+                VALUES (%s, 0, %s)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    has_paid = 0,
+                    updated_at = EXCLUDED.updated_at
+            ''', (user_id, now))
+        else:
+            cursor.execute('''
+                INSERT INTO users (user_id, has_paid, updated_at)
+                VALUES (?, 0, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    has_paid = 0,
+                    updated_at = excluded.updated_at
+            ''', (user_id, now))
+        conn.commit()
+    
+    _profile_cache.update(user_id, lambda profile: {k: v for k, v in profile.items() if k != 'has_paid'})
+
+
+def has_special_price(user_id: int) -> bool:
+    """Проверяет, назначена ли пользователю специальная цена (колонка special_price_299)"""
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        
+        try:
+            if db_type == 'postgresql':
+                # Проверяем, есть ли колонка special_price_299
+                cursor.execute("""
+                    SELECT column_name 
+                    FROM information_schema.columns 
+                    WHERE table_name='users' AND column_name='special_price_299'
+                """)
+                if cursor.fetchone() is None:
+                    return False
+                cursor.execute('SELECT special_price_299 FROM users WHERE user_id = %s', (user_id,))
+            else:
+                # Проверяем, есть ли колонка special_price_299
+                cursor.execute("PRAGMA table_info(users)")
+                columns = [col[1] for col in cursor.fetchall()]
+                if 'special_price_299' not in columns:
+                    return False
+                cursor.execute('SELECT special_price_299 FROM users WHERE user_id = ?', (user_id,))
+            
+            row = cursor.fetchone()
+            return bool(row and row[0])
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка при проверке специальной цены для пользователя {user_id}: {e}")
+            return False
+
+
+# ===== СОБЫТИЯ (АНАЛИТИКА) =====
+
+# События, по которым принимаются решения (не только аналитика): пишутся в БД сразу,
+# минуя буфер, - их нельзя потерять при переполнении буфера или падении процесса,
+# и другой процесс (бот / astral_worker) должен видеть их немедленно.
+# payment_success - признак того, что succeeded платеж уже обработан
+# (см. get_unprocessed_succeeded_payment).
+DURABLE_EVENT_TYPES = frozenset({'payment_success'})
+
+
+def log_event(user_id: int, event_type: str, event_data: Optional[dict] = None):
+    """
+    Логирует событие в базу данных для аналитики.
+    
+    Не блокирует: событие кладётся в буфер и записывается в БД пакетом фоновым потоком.
+    События из DURABLE_EVENT_TYPES записываются синхронно, до возврата из функции.
+    
+    Args:
+        user_id: ID пользователя Telegram
+        event_type: Тип события (например: 'start', 'button_click', 'payment', 'natal_chart_request')
+        event_data: Дополнительные данные события в формате словаря (будут сохранены как JSON)
+    """
+    # Проверяем валидность входных данных
+    if not user_id:
+        logger.warning(f"⚠️ Попытка залогировать событие {event_type} без user_id")
+        return
+    
+    if not event_type:
+        logger.warning(f"⚠️ Попытка залогировать событие без типа для user_id {user_id}")
+        return
+    
+    # Сериализуем event_data в JSON
+    try:
+        data_json = json.dumps(event_data, ensure_ascii=False) if event_data else None
+    except (TypeError, ValueError) as json_error:
+        logger.warning(f"⚠️ Не удалось сериализовать event_data для события {event_type}: {json_error}")
+        data_json = json.dumps({'error': 'serialization_failed', 'original_error': str(json_error)})
+    
+    timestamp = datetime.now().isoformat()
+    row = (user_id, event_type, data_json, timestamp)
+    
+    if event_type in DURABLE_EVENT_TYPES:
+        try:
+            insert_events([row])
+            logger.debug(f"📊 Event written: {event_type} for user {user_id}")
+            return
+        except Exception as e:
+            # БД недоступна - лучше отложенная запись через буфер, чем потеря события
+            logger.error(f"❌ Не удалось записать событие {event_type} для user_id {user_id}, "
+                         f"оно будет записано из буфера: {e}", exc_info=True)
+    
+    # Событие попадает в буфер и записывается в БД пакетом фоновым потоком (см. event_buffer.py)
+    _event_buffer.put(row)
+    logger.debug(f"📊 Event queued: {event_type} for user {user_id}")
+
+
+def insert_events(rows: list):
+    """Записывает пакет событий [(user_id, event_type, event_data, timestamp), ...] одной транзакцией"""
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        if db_type == 'postgresql':
+            execute_values(cursor, '''
+                INSERT INTO events (user_id, event_type, event_data, timestamp)
+                VALUES %s
+            ''', rows, page_size=len(rows))
+        else:
+            cursor.executemany('''
+                INSERT INTO events (user_id, event_type, event_data, timestamp)
+                VALUES (?, ?, ?, ?)
+            ''', rows)
+        conn.commit()
+
+
+_event_buffer = EventBuffer(insert_events)
+
+
+def flush_events() -> bool:
+    """Синхронно записывает в БД все события из буфера"""
+    return _event_buffer.flush()
+
+
+def stop_event_buffer():
+    """Останавливает фоновую запись событий и дописывает буфер (при остановке бота)"""
+    _event_buffer.stop()
+
+
+def get_event_buffer_stats() -> dict:
+    """Счётчики буфера событий: записано, отброшено, в очереди и т.д."""
+    return _event_buffer.stats()
+
+
+# ===== ПЛАТЕЖИ (ЮKASSA) =====
+
+def save_payment_info(user_id: int, yookassa_payment_id: str, internal_payment_id: str, amount: float):
+    """Сохраняет информацию о платеже в базу данных для отслеживания"""
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+    
+        try:
+            # Таблица payments должна быть создана в init_db(), но проверяем на всякий случай
+            # Сохраняем информацию о платеже
+            if db_type == 'postgresql':
+                cursor.execute('''
+                    INSERT INTO payments (user_id, yookassa_payment_id, internal_payment_id, amount, status, created_at, updated_at)
+                    VALUES (%s, %s, %s, %s, 'pending', %s, %s)
+                    ON CONFLICT (yookassa_payment_id) DO UPDATE SET
+                        updated_at = EXCLUDED.updated_at
+                ''', (user_id, yookassa_payment_id, internal_payment_id, amount, datetime.now(), datetime.now()))
+            else:
+                cursor.execute('''
+                    INSERT INTO payments (user_id, yookassa_payment_id, internal_payment_id, amount, status, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, 'pending', ?, ?)
+                    ON CONFLICT (yookassa_payment_id) DO UPDATE SET
+                        updated_at = excluded.updated_at
+                ''', (user_id, yookassa_payment_id, internal_payment_id, amount, datetime.now().isoformat(), datetime.now().isoformat()))
+        
+            conn.commit()
+            logger.info(f"💾 Информация о платеже сохранена: user_id={user_id}, payment_id={yookassa_payment_id}")
+        except Exception as e:
+            logger.error(f"❌ Ошибка при сохранении информации о платеже: {e}", exc_info=True)
+            conn.rollback()
+
+
+def update_payment_status(yookassa_payment_id: str, status: str, payment_data: dict = None):
+    """Обновляет статус платежа в базе данных"""
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        
+        try:
+            if db_type == 'postgresql':
+                cursor.execute('''
+                    UPDATE payments
+                    SET status = %s, updated_at = %s
+                    WHERE yookassa_payment_id = %s
+                    RETURNING user_id, amount
+                ''', (status, datetime.now(), yookassa_payment_id))
+            else:
+                cursor.execute('''
+                    UPDATE payments
+                    SET status = ?, updated_at = ?
+                    WHERE yookassa_payment_id = ?
+                ''', (status, datetime.now().isoformat(), yookassa_payment_id))
+                # Для SQLite нужно отдельно получить user_id
+                cursor.execute('''
+                    SELECT user_id, amount FROM payments
+                    WHERE yookassa_payment_id = ?
+                ''', (yookassa_payment_id,))
+            
+            result = cursor.fetchone()
+            conn.commit()
+            
+            if result:
+                user_id = result[0]
+                amount = result[1]
+                logger.info(f"💾 Статус платежа обновлен: payment_id={yookassa_payment_id}, status={status}, user_id={user_id}")
+                return user_id, amount
+            return None, None
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка при обновлении статуса платежа: {e}", exc_info=True)
+            conn.rollback()
+            return None, None
+
+
+def get_last_payment(user_id: int):
+    """Возвращает последний платеж пользователя: (yookassa_payment_id, status, created_at) или None"""
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        if db_type == 'postgresql':
+            cursor.execute('''
+                SELECT yookassa_payment_id, status, created_at
+                FROM payments
+                WHERE user_id = %s
+                ORDER BY created_at DESC
+                LIMIT 1
+            ''', (user_id,))
+        else:
+            cursor.execute('''
+                SELECT yookassa_payment_id, status, created_at
+                FROM payments
+                WHERE user_id = ?
+                ORDER BY created_at DESC
+                LIMIT 1
+            ''', (user_id,))
+        return cursor.fetchone()
+
+
+def get_pending_payment(user_id: int):
+    """Возвращает последний ожидающий платеж пользователя: (yookassa_payment_id, amount, created_at) или None"""
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        if db_type == 'postgresql':
+            cursor.execute('''
+                SELECT yookassa_payment_id, amount, created_at
+                FROM payments
+                WHERE user_id = %s AND status = 'pending'
+                ORDER BY created_at DESC
+                LIMIT 1
+            ''', (user_id,))
+        else:
+            cursor.execute('''
+                SELECT yookassa_payment_id, amount, created_at
+                FROM payments
+                WHERE user_id = ? AND status = 'pending'
+                ORDER BY created_at DESC
+                LIMIT 1
+            ''', (user_id,))
+        return cursor.fetchone()
+
+
+def get_unprocessed_succeeded_payment(user_id: int):
+    """
+    Возвращает succeeded платеж пользователя, для которого нет события payment_success:
+    (yookassa_payment_id, amount, created_at) или None
+    """
+    # Дописываем буфер событий перед чтением
+    flush_events()
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        if db_type == 'postgresql':
+            cursor.execute('''
+                SELECT p.yookassa_payment_id, p.amount, p.created_at
+                FROM payments p
+                WHERE p.user_id = %s 
+                AND p.status = 'succeeded'
+                AND NOT EXISTS (
+                    SELECT 1 FROM events e
+                    WHERE e.user_id = %s
+                    AND e.event_type = 'payment_success'
+                    AND e.event_data::text LIKE '%%' || p.yookassa_payment_id || '%%'
+                )
+                ORDER BY p.created_at DESC
+                LIMIT 1
+            ''', (user_id, user_id))
+        else:
+            cursor.execute('''
+                SELECT p.yookassa_payment_id, p.amount, p.created_at
+                FROM payments p
+                WHERE p.user_id = ?
+                AND p.status = 'succeeded'
+                AND NOT EXISTS (
+                    SELECT 1 FROM events e
+                    WHERE e.user_id = ?
+                    AND e.event_type = 'payment_success'
+                    AND e.event_data LIKE '%' || p.yookassa_payment_id || '%'
+                )
+                ORDER BY p.created_at DESC
+                LIMIT 1
+            ''', (user_id, user_id))
+        return cursor.fetchone()
+
+
+def list_stale_pending_payments(limit: int = 10) -> list:
+    """
+    Возвращает ожидающие платежи старше 1 минуты (по одному на пользователя).
+    PostgreSQL возвращает (user_id, yookassa_payment_id, created_at), SQLite - (user_id, yookassa_payment_id)
+    """
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        # Для PostgreSQL: при SELECT DISTINCT нужно включать created_at в SELECT для ORDER BY
+        if db_type == 'postgresql':
+            cursor.execute('''
+                SELECT DISTINCT ON (user_id) user_id, yookassa_payment_id, created_at
+                FROM payments
+                WHERE status = 'pending'
+                AND created_at < NOW() - INTERVAL '1 minute'
+                ORDER BY user_id, created_at DESC
+                LIMIT %s
+            ''', (limit,))
+        else:
+            cursor.execute('''
+                SELECT DISTINCT user_id, yookassa_payment_id
+                FROM payments
+                WHERE status = 'pending'
+                AND created_at < ?
+                ORDER BY created_at DESC
+                LIMIT ?
+            ''', ((datetime.now() - timedelta(minutes=1)).isoformat(), limit))
+        return cursor.fetchall()
+
+
+# ===== ОЧЕРЕДЬ ГЕНЕРАЦИЙ =====
+
+# Стадии незавершённого задания (см. generation_queue.py); done и failed - конечные
+GENERATION_JOB_ACTIVE_STATES = ('queued', 'computing', 'llm', 'rendering', 'delivering')
+GENERATION_JOB_FINAL_STATES = ('done', 'failed')
+
+_JOB_COLUMNS = ('job_id, user_id, chat_id, message_id, birth_data, priority, state, stage_data, '
+                'attempts, lease_owner, lease_expires_at, error, created_at, updated_at')
+# Условие частичных индексов generation_jobs - в запросах оно должно совпадать дословно
+_JOB_ACTIVE = "state NOT IN ('done', 'failed')"
+
+
+def _job_time(value: datetime, db_type: str):
+    """TIMESTAMPTZ для PostgreSQL, ISO-строка UTC без часового пояса для SQLite"""
+    if db_type == 'postgresql':
+        return value
+    return value.replace(tzinfo=None).isoformat()
+
+
+def _job_from_row(row) -> dict:
+    job = dict(zip([column.strip() for column in _JOB_COLUMNS.split(',')], row))
+    job['birth_data'] = json.loads(job['birth_data'])
+    job['stage_data'] = json.loads(job['stage_data'] or '{}')
+    return job
+
+
+def enqueue_generation_job(user_id: int, chat_id: int, message_id: Optional[int], birth_data: dict,
+                           priority: int) -> Optional[int]:
+    """
+    Ставит генерацию в очередь. Возвращает job_id или None, если у пользователя
+    уже есть незавершённое задание (частичный уникальный индекс по user_id).
+    """
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        ph = '%s' if db_type == 'postgresql' else '?'
+        now = _job_time(datetime.now(timezone.utc), db_type)
+        cursor.execute(f'''
+            INSERT INTO generation_jobs (user_id, chat_id, message_id, birth_data, priority, state,
+                                         stage_data, created_at, updated_at)
+            VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, 'queued', '{{}}', {ph}, {ph})
+            ON CONFLICT (user_id) WHERE {_JOB_ACTIVE} DO NOTHING
+            {'RETURNING job_id' if db_type == 'postgresql' else ''}
+        ''', (user_id, chat_id, message_id, json.dumps(birth_data, ensure_ascii=False), priority, now, now))
+        if db_type == 'postgresql':
+            row = cursor.fetchone()
+            job_id = row[0] if row else None
+        else:
+            job_id = cursor.lastrowid if cursor.rowcount == 1 else None
+        conn.commit()
+    return job_id
+
+
+def get_active_generation_job(user_id: int) -> Optional[dict]:
+    """Незавершённое задание пользователя или None"""
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        ph = '%s' if db_type == 'postgresql' else '?'
+        cursor.execute(f'''
+            SELECT {_JOB_COLUMNS}
+            FROM generation_jobs
+            WHERE user_id = {ph} AND {_JOB_ACTIVE}
+        ''', (user_id,))
+        row = cursor.fetchone()
+    return _job_from_row(row) if row else None
+
+
+def claim_generation_job(worker_id: str, lease_seconds: float) -> Optional[dict]:
+    """
+    Берёт следующее задание (по priority, затем по очереди): новое или с истёкшей
+    арендой. Аренда переходит к worker_id на lease_seconds, attempts увеличивается.
+    Возвращает задание (уже с новыми attempts и lease_owner) или None.
+    """
+    now = datetime.now(timezone.utc)
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        ph = '%s' if db_type == 'postgresql' else '?'
+        # PostgreSQL: строку блокирует первый воркер, остальные пропускают её и берут следующую
+        lock = 'FOR UPDATE SKIP LOCKED' if db_type == 'postgresql' else ''
+        cursor.execute(f'''
+            SELECT {_JOB_COLUMNS}
+            FROM generation_jobs
+            WHERE {_JOB_ACTIVE}
+            AND (lease_expires_at IS NULL OR lease_expires_at < {ph})
+            ORDER BY priority, job_id
+            LIMIT 1
+            {lock}
+        ''', (_job_time(now, db_type),))
+        row = cursor.fetchone()
+        if not row:
+            conn.rollback()
+            return None
+
+        job = _job_from_row(row)
+        lease_expires_at = now + timedelta(seconds=lease_seconds)
+        # Условие на аренду повторяется: SQLite без блокировок строк, задание мог забрать другой процесс
+        cursor.execute(f'''
+            UPDATE generation_jobs
+            SET lease_owner = {ph}, lease_expires_at = {ph}, attempts = attempts + 1, updated_at = {ph}
+            WHERE job_id = {ph} AND (lease_expires_at IS NULL OR lease_expires_at < {ph})
+        ''', (worker_id, _job_time(lease_expires_at, db_type), _job_time(now, db_type),
+              job['job_id'], _job_time(now, db_type)))
+        claimed = cursor.rowcount == 1
+        conn.commit()
+    if not claimed:
+        return None
+    job.update(lease_owner=worker_id, lease_expires_at=lease_expires_at, attempts=job['attempts'] + 1)
+    return job
+
+
+def heartbeat_generation_job(job_id: int, worker_id: str, lease_seconds: float) -> bool:
+    """Продлевает аренду. False - аренда потеряна (задание забрал другой воркер или оно завершено)"""
+    now = datetime.now(timezone.utc)
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        ph = '%s' if db_type == 'postgresql' else '?'
+        cursor.execute(f'''
+            UPDATE generation_jobs
+            SET lease_expires_at = {ph}, updated_at = {ph}
+            WHERE job_id = {ph} AND lease_owner = {ph} AND {_JOB_ACTIVE}
+        ''', (_job_time(now + timedelta(seconds=lease_seconds), db_type), _job_time(now, db_type),
+              job_id, worker_id))
+        updated = cursor.rowcount == 1
+        conn.commit()
+    return updated
+
+
+def update_generation_job(job_id: int, worker_id: str, state: str, stage_data: dict,
+                          error: Optional[str] = None) -> bool:
+    """
+    Записывает стадию задания и результаты пройденных стадий. В конечном состоянии
+    (done, failed) аренда снимается. False - аренда у другого воркера, запись не сделана.
+    """
+    now = datetime.now(timezone.utc)
+    final = state in GENERATION_JOB_FINAL_STATES
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        ph = '%s' if db_type == 'postgresql' else '?'
+        lease_clause = ', lease_owner = NULL, lease_expires_at = NULL' if final else ''
+        cursor.execute(f'''
+            UPDATE generation_jobs
+            SET state = {ph}, stage_data = {ph}, error = {ph}, updated_at = {ph},
+                finished_at = {ph}{lease_clause}
+            WHERE job_id = {ph} AND lease_owner = {ph}
+        ''', (state, json.dumps(stage_data, ensure_ascii=False), error, _job_time(now, db_type),
+              _job_time(now, db_type) if final else None, job_id, worker_id))
+        updated = cursor.rowcount == 1
+        conn.commit()
+    return updated
+
+
+def release_generation_job(job_id: int, worker_id: str) -> bool:
+    """Снимает аренду без смены стадии: задание сразу продолжит другой воркер (остановка процесса)"""
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        ph = '%s' if db_type == 'postgresql' else '?'
+        cursor.execute(f'''
+            UPDATE generation_jobs
+            SET lease_owner = NULL, lease_expires_at = NULL, updated_at = {ph}
+            WHERE job_id = {ph} AND lease_owner = {ph}
+        ''', (_job_time(datetime.now(timezone.utc), db_type), job_id, worker_id))
+        updated = cursor.rowcount == 1
+        conn.commit()
+    return updated
+
+
+def fail_idle_generation_job(job_id: int, error: str) -> bool:
+    """
+    Помечает незавершённое задание failed, если его сейчас не обрабатывает ни один
+    воркер (аренды нет или она истекла). False - задание в работе или уже завершено.
+    """
+    now = datetime.now(timezone.utc)
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        ph = '%s' if db_type == 'postgresql' else '?'
+        cursor.execute(f'''
+            UPDATE generation_jobs
+            SET state = 'failed', error = {ph}, updated_at = {ph}, finished_at = {ph},
+                lease_owner = NULL, lease_expires_at = NULL
+            WHERE job_id = {ph} AND {_JOB_ACTIVE}
+            AND (lease_expires_at IS NULL OR lease_expires_at < {ph})
+        ''', (error, _job_time(now, db_type), _job_time(now, db_type), job_id, _job_time(now, db_type)))
+        updated = cursor.rowcount == 1
+        conn.commit()
+    return updated
+
+
+def touch_generation_worker(worker_id: str):
+    """Отметка, что пул воркеров worker_id запущен (при старте и каждые GENERATION_JOB_HEARTBEAT)"""
+    now = datetime.now(timezone.utc)
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        ph = '%s' if db_type == 'postgresql' else '?'
+        cursor.execute(f'''
+            INSERT INTO generation_workers (worker_id, started_at, seen_at)
+            VALUES ({ph}, {ph}, {ph})
+            ON CONFLICT (worker_id) DO UPDATE SET seen_at = excluded.seen_at
+        ''', (worker_id, _job_time(now, db_type), _job_time(now, db_type)))
+        conn.commit()
+
+
+def remove_generation_worker(worker_id: str):
+    """Пул воркеров остановлен штатно"""
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        ph = '%s' if db_type == 'postgresql' else '?'
+        cursor.execute(f'DELETE FROM generation_workers WHERE worker_id = {ph}', (worker_id,))
+        conn.commit()
+
+
+def count_live_generation_workers(max_age_seconds: float) -> int:
+    """Сколько пулов воркеров отмечались не раньше max_age_seconds назад"""
+    since = datetime.now(timezone.utc) - timedelta(seconds=max_age_seconds)
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        ph = '%s' if db_type == 'postgresql' else '?'
+        cursor.execute(f'SELECT COUNT(*) FROM generation_workers WHERE seen_at >= {ph}', (_job_time(since, db_type),))
+        return cursor.fetchone()[0]
+
+
+def list_active_generation_jobs() -> list:
+    """Незавершённые задания (для скриптов проверки), по порядку очереди"""
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {_JOB_COLUMNS}
+            FROM generation_jobs
+            WHERE {_JOB_ACTIVE}
+            ORDER BY priority, job_id
+        ''')
+        return [_job_from_row(row) for row in cursor.fetchall()]
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Golden-тест chart_engine: векторизованный расчёт аспектов и домов должен
+давать ровно тот же результат, что и прежние циклы из calculate_natal_chart
+(они скопированы ниже без изменений как эталон).
+
+Проверяются реальные карты Swiss Ephemeris (если pyswisseph установлен),
+случайные долготы, значения на границах орбисов и вырожденные куспиды.
+
+Запуск: python test_chart_engine.py
+"""
+import logging
+import random
+import sys
+
+import chart_engine
+
+logging.basicConfig(
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+PLANET_NAMES = ['Sun', 'Moon', 'Mercury', 'Venus', 'Mars',
+                'Jupiter', 'Saturn', 'Uranus', 'Neptune', 'Pluto']
+
+
+# ===== ЭТАЛОН: ПРЕЖНИЙ РАСЧЁТ ИЗ calculate_natal_chart =====
+
+def legacy_aspects(planets_data: dict) -> list:
+    aspects_data = []
+    planet_list = [(name, None) for name in PLANET_NAMES]
+
+    for i, (p1_name, p1_id) in enumerate(planet_list):
+        if p1_name not in planets_data:
+            continue
+        p1_long = planets_data[p1_name]['longitude']
+
+        for j, (p2_name, p2_id) in enumerate(planet_list[i+1:], start=i+1):
+            if p2_name not in planets_data:
+                continue
+            p2_long = planets_data[p2_name]['longitude']
+
+            angle = abs(p1_long - p2_long)
+            if angle > 180:
+                angle = 360 - angle
+
+            aspect_name = None
+            orb = None
+
+            if angle <= 6 or angle >= 354:
+                aspect_name = "Соединение"
+                orb = min(angle, 360 - angle)
+            elif 175 <= angle <= 185:
+                aspect_name = "Оппозиция"
+                orb = abs(angle - 180)
+            elif 85 <= angle <= 95:
+                aspect_name = "Квадрат"
+                orb = abs(angle - 90)
+            elif 265 <= angle <= 275:
+                aspect_name = "Квадрат"
+                orb = abs(angle - 270)
+            elif 116 <= angle <= 124:
+                aspect_name = "Трин"
+                orb = abs(angle - 120)
+            elif 236 <= angle <= 244:
+                aspect_name = "Трин"
+                orb = abs(angle - 240)
+            elif 56 <= angle <= 64:
+                aspect_name = "Секстиль"
+                orb = abs(angle - 60)
+            elif 296 <= angle <= 304:
+                aspect_name = "Секстиль"
+                orb = abs(angle - 300)
+
+            if aspect_name:
+                aspects_data.append({
+                    'planet1': p1_name,
+                    'planet2': p2_name,
+                    'aspect': aspect_name,
+                    'angle': angle,
+                    'orb': orb,
+                })
+    return aspects_data
+
+
+def legacy_houses(planets_data: dict, houses_cusps: list) -> dict:
+    planets_in_houses = {}
+    for planet_name, planet_info in planets_data.items():
+        planet_long = planet_info['longitude']
+        for house_num in range(1, 13):
+            cusp_current = houses_cusps[house_num]
+            next_house_num = (house_num % 12) + 1
+            cusp_next = houses_cusps[next_house_num]
+
+            if cusp_current <= cusp_next:
+                if cusp_current <= planet_long < cusp_next:
+                    planets_in_houses[planet_name] = house_num
+                    break
+            else:
+                if planet_long >= cusp_current or planet_long < cusp_next:
+                    planets_in_houses[planet_name] = house_num
+                    break
+    return planets_in_houses
+
+
+# ===== СРАВНЕНИЕ =====
+
+def engine_result(planets_data: dict, houses_cusps: list):
+    names, longitudes = chart_engine.chart_points(planets_data, PLANET_NAMES, 0.0, 0.0, 0.0)
+    aspects = chart_engine.find_aspects(names, longitudes, chart_engine.MAJOR_ASPECTS)
+    planet_names = list(planets_data)
+    houses = chart_engine.assign_houses(
+        planet_names,
+        [planets_data[name]['longitude'] for name in planet_names],
+        houses_cusps[1:13],
+    )
+    return aspects, houses
+
+
+def compare(label: str, planets_data: dict, houses_cusps: list) -> bool:
+    aspects, houses = engine_result(planets_data, houses_cusps)
+    expected_aspects = legacy_aspects(planets_data)
+    expected_houses = legacy_houses(planets_data, houses_cusps)
+    ok = True
+    if aspects != expected_aspects:
+        logger.error(f"   ❌ {label}: аспекты расходятся\n      было:  {expected_aspects}\n      стало: {aspects}")
+        ok = False
+    if houses != expected_houses:
+        logger.error(f"   ❌ {label}: дома расходятся\n      было:  {expected_houses}\n      стало: {houses}")
+        ok = False
+    return ok
+
+
+def planets_from_longitudes(longitudes: list) -> dict:
+    return {name: {'longitude': lon} for name, lon in zip(PLANET_NAMES, longitudes)}
+
+
+def test_swisseph_charts():
+    """Реальные карты: Swiss Ephemeris, Placidus"""
+    logger.info("🪐 Реальные карты Swiss Ephemeris...")
+    try:
+        import swisseph as swe
+    except ImportError:
+        logger.warning("⚠️ pyswisseph не установлен - проверка пропущена")
+        return True
+
+    planet_ids = [swe.SUN, swe.MOON, swe.MERCURY, swe.VENUS, swe.MARS,
+                  swe.JUPITER, swe.SATURN, swe.URANUS, swe.NEPTUNE, swe.PLUTO]
+    rng = random.Random(13)
+    ok = True
+    charts = 0
+    for _ in range(300):
+        jd = swe.julday(rng.randint(1930, 2020), rng.randint(1, 12), rng.randint(1, 28), rng.uniform(0, 24))
+        lat = rng.uniform(-60, 66)
+        lon = rng.uniform(-180, 180)
+        planets_data = {
+            name: {'longitude': swe.calc_ut(jd, pid, swe.FLG_SWIEPH | swe.FLG_SPEED)[0][0]}
+            for name, pid in zip(PLANET_NAMES, planet_ids)
+        }
+        try:
+            cusps = swe.houses(jd, lat, lon, b'P')[0]
+        except Exception:
+            continue
+        houses_cusps = [0] + list(cusps[:12])
+        ok = compare(f"jd={jd:.4f} lat={lat:.2f} lon={lon:.2f}", planets_data, houses_cusps) and ok
+        charts += 1
+
+    if ok:
+        logger.info(f"✅ {charts} карт совпадают")
+    return ok
+
+
+def test_random_longitudes():
+    """Случайные долготы и куспиды"""
+    logger.info("🎲 Случайные долготы...")
+    rng = random.Random(42)
+    ok = True
+    for n in range(2000):
+        longitudes = [rng.uniform(0, 360) for _ in PLANET_NAMES]
+        start = rng.uniform(0, 360)
+        widths = [rng.uniform(5, 55) for _ in range(12)]
+        scale = 360 / sum(widths)
+        cusps, position = [], start
+        for width in widths:
+            cusps.append(position % 360)
+            position += width * scale
+        ok = compare(f"случай {n}", planets_from_longitudes(longitudes), [0] + cusps) and ok
+    if ok:
+        logger.info("✅ 2000 случаев совпадают")
+    return ok
+
+
+def test_boundaries():
+    """Углы ровно на границах орбисов и планеты ровно на куспидах"""
+    logger.info("📐 Границы орбисов и куспидов...")
+    ok = True
+    edges = [0.0, 6.0, 6.0001, 56.0, 64.0, 64.5, 85.0, 95.0, 116.0, 124.0, 124.0001,
+             175.0, 180.0, 185.0, 174.9999, 354.0, 359.9999]
+    cusps = [0] + [(15.0 + 30 * i) % 360 for i in range(12)]
+    for edge in edges:
+        for base in (0.0, 10.5, 200.25, 355.0):
+            longitudes = [base, (base + edge) % 360] + [(base + 7.5 * k) % 360 for k in range(2, 10)]
+            ok = compare(f"угол {edge} от {base}", planets_from_longitudes(longitudes), cusps) and ok
+    on_cusps = planets_from_longitudes([c for c in cusps[1:11]])
+    ok = compare("планеты на куспидах", on_cusps, cusps) and ok
+    if ok:
+        logger.info("✅ Границы совпадают")
+    return ok
+
+
+def test_degenerate_cusps():
+    """Куспиды не рассчитаны (все нули, как при ошибке swe.houses)"""
+    logger.info("🕳️ Вырожденные куспиды...")
+    rng = random.Random(7)
+    ok = True
+    for cusps in ([0] * 13, [0] + [100.0] * 12, [0] + [30.0 * i for i in range(12)][::-1]):
+        longitudes = [rng.uniform(0, 360) for _ in PLANET_NAMES]
+        ok = compare(f"куспиды {cusps[1:4]}...", planets_from_longitudes(longitudes), cusps) and ok
+    if ok:
+        logger.info("✅ Вырожденные куспиды обрабатываются как раньше")
+    return ok
+
+
+def test_minor_aspects():
+    """Минорные аспекты и дополнительные точки находятся по той же матрице"""
+    logger.info("✨ Минорные аспекты...")
+    aspects = chart_engine.MAJOR_ASPECTS + chart_engine.MINOR_ASPECTS
+    found = chart_engine.find_aspects(['Sun', 'Moon', 'Ascendant'], [10.0, 161.0, 41.5], aspects)
+    expected = [
+        ('Sun', 'Moon', 'Квинконс'),
+        ('Sun', 'Ascendant', 'Полусекстиль'),
+        ('Moon', 'Ascendant', 'Трин'),
+    ]
+    got = [(a['planet1'], a['planet2'], a['aspect']) for a in found]
+    if got != expected:
+        logger.error(f"❌ Ожидалось {expected}, получено {got}")
+        return False
+    logger.info("✅ Минорные аспекты найдены")
+    return True
+
+
+def main():
+    logger.info("🚀 Golden-тест chart_engine")
+    logger.info("=" * 60)
+
+    results = [
+        ("Реальные карты", test_swisseph_charts()),
+        ("Случайные долготы", test_random_longitudes()),
+        ("Границы", test_boundaries()),
+        ("Вырожденные куспиды", test_degenerate_cusps()),
+        ("Минорные аспекты", test_minor_aspects()),
+    ]
+
+    logger.info("=" * 60)
+    logger.info("📊 Результаты:")
+    all_passed = True
+    for test_name, result in results:
+        status = "✅ ПРОЙДЕН" if result else "❌ ПРОВАЛЕН"
+        logger.info(f"   {test_name}: {status}")
+        if not result:
+            all_passed = False
+
+    if all_passed:
+        logger.info("✅ Результаты совпадают с прежним расчётом")
+        return 0
+    logger.error("❌ Есть расхождения с прежним расчётом!")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
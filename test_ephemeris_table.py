@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тест точности предрасчитанных эфемерид (ephemeris_table.py): интерполированные
+долгота и широта всех тел должны отличаться от Swiss Ephemeris меньше чем на 1″,
+ретроградность - совпадать, а вне диапазона таблицы и с precise=True ответ
+должен браться из swe.calc_ut без изменений.
+
+Таблица на несколько лет строится во временном каталоге; если собрана полная
+таблица (python ephemeris_table.py build), проверяется и она.
+
+Запуск: python test_ephemeris_table.py
+"""
+import logging
+import os
+import random
+import sys
+import tempfile
+
+import swisseph as swe
+
+import ephemeris
+import ephemeris_table
+
+logging.basicConfig(
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+ARCSEC = 1.0 / 3600.0
+DISTANCE_TOLERANCE = 1e-5  # относительная ошибка расстояния (для Луны это меньше 4 км)
+SAMPLES = 3000
+
+
+def angle_diff(a: float, b: float) -> float:
+    return abs((a - b + 180.0) % 360.0 - 180.0)
+
+
+def check_table(table: ephemeris_table.EphemerisTable, label: str, seed: int) -> bool:
+    """Случайные моменты в диапазоне таблицы: отклонение calc_ut от swe.calc_ut по всем телам"""
+    rng = random.Random(seed)
+    worst_lon = worst_lat = worst_dist = 0.0
+    worst_body = None
+    retro_mismatch = 0
+    precise = 0
+    ephemeris_table._table = table
+    for _ in range(SAMPLES):
+        jd = rng.uniform(table.start_jd, table.end_jd - 1e-6)
+        for body in ephemeris_table.BODIES:
+            expected = swe.calc_ut(jd, body, ephemeris_table.TABLE_FLAGS)[0]
+            got = ephemeris_table.calc_ut(jd, body, ephemeris_table.TABLE_FLAGS)[0]
+            precise += table.needs_precise(jd, body)
+            lon_diff = angle_diff(got[0], expected[0])
+            if lon_diff > worst_lon:
+                worst_lon, worst_body = lon_diff, body
+            worst_lat = max(worst_lat, abs(got[1] - expected[1]))
+            worst_dist = max(worst_dist, abs(got[2] - expected[2]) / expected[2])
+            if body != swe.TRUE_NODE and (got[3] < 0) != (expected[3] < 0):
+                retro_mismatch += 1
+
+    total = SAMPLES * len(ephemeris_table.BODIES)
+    logger.info(
+        f"   {label}: макс. ошибка долготы {worst_lon / ARCSEC:.4f}″ (тело {worst_body}), "
+        f"широты {worst_lat / ARCSEC:.4f}″, расстояния {worst_dist:.2e} (отн.); "
+        f"через Swiss Ephemeris {precise / total:.1%} запросов"
+    )
+    ok = worst_lon < ARCSEC and worst_lat < ARCSEC and worst_dist < DISTANCE_TOLERANCE and retro_mismatch == 0
+    if retro_mismatch:
+        logger.error(f"   ❌ {label}: ретроградность не совпала в {retro_mismatch} случаях")
+    if not ok:
+        logger.error(f"   ❌ {label}: отклонение больше допустимого")
+    return ok
+
+
+def test_accuracy(table) -> bool:
+    """Точность интерполяции на временной таблице"""
+    logger.info("🎯 Точность интерполяции (1989-1991)...")
+    ok = check_table(table, "Временная таблица", seed=15)
+    if ok:
+        logger.info("✅ Все тела в пределах 1″")
+    return ok
+
+
+def test_full_table() -> bool:
+    """Полная таблица, если она собрана"""
+    logger.info("📚 Полная таблица...")
+    if not os.path.exists(ephemeris_table.EPHEMERIS_TABLE_PATH):
+        logger.warning(f"⚠️ {ephemeris_table.EPHEMERIS_TABLE_PATH} не собрана - проверка пропущена")
+        return True
+    table = ephemeris_table.EphemerisTable.load(ephemeris_table.EPHEMERIS_TABLE_PATH)
+    ok = check_table(table, os.path.basename(ephemeris_table.EPHEMERIS_TABLE_PATH), seed=1940)
+    ephemeris_table._table = None
+    if ok:
+        logger.info("✅ Полная таблица в пределах 1″")
+    return ok
+
+
+def test_fallback(table) -> bool:
+    """Вне диапазона, precise=True и флаги не из таблицы - ответ Swiss Ephemeris как есть"""
+    logger.info("↩️ Переход на Swiss Ephemeris...")
+    ok = True
+    cases = [
+        ("до начала таблицы", table.start_jd - 10.3, ephemeris_table.TABLE_FLAGS, False),
+        ("после конца таблицы", table.end_jd + 0.5, ephemeris_table.TABLE_FLAGS, False),
+        ("precise=True", table.start_jd + 100.25, ephemeris_table.TABLE_FLAGS, True),
+        ("сидерический зодиак", table.start_jd + 100.25, ephemeris_table.TABLE_FLAGS | swe.FLG_SIDEREAL, False),
+    ]
+    for label, jd, flags, precise in cases:
+        got = ephemeris_table.calc_ut(jd, swe.MOON, flags, precise)
+        expected = swe.calc_ut(jd, swe.MOON, flags)
+        if got != expected:
+            logger.error(f"   ❌ {label}: {got} != {expected}")
+            ok = False
+    if ok:
+        logger.info("✅ Вне таблицы используется swe.calc_ut")
+    return ok
+
+
+def test_charts(table) -> bool:
+    """Карта из таблицы совпадает с картой Swiss Ephemeris (знаки, дома, аспекты)"""
+    logger.info("🪐 Натальные карты...")
+    rng = random.Random(7)
+    ok = True
+    for _ in range(300):
+        jd = rng.uniform(table.start_jd, table.end_jd - 1e-6)
+        lat, lon = rng.uniform(-60, 60), rng.uniform(-180, 180)
+        fast = ephemeris.compute_chart(jd, lat, lon)
+        exact = ephemeris.compute_chart(jd, lat, lon, precise=True)
+        for name, planet in exact['planets'].items():
+            if angle_diff(fast['planets'][name]['longitude'], planet['longitude']) >= ARCSEC:
+                logger.error(f"   ❌ jd={jd}: {name} отличается больше чем на 1″")
+                ok = False
+        if angle_diff(fast['north_node']['longitude'], exact['north_node']['longitude']) >= ARCSEC:
+            logger.error(f"   ❌ jd={jd}: узел отличается больше чем на 1″")
+            ok = False
+        same_structure = (
+            {n: p['sign'] for n, p in fast['planets'].items()} == {n: p['sign'] for n, p in exact['planets'].items()}
+            and fast['planets_in_houses'] == exact['planets_in_houses']
+            and fast['retrograde_planets'] == exact['retrograde_planets']
+            and [(a['planet1'], a['planet2'], a['aspect']) for a in fast['aspects']]
+            == [(a['planet1'], a['planet2'], a['aspect']) for a in exact['aspects']]
+        )
+        if not same_structure:
+            logger.warning(f"   ⚠️ jd={jd}: знак, дом или аспект на границе отличается (точка в пределах 1″ от границы)")
+    if ok:
+        logger.info("✅ Карты из таблицы совпадают с расчётом Swiss Ephemeris")
+    return ok
+
+
+def main():
+    logger.info("🚀 Тест предрасчитанных эфемерид")
+    logger.info("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ephemeris_table.npy')
+        ephemeris_table.build_table(path, 1989, 1991)
+        table = ephemeris_table.EphemerisTable.load(path)
+        # calc_ut и compute_chart используют временную таблицу
+        ephemeris_table._table = table
+
+        results = [
+            ("Точность", test_accuracy(table)),
+            ("Переход на Swiss Ephemeris", test_fallback(table)),
+            ("Натальные карты", test_charts(table)),
+        ]
+        ephemeris_table._table = None
+        del table
+    results.append(("Полная таблица", test_full_table()))
+
+    logger.info("=" * 60)
+    logger.info("📊 Результаты:")
+    all_passed = True
+    for test_name, result in results:
+        status = "✅ ПРОЙДЕН" if result else "❌ ПРОВАЛЕН"
+        logger.info(f"   {test_name}: {status}")
+        if not result:
+            all_passed = False
+
+    if all_passed:
+        logger.info("✅ Таблица эфемерид точна до 1″")
+        return 0
+    logger.error("❌ Таблица эфемерид расходится со Swiss Ephemeris!")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Проверка офлайн-справочника городов (gazetteer.py) на данных data/gazetteer.tsv.
+
+    - точные имена, написание латиницей, альтернативные имена, "г." и страна в строке
+    - похожие названия городов, которых нет в справочнике ("Кировск", "Калуш"),
+      не подменяются другим реальным городом ("Киров", "Калуга")
+    - для места, которого нет в справочнике, bot.get_coordinates_from_place
+      обращается к кэшу и геокодеру
+    - без полигонов таймзона ближайшего города берётся только в той же стране:
+      Тересполь (Польша) в 9 км от Бреста (Беларусь) получает Europe/Warsaw
+
+    python test_gazetteer.py
+"""
+import os
+import sys
+import logging
+
+os.environ.setdefault('OPENAI_API_KEY', 'test-key')
+
+logging.basicConfig(
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+import gazetteer
+
+# Место -> (город справочника, код страны)
+KNOWN_PLACES = [
+    ('Москва', 'Москва', 'RU'),
+    ('г. Казань, Россия', 'Казань', 'RU'),
+    ('Kyiv, Ukraine', 'Киев', 'UA'),
+    ('Питер', 'Санкт-Петербург', 'RU'),
+    ('САНКТ-ПЕТЕРБУРГ', 'Санкт-Петербург', 'RU'),
+    ('Вятка', 'Киров', 'RU'),
+]
+
+# Города не из справочника, похожие на города из него
+NEAR_MISS_PLACES = [
+    'Кировск',        # Киров - 1300 км
+    'Дзержинский',    # Дзержинск
+    'Калуш',          # Калуга (Украина -> Россия)
+    'Коломыя',        # Коломна
+    'Зеленогорск',    # Зеленоград
+    'Калуш, Украина',
+    'Кировск, Мурманская область',
+    'Moskwa',
+]
+
+# Тересполь (Польша): ближайший город справочника - Брест (Беларусь, UTC+3)
+TERESPOL = (52.0755, 23.6160)
+
+
+def check(results: list, name: str, passed: bool, details=None):
+    logger.info(f"   {'✅' if passed else '❌'} {name}")
+    if not passed and details is not None:
+        logger.error(f"      {details}")
+    results.append(passed)
+
+
+def test_known_places(gaz) -> bool:
+    """Города справочника находятся по разным написаниям"""
+    logger.info("🔍 Поиск городов справочника...")
+    results = []
+    for place, name, country in KNOWN_PLACES:
+        city = gaz.find(place)
+        check(results, f"'{place}' -> {name}",
+              city is not None and city['name'] == name and city['country_code'] == country, city)
+    return all(results)
+
+
+def test_near_miss_places(gaz) -> bool:
+    """Похожее название - не повод вернуть другой город"""
+    logger.info("🔍 Похожие названия не из справочника...")
+    results = []
+    for place in NEAR_MISS_PLACES:
+        city = gaz.find(place)
+        check(results, f"'{place}' не найден", city is None, city and city['name'])
+    return all(results)
+
+
+def test_timezone_without_polygons(gaz) -> bool:
+    """Без полигонов ближайший город определяет таймзону только в своей стране"""
+    logger.info("🔍 Таймзона по ближайшему городу...")
+    results = []
+    check(results, 'полигонов нет', not gaz._polygons)
+    check(results, 'без кода страны таймзона не определяется', gaz.timezone_at(*TERESPOL) is None,
+          gaz.timezone_at(*TERESPOL))
+    check(results, 'ближайший город другой страны не используется', gaz.timezone_at(*TERESPOL, 'PL') is None,
+          gaz.timezone_at(*TERESPOL, 'PL'))
+    check(results, 'Брест: ближайший город той же страны', gaz.timezone_at(52.09, 23.70, 'BY') == 'Europe/Minsk',
+          gaz.timezone_at(52.09, 23.70, 'BY'))
+    check(results, 'Киров: свой пояс внутри России', gaz.timezone_at(58.60, 49.66, 'RU') == 'Europe/Kirov',
+          gaz.timezone_at(58.60, 49.66, 'RU'))
+    return all(results)
+
+
+class _FakeGeocodeCache:
+    """geocode_cache без БД: кэш пуст, запросы не ограничиваются"""
+
+    def __init__(self):
+        self.stored = []
+
+    def lookup(self, place):
+        return None
+
+    def throttle_remote(self):
+        pass
+
+    def store_coordinates(self, place, latitude, longitude):
+        self.stored.append((place, latitude, longitude))
+
+    def store_timezone(self, place, country_code, timezone):
+        self.stored.append((place, country_code, timezone))
+
+
+class _FakeGeolocator:
+    def __init__(self):
+        self.queries = []
+
+    def geocode(self, place, timeout=None):
+        self.queries.append(place)
+        return type('Location', (), {'latitude': 67.61, 'longitude': 33.67})()
+
+    def reverse(self, point, **kwargs):
+        self.queries.append(point)
+        return type('Location', (), {'raw': {'address': {'country_code': 'pl'}}})()
+
+
+def test_fallback_to_geocoder() -> bool:
+    """Места не из справочника геокодируются, а не берутся у похожего города"""
+    logger.info("🔍 Место не из справочника уходит в геокодер...")
+    import bot as bot_module
+
+    fake_cache, fake_geolocator = _FakeGeocodeCache(), _FakeGeolocator()
+    original = bot_module.geocode_cache, bot_module.geolocator
+    bot_module.geocode_cache, bot_module.geolocator = fake_cache, fake_geolocator
+    results = []
+    try:
+        coordinates = bot_module.get_coordinates_from_place('Кировск')
+        check(results, 'координаты от геокодера', coordinates == (67.61, 33.67), coordinates)
+        check(results, 'результат сохранён в кэш', fake_cache.stored == [('Кировск', 67.61, 33.67)], fake_cache.stored)
+
+        fake_geolocator.queries = []
+        coordinates = bot_module.get_coordinates_from_place('Киров')
+        check(results, 'город справочника без геокодера',
+              fake_geolocator.queries == [] and coordinates == (58.6036, 49.668), coordinates)
+    finally:
+        bot_module.geocode_cache, bot_module.geolocator = original
+    return all(results)
+
+
+def test_resolve_timezone_across_border() -> bool:
+    """Таймзона места у границы - по стране из геокодера, а не по городу соседней страны"""
+    logger.info("🔍 Таймзона места у границы...")
+    from datetime import datetime
+    import bot as bot_module
+
+    fake_cache, fake_geolocator = _FakeGeocodeCache(), _FakeGeolocator()
+    original = bot_module.geocode_cache, bot_module.geolocator
+    bot_module.geocode_cache, bot_module.geolocator = fake_cache, fake_geolocator
+    results = []
+    try:
+        tz = bot_module.resolve_timezone_from_place('Тересполь', *TERESPOL, datetime(1990, 3, 15, 14, 30))
+        check(results, 'Тересполь -> Europe/Warsaw', tz.zone == 'Europe/Warsaw', tz)
+
+        fake_geolocator.queries = []
+        tz = bot_module.resolve_timezone_from_place('Киров', 58.6036, 49.668, datetime(1990, 3, 15, 14, 30))
+        check(results, 'город справочника - офлайн', tz.zone == 'Europe/Kirov' and fake_geolocator.queries == [],
+              (tz, fake_geolocator.queries))
+    finally:
+        bot_module.geocode_cache, bot_module.geolocator = original
+    return all(results)
+
+
+def main():
+    logger.info("🚀 Проверка справочника городов")
+    logger.info("=" * 60)
+
+    gaz = gazetteer.Gazetteer.from_file(gazetteer.GAZETTEER_PATH)
+    results = [
+        ("Города справочника", test_known_places(gaz)),
+        ("Похожие названия", test_near_miss_places(gaz)),
+        ("Переход к геокодеру", test_fallback_to_geocoder()),
+        ("Таймзона без полигонов", test_timezone_without_polygons(gaz)),
+        ("Таймзона у границы", test_resolve_timezone_across_border()),
+    ]
+
+    logger.info("=" * 60)
+    logger.info("📊 Результаты:")
+    all_passed = True
+    for test_name, result in results:
+        status = "✅ ПРОЙДЕН" if result else "❌ ПРОВАЛЕН"
+        logger.info(f"   {test_name}: {status}")
+        if not result:
+            all_passed = False
+
+    if all_passed:
+        logger.info("✅ Справочник находит только известные города и их таймзоны")
+        return 0
+    logger.error("❌ Есть ошибки в справочнике городов!")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
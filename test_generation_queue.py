@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Проверка очереди генераций (generation_jobs, generation_queue.GenerationWorkerPool).
+
+Создаёт временную SQLite БД, применяет миграции и проверяет аренду заданий и
+воркеров с подменённым обработчиком (без OpenAI и Telegram):
+
+    - порядок выдачи (priority, затем job_id) и одно активное задание на пользователя
+    - одновременный захват из нескольких потоков: каждое задание достаётся одному
+      воркеру (на SQLite - условие на аренду в UPDATE, на PostgreSQL ещё и SKIP LOCKED)
+    - истёкшая аренда: задание забирает другой воркер, старый теряет право записи
+    - продолжение с пройденной стадии после перезапуска
+    - потеря аренды во время обработки прерывает задание
+    - остановка воркеров снимает аренду, задание сразу берёт другой процесс
+    - задание, исчерпавшее GENERATION_JOB_MAX_ATTEMPTS, помечается failed
+    - отметка пулов в generation_workers: бот без воркеров видит, что очередь
+      никто не разбирает (check_workers_alive)
+
+    python test_generation_queue.py
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import sqlite3
+import tempfile
+import threading
+
+os.environ['GENERATION_JOB_POLL_INTERVAL'] = '0.05'
+os.environ['GENERATION_JOB_HEARTBEAT'] = '0.1'
+os.environ['GENERATION_JOB_LEASE'] = '5'
+os.environ['GENERATION_JOB_MAX_ATTEMPTS'] = '3'
+
+logging.basicConfig(
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+import db_pool
+
+BIRTH_DATA = {'name': 'Тест', 'date': '15.03.1990', 'time': '14:30', 'place': 'Москва'}
+
+
+def sql(query: str, params: tuple = ()) -> list:
+    """Прямой запрос к тестовой БД (мимо репозитория)"""
+    conn = sqlite3.connect(db_pool.DATABASE)
+    try:
+        rows = conn.execute(query, params).fetchall()
+        conn.commit()
+    finally:
+        conn.close()
+    return rows
+
+
+def job_row(job_id: int) -> dict:
+    state, attempts, lease_owner, error = sql(
+        'SELECT state, attempts, lease_owner, error FROM generation_jobs WHERE job_id = ?', (job_id,)
+    )[0]
+    return {'state': state, 'attempts': attempts, 'lease_owner': lease_owner, 'error': error}
+
+
+def expire_lease(job_id: int):
+    """Аренда истекла: процесс воркера упал и больше её не продлевает"""
+    sql("UPDATE generation_jobs SET lease_expires_at = '2000-01-01T00:00:00' WHERE job_id = ?", (job_id,))
+
+
+def reset_jobs():
+    sql('DELETE FROM generation_jobs')
+
+
+def check(results: list, name: str, passed: bool, details=None):
+    logger.info(f"   {'✅' if passed else '❌'} {name}")
+    if not passed and details is not None:
+        logger.error(f"      {details}")
+    results.append(passed)
+
+
+async def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        await asyncio.sleep(0.02)
+    return condition()
+
+
+def test_claim_order(repository) -> bool:
+    """Порядок выдачи и одно активное задание на пользователя"""
+    logger.info("🔍 Порядок выдачи заданий...")
+    reset_jobs()
+    results = []
+    default_job = repository.enqueue_generation_job(101, 101, 1, BIRTH_DATA, 1)
+    paid_first = repository.enqueue_generation_job(102, 102, 1, BIRTH_DATA, 0)
+    paid_second = repository.enqueue_generation_job(103, 103, 1, BIRTH_DATA, 0)
+    check(results, 'второе задание пользователя не создаётся',
+          repository.enqueue_generation_job(101, 101, 1, BIRTH_DATA, 0) is None)
+    claimed = [repository.claim_generation_job('w', 60)['job_id'] for _ in range(3)]
+    check(results, 'оплаченные раньше, внутри приоритета - по очереди',
+          claimed == [paid_first, paid_second, default_job], claimed)
+    check(results, 'задания в аренде повторно не выдаются', repository.claim_generation_job('w', 60) is None)
+    return all(results)
+
+
+def test_concurrent_claim(repository) -> bool:
+    """Несколько потоков разбирают очередь одновременно - без двойной выдачи"""
+    logger.info("🔍 Одновременный захват заданий...")
+    reset_jobs()
+    job_ids = {repository.enqueue_generation_job(200 + i, 200 + i, 1, BIRTH_DATA, 0) for i in range(20)}
+    claimed = []
+    claimed_lock = threading.Lock()
+    start = threading.Barrier(8)
+
+    def worker(number: int):
+        start.wait()
+        while True:
+            try:
+                job = repository.claim_generation_job(f'w{number}', 60)
+            except sqlite3.OperationalError:
+                # SQLite: запись заблокирована другим потоком - как занятая строка, пробуем снова
+                continue
+            if job is None:
+                if len(claimed) >= len(job_ids):
+                    return
+                continue
+            with claimed_lock:
+                claimed.append(job['job_id'])
+
+    threads = [threading.Thread(target=worker, args=(number,), daemon=True) for number in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    results = []
+    check(results, 'каждое задание выдано ровно один раз',
+          sorted(claimed) == sorted(job_ids), f"выдано {len(claimed)}, уникальных {len(set(claimed))}")
+    return all(results)
+
+
+def test_lease_expiry(repository) -> bool:
+    """Истёкшая аренда переходит к другому воркеру"""
+    logger.info("🔍 Истечение аренды...")
+    reset_jobs()
+    results = []
+    job_id = repository.enqueue_generation_job(301, 301, 1, BIRTH_DATA, 0)
+    first = repository.claim_generation_job('crashed', 60)
+    check(results, 'пока аренда действует, задание не выдаётся', repository.claim_generation_job('other', 60) is None)
+    expire_lease(job_id)
+    second = repository.claim_generation_job('other', 60)
+    check(results, 'после истечения задание забирает другой воркер',
+          second is not None and second['job_id'] == job_id and second['attempts'] == first['attempts'] + 1, second)
+    check(results, 'старый воркер не продлевает аренду',
+          not repository.heartbeat_generation_job(job_id, 'crashed', 60))
+    check(results, 'старый воркер не пишет стадию',
+          not repository.update_generation_job(job_id, 'crashed', 'llm', {}))
+    check(results, 'новый воркер продлевает аренду', repository.heartbeat_generation_job(job_id, 'other', 60))
+    return all(results)
+
+
+async def test_resume_from_stage(repository, generation_queue) -> bool:
+    """Задание продолжается со стадии и результатов упавшего воркера"""
+    logger.info("🔍 Продолжение с пройденной стадии...")
+    reset_jobs()
+    results = []
+    job_id = repository.enqueue_generation_job(401, 401, 1, BIRTH_DATA, 0)
+    repository.claim_generation_job('crashed', 60)
+    repository.update_generation_job(job_id, 'crashed', generation_queue.JOB_RENDERING, {'report_markdown': '## Раздел 1'})
+    expire_lease(job_id)
+
+    seen = {}
+
+    async def handler(lease):
+        seen.update(state=lease.state, stage_data=dict(lease.stage_data), resumed=lease.resumed)
+        await lease.advance(generation_queue.JOB_DELIVERING, pdf_path='/tmp/report.pdf')
+
+    pool = generation_queue.GenerationWorkerPool(handler, workers=1)
+    pool.start()
+    await wait_for(lambda: job_row(job_id)['state'] == generation_queue.JOB_DONE)
+    await pool.stop()
+    check(results, 'обработчик получил стадию rendering', seen.get('state') == generation_queue.JOB_RENDERING, seen)
+    check(results, 'текст отчёта сохранён', seen.get('stage_data') == {'report_markdown': '## Раздел 1'}, seen)
+    check(results, 'задание отмечено как продолженное', seen.get('resumed') is True)
+    check(results, 'задание завершено (done, аренда снята)',
+          job_row(job_id) == {'state': 'done', 'attempts': 2, 'lease_owner': None, 'error': None}, job_row(job_id))
+    check(results, 'счётчик продолженных', pool.stats()['resumed'] == 1, pool.stats())
+    return all(results)
+
+
+async def test_heartbeat_lease_lost(repository, generation_queue) -> bool:
+    """Аренду забрали (например, после долгой паузы процесса) - обработка прерывается"""
+    logger.info("🔍 Потеря аренды во время обработки...")
+    reset_jobs()
+    results = []
+    job_id = repository.enqueue_generation_job(501, 501, 1, BIRTH_DATA, 0)
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def handler(lease):
+        started.set()
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    pool = generation_queue.GenerationWorkerPool(handler, workers=1)
+    pool.start()
+    await asyncio.wait_for(started.wait(), 5)
+    # Задание перешло к другому воркеру - следующее продление аренды не пройдёт
+    sql("UPDATE generation_jobs SET lease_owner = 'other' WHERE job_id = ?", (job_id,))
+    await wait_for(cancelled.is_set)
+    await wait_for(lambda: pool.stats()['busy'] == 0)
+    await pool.stop()
+    check(results, 'обработчик прерван', cancelled.is_set())
+    check(results, 'счётчик потерянных аренд', pool.stats()['lease_lost'] == 1, pool.stats())
+    check(results, 'состояние задания не перезаписано',
+          job_row(job_id)['state'] == generation_queue.JOB_QUEUED and job_row(job_id)['lease_owner'] == 'other',
+          job_row(job_id))
+    return all(results)
+
+
+async def test_release_on_stop(repository, generation_queue) -> bool:
+    """Штатная остановка снимает аренду - задание сразу берёт другой процесс"""
+    logger.info("🔍 Остановка воркеров...")
+    reset_jobs()
+    results = []
+    job_id = repository.enqueue_generation_job(601, 601, 1, BIRTH_DATA, 0)
+    started = asyncio.Event()
+
+    async def slow_handler(lease):
+        await lease.advance(generation_queue.JOB_LLM)
+        started.set()
+        await asyncio.sleep(30)
+
+    pool = generation_queue.GenerationWorkerPool(slow_handler, workers=1)
+    pool.start()
+    await asyncio.wait_for(started.wait(), 5)
+    await pool.stop()
+    row = job_row(job_id)
+    check(results, 'аренда снята, стадия сохранена',
+          row['lease_owner'] is None and row['state'] == generation_queue.JOB_LLM, row)
+    next_job = repository.claim_generation_job('next-process', 60)
+    check(results, 'задание сразу доступно другому воркеру',
+          next_job is not None and next_job['job_id'] == job_id and next_job['state'] == generation_queue.JOB_LLM,
+          next_job)
+    return all(results)
+
+
+async def test_abandon_after_max_attempts(repository, generation_queue) -> bool:
+    """Задание, которое раз за разом роняет процесс, помечается failed"""
+    logger.info("🔍 Исчерпание попыток...")
+    reset_jobs()
+    results = []
+    job_id = repository.enqueue_generation_job(701, 701, 1, BIRTH_DATA, 0)
+    for _ in range(generation_queue.GENERATION_JOB_MAX_ATTEMPTS):
+        repository.claim_generation_job('crashed', 60)
+        expire_lease(job_id)
+
+    handled = []
+    abandoned = []
+
+    async def handler(lease):
+        handled.append(lease.job_id)
+
+    async def on_abandoned(lease, error):
+        abandoned.append((lease.job_id, error))
+
+    pool = generation_queue.GenerationWorkerPool(handler, on_abandoned, workers=1)
+    pool.start()
+    await wait_for(lambda: job_row(job_id)['state'] == generation_queue.JOB_FAILED)
+    await pool.stop()
+    row = job_row(job_id)
+    check(results, 'задание failed с описанием ошибки', row['state'] == 'failed' and bool(row['error']), row)
+    check(results, 'обработчик не вызывался', handled == [], handled)
+    check(results, 'вызван on_abandoned', [job for job, _ in abandoned] == [job_id], abandoned)
+    check(results, 'пользователь может поставить новое задание',
+          repository.enqueue_generation_job(701, 701, 1, BIRTH_DATA, 0) is not None)
+    return all(results)
+
+
+async def test_workers_presence(repository, generation_queue) -> bool:
+    """Запущенный пул отмечается в generation_workers, остановленный - снимает отметку"""
+    logger.info("🔍 Отметка запущенных воркеров...")
+    results = []
+    check(results, 'без воркеров проверка не проходит',
+          not await generation_queue.check_workers_alive('Проверка без воркеров'))
+
+    async def handler(lease):
+        pass
+
+    pool = generation_queue.GenerationWorkerPool(handler, workers=1)
+    pool.start()
+    await wait_for(lambda: repository.count_live_generation_workers(60) == 1)
+    check(results, 'пул отмечен', repository.count_live_generation_workers(60) == 1)
+    check(results, 'бот без воркеров видит пул другого процесса',
+          await generation_queue.check_workers_alive('Проверка с воркером'))
+    await pool.stop()
+    check(results, 'отметка снята при остановке', repository.count_live_generation_workers(60) == 0)
+
+    # Процесс упал и не снял отметку - через GENERATION_JOB_LEASE она не считается
+    sql("INSERT INTO generation_workers (worker_id, started_at, seen_at) "
+        "VALUES ('crashed', '2000-01-01T00:00:00', '2000-01-01T00:00:00')")
+    check(results, 'старая отметка упавшего процесса не считается',
+          not await generation_queue.check_workers_alive('Проверка после падения воркера'))
+    return all(results)
+
+
+async def run_pool_tests(repository, generation_queue) -> list:
+    return [
+        ("Продолжение со стадии", await test_resume_from_stage(repository, generation_queue)),
+        ("Потеря аренды", await test_heartbeat_lease_lost(repository, generation_queue)),
+        ("Остановка воркеров", await test_release_on_stop(repository, generation_queue)),
+        ("Исчерпание попыток", await test_abandon_after_max_attempts(repository, generation_queue)),
+        ("Отметка воркеров", await test_workers_presence(repository, generation_queue)),
+    ]
+
+
+def main():
+    logger.info("🚀 Проверка очереди генераций")
+    logger.info("=" * 60)
+
+    tmpdir = tempfile.mkdtemp()
+    db_pool.DATABASE_URL = None
+    db_pool.DATABASE = os.path.join(tmpdir, 'test_generation_queue.db')
+
+    from migrations import migrate
+    import generation_queue
+    import repository
+
+    migrate()
+    try:
+        results = [
+            ("Порядок выдачи", test_claim_order(repository)),
+            ("Одновременный захват", test_concurrent_claim(repository)),
+            ("Истечение аренды", test_lease_expiry(repository)),
+        ]
+        results += asyncio.run(run_pool_tests(repository, generation_queue))
+    finally:
+        repository.stop_event_buffer()
+        db_pool.close_pool()
+
+    logger.info("=" * 60)
+    logger.info("📊 Результаты:")
+    all_passed = True
+    for test_name, result in results:
+        status = "✅ ПРОЙДЕН" if result else "❌ ПРОВАЛЕН"
+        logger.info(f"   {test_name}: {status}")
+        if not result:
+            all_passed = False
+
+    if all_passed:
+        logger.info("✅ Очередь генераций работает корректно")
+        return 0
+    logger.error("❌ Есть ошибки в очереди генераций!")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Проверка ограничителя и повторов шлюза OpenAI (llm_gateway).
+
+Без сети: ограничитель проверяется напрямую, шлюз - с подменённым AsyncOpenAI.
+
+    - очередь с приоритетом: оплаченные раньше, внутри приоритета - по очереди
+    - не больше max_concurrency запросов одновременно
+    - token bucket: RPM и TPM задерживают запросы, когда ведро пусто
+    - пауза после 429 задерживает все запросы
+    - отменённый запрос уходит из очереди и не держит остальных
+    - шлюз повторяет 429 после Retry-After и ставит на паузу параллельные запросы
+
+    python test_llm_gateway.py
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+
+os.environ['LLM_RPM'] = '0'
+os.environ['LLM_TPM'] = '0'
+os.environ['LLM_MAX_CONCURRENCY'] = '4'
+os.environ['LLM_MAX_ATTEMPTS'] = '3'
+
+logging.basicConfig(
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+import httpx
+import openai
+
+import llm_gateway
+
+
+def check(results: list, name: str, passed: bool, details=None):
+    logger.info(f"   {'✅' if passed else '❌'} {name}")
+    if not passed and details is not None:
+        logger.error(f"      {details}")
+    results.append(passed)
+
+
+async def _hold(limiter, tokens: float, priority: int, order: list, name: str, hold: float = 0.0):
+    await limiter.acquire(tokens, priority)
+    order.append(name)
+    try:
+        await asyncio.sleep(hold)
+    finally:
+        await limiter.release()
+
+
+async def test_priority_order() -> bool:
+    """Оплаченные запросы проходят раньше, внутри приоритета - в порядке очереди"""
+    logger.info("🔍 Очередь с приоритетом...")
+    limiter = llm_gateway._RateLimiter(0, 0, 1)
+    order = []
+    await limiter.acquire(1, llm_gateway.PRIORITY_DEFAULT)  # слот занят - остальные ждут
+    tasks = []
+    for name, priority in (('default-1', llm_gateway.PRIORITY_DEFAULT), ('paid-1', llm_gateway.PRIORITY_PAID),
+                           ('default-2', llm_gateway.PRIORITY_DEFAULT), ('paid-2', llm_gateway.PRIORITY_PAID)):
+        tasks.append(asyncio.create_task(_hold(limiter, 1, priority, order, name)))
+        await asyncio.sleep(0.01)
+    results = []
+    check(results, 'все ждут освобождения слота', limiter.waiting() == 4 and order == [], order)
+    await limiter.release()
+    await asyncio.wait_for(asyncio.gather(*tasks), 5)
+    check(results, 'порядок выдачи', order == ['paid-1', 'paid-2', 'default-1', 'default-2'], order)
+    return all(results)
+
+
+async def test_concurrency_limit() -> bool:
+    """Не больше max_concurrency запросов одновременно"""
+    logger.info("🔍 Предел одновременных запросов...")
+    limiter = llm_gateway._RateLimiter(0, 0, 2)
+    peak = 0
+
+    async def request():
+        nonlocal peak
+        await limiter.acquire(1, llm_gateway.PRIORITY_PAID)
+        peak = max(peak, limiter.in_flight)
+        await asyncio.sleep(0.02)
+        await limiter.release()
+
+    await asyncio.wait_for(asyncio.gather(*(request() for _ in range(10))), 5)
+    results = []
+    check(results, 'одновременно не больше 2', peak == 2, peak)
+    check(results, 'все слоты освобождены', limiter.in_flight == 0 and limiter.waiting() == 0)
+    return all(results)
+
+
+async def test_token_buckets() -> bool:
+    """Пустое ведро RPM/TPM задерживает запрос на время пополнения"""
+    logger.info("🔍 Token bucket (RPM, TPM)...")
+    results = []
+
+    # RPM 600 - 10 запросов в секунду; ведро пусто - 3 запроса займут около 0.3 с
+    limiter = llm_gateway._RateLimiter(600, 0, 10)
+    limiter.requests.level = 0.0
+    started = time.monotonic()
+    order = []
+    await asyncio.wait_for(asyncio.gather(*(_hold(limiter, 1, 0, order, i) for i in range(3))), 5)
+    elapsed = time.monotonic() - started
+    check(results, f'RPM: 3 запроса при пустом ведре за {elapsed:.2f} с (ожидается ~0.3)', 0.25 <= elapsed < 1.0)
+
+    # TPM 6000 - 100 токенов в секунду; запрос на 50 токенов ждёт около 0.5 с
+    limiter = llm_gateway._RateLimiter(0, 6000, 10)
+    limiter.tokens.level = 0.0
+    started = time.monotonic()
+    await asyncio.wait_for(_hold(limiter, 50, 0, [], 'tpm'), 5)
+    elapsed = time.monotonic() - started
+    check(results, f'TPM: 50 токенов при пустом ведре за {elapsed:.2f} с (ожидается ~0.5)', 0.45 <= elapsed < 1.2)
+
+    # Запрос больше ёмкости ведра не ждёт вечно - списывается вся ёмкость
+    limiter = llm_gateway._RateLimiter(0, 60, 10)
+    await asyncio.wait_for(_hold(limiter, 1000, 0, [], 'huge'), 1)
+    check(results, 'запрос больше TPM выполняется при полном ведре', limiter.tokens.level <= 0.01, limiter.tokens.level)
+    return all(results)
+
+
+async def test_pause_after_429() -> bool:
+    """Пауза после 429 действует на все запросы"""
+    logger.info("🔍 Пауза после 429...")
+    limiter = llm_gateway._RateLimiter(0, 0, 10)
+    limiter.pause(0.3)
+    started = time.monotonic()
+    await asyncio.wait_for(asyncio.gather(*(_hold(limiter, 1, 0, [], i) for i in range(3))), 5)
+    elapsed = time.monotonic() - started
+    results = []
+    check(results, f'запросы ждут конца паузы ({elapsed:.2f} с)', 0.28 <= elapsed < 1.0)
+    return all(results)
+
+
+async def test_cancelled_waiter() -> bool:
+    """Отменённый запрос уходит из очереди и не блокирует следующих"""
+    logger.info("🔍 Отмена ожидающего запроса...")
+    limiter = llm_gateway._RateLimiter(0, 0, 1)
+    order = []
+    await limiter.acquire(1, 0)
+    first = asyncio.create_task(_hold(limiter, 1, llm_gateway.PRIORITY_PAID, order, 'cancelled'))
+    await asyncio.sleep(0.01)
+    second = asyncio.create_task(_hold(limiter, 1, llm_gateway.PRIORITY_DEFAULT, order, 'next'))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    await asyncio.gather(first, return_exceptions=True)
+    await limiter.release()
+    await asyncio.wait_for(second, 5)
+    results = []
+    check(results, 'следующий запрос выполнен', order == ['next'], order)
+    check(results, 'очередь пуста', limiter.waiting() == 0 and limiter.in_flight == 0)
+    return all(results)
+
+
+class _Stream:
+    """Потоковый ответ OpenAI: текст одним фрагментом и usage"""
+
+    def __init__(self, text: str):
+        self._events = [
+            type('Event', (), {'choices': [type('Choice', (), {'delta': type('Delta', (), {'content': text})()})()],
+                               'usage': None})(),
+            type('Event', (), {'choices': [], 'usage': {'prompt_tokens': 100, 'completion_tokens': 10,
+                                                        'prompt_tokens_details': {'cached_tokens': 64}}})(),
+        ]
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for event in self._events:
+            yield event
+
+
+class _FakeCompletions:
+    """Первый запрос получает 429 с Retry-After, остальные - ответ"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def create(self, messages, **kwargs):
+        label = messages[-1]['content']
+        self.calls.append((label, time.monotonic()))
+        if len(self.calls) == 1:
+            response = httpx.Response(429, request=httpx.Request('POST', 'https://api.openai.com'),
+                                      headers={'retry-after': '0.3'})
+            raise openai.RateLimitError('rate limited', response=response, body=None)
+        return _Stream(f"ответ {label}")
+
+
+class _FakeAsyncOpenAI:
+    completions = _FakeCompletions()
+
+    def __init__(self, **kwargs):
+        self.chat = type('Chat', (), {'completions': _FakeAsyncOpenAI.completions})()
+
+    async def close(self):
+        pass
+
+
+async def test_gateway_retry_429() -> bool:
+    """429 повторяется после Retry-After, параллельные запросы ждут той же паузы"""
+    logger.info("🔍 Повтор после 429 в шлюзе...")
+    original = llm_gateway.AsyncOpenAI
+    llm_gateway.AsyncOpenAI = _FakeAsyncOpenAI
+    gateway = llm_gateway.LLMGateway(api_key='test-key')
+    results = []
+    try:
+        started = time.monotonic()
+        first = asyncio.create_task(gateway.complete_detailed([{'role': 'user', 'content': 'first'}], max_tokens=10))
+        await asyncio.sleep(0.05)
+        second = await gateway.complete_detailed([{'role': 'user', 'content': 'second'}], max_tokens=10)
+        first = await asyncio.wait_for(first, 5)
+        calls = _FakeAsyncOpenAI.completions.calls
+        second_started = next(at for label, at in calls if label == 'second') - started
+        check(results, 'запрос после 429 выполнен со второй попытки',
+              first['text'] == 'ответ first' and first['attempts'] == 2, first)
+        check(results, f'параллельный запрос ждал паузу 429 ({second_started:.2f} с)', second_started >= 0.28)
+        check(results, 'usage из потока', second['prompt_tokens'] == 100 and second['cached_tokens'] == 64, second)
+        stats = gateway.stats()
+        check(results, 'счётчики 429 и повторов', stats['rate_limited'] == 1 and stats['retries'] == 1, stats)
+    finally:
+        gateway.shutdown()
+        llm_gateway.AsyncOpenAI = original
+    return all(results)
+
+
+async def run_tests() -> list:
+    return [
+        ("Очередь с приоритетом", await test_priority_order()),
+        ("Предел одновременных запросов", await test_concurrency_limit()),
+        ("Token bucket", await test_token_buckets()),
+        ("Пауза после 429", await test_pause_after_429()),
+        ("Отмена ожидающего запроса", await test_cancelled_waiter()),
+        ("Повтор 429 в шлюзе", await test_gateway_retry_429()),
+    ]
+
+
+def main():
+    logger.info("🚀 Проверка шлюза OpenAI")
+    logger.info("=" * 60)
+
+    results = asyncio.run(run_tests())
+
+    logger.info("=" * 60)
+    logger.info("📊 Результаты:")
+    all_passed = True
+    for test_name, result in results:
+        status = "✅ ПРОЙДЕН" if result else "❌ ПРОВАЛЕН"
+        logger.info(f"   {test_name}: {status}")
+        if not result:
+            all_passed = False
+
+    if all_passed:
+        logger.info("✅ Ограничитель и повторы работают корректно")
+        return 0
+    logger.error("❌ Есть ошибки в шлюзе OpenAI!")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
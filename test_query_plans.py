@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Проверка планов горячих запросов к events, payments и generation_jobs.
+
+Создаёт временную SQLite БД, применяет миграции, выполняет функции репозитория
+и скрипта воронки, перехватывает их SQL и проверяет EXPLAIN QUERY PLAN:
+каждый запрос должен идти по ожидаемому индексу, без полного просмотра таблицы.
+
+С флагом --postgres дополнительно проверяет те же функции на PostgreSQL из
+DATABASE_URL (только чтение, EXPLAIN без ANALYZE, seqscan отключён в транзакции).
+
+    python test_query_plans.py
+    python test_query_plans.py --postgres
+"""
+import os
+import sys
+import logging
+import tempfile
+from datetime import datetime, timedelta
+
+# Одно соединение в пуле - весь SQL проходит через него и попадает в перехват
+os.environ['DB_POOL_MAX_SIZE'] = '1'
+os.environ['DB_POOL_MIN_SIZE'] = '1'
+
+logging.basicConfig(
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+import db_pool
+
+# Горячие запросы: (описание, вызов, индекс, который должен использоваться)
+HOT_QUERIES = [
+    ('get_last_payment', lambda repo: repo.get_last_payment(1001), 'idx_payments_user_status_created'),
+    ('get_pending_payment', lambda repo: repo.get_pending_payment(1001), 'idx_payments_user_status_created'),
+    ('get_unprocessed_succeeded_payment', lambda repo: repo.get_unprocessed_succeeded_payment(1001),
+     'idx_payments_user_status_created'),
+    ('list_stale_pending_payments', lambda repo: repo.list_stale_pending_payments(limit=10), 'idx_payments_pending_created'),
+    ('get_active_generation_job', lambda repo: repo.get_active_generation_job(1001), 'idx_generation_jobs_active_user'),
+    ('claim_generation_job', lambda repo: repo.claim_generation_job('test-worker', 120), 'idx_generation_jobs_claim'),
+]
+
+# Отчёты читают дневные агрегаты, а агрегаты считаются по диапазону timestamp
+FUNNEL_INDEX = 'idx_event_daily_users_type_day'
+ROLLUP_INDEX = ('idx_events_timestamp', 'idx_events_type_timestamp')
+
+
+def seed(conn):
+    """Заполняет БД событиями, платежами и заданиями генерации, чтобы планировщику было что выбирать"""
+    cursor = conn.cursor()
+    now = datetime.now()
+    event_types = ['start', 'profile_complete', 'payment_start', 'payment_success',
+                   'natal_chart_generation_start', 'natal_chart_success', 'natal_chart_error']
+    users = [(1000 + i,) for i in range(200)]
+    cursor.executemany('INSERT INTO users (user_id) VALUES (?)', users)
+    events = []
+    for i in range(5000):
+        ts = (now - timedelta(minutes=i)).isoformat()
+        events.append((1000 + i % 200, event_types[i % len(event_types)], '{}', ts))
+    cursor.executemany('INSERT INTO events (user_id, event_type, event_data, timestamp) VALUES (?, ?, ?, ?)', events)
+    payments = []
+    for i in range(1000):
+        status = 'pending' if i % 20 == 0 else ('succeeded' if i % 2 else 'canceled')
+        ts = (now - timedelta(hours=i)).isoformat()
+        payments.append((1000 + i % 200, f'yk-{i}', f'int-{i}', 990.0, status, ts, ts))
+    cursor.executemany('''
+        INSERT INTO payments (user_id, yookassa_payment_id, internal_payment_id, amount, status, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', payments)
+    jobs = []
+    for i in range(2000):
+        # Почти все задания завершены, незавершённые - у последних 20 пользователей
+        state = 'queued' if i >= 1980 else ('done' if i % 10 else 'failed')
+        ts = (now - timedelta(minutes=i)).isoformat()
+        jobs.append((1000 + i % 200, 1000 + i % 200, '{}', 1, state, ts, ts))
+    cursor.executemany('''
+        INSERT INTO generation_jobs (user_id, chat_id, birth_data, priority, state, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', jobs)
+    cursor.execute('ANALYZE')
+    conn.commit()
+
+
+def capture_sqlite(conn, func, prefix='SELECT'):
+    """Выполняет func и возвращает запросы с началом prefix, отправленные в SQLite (с подставленными параметрами)"""
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        func()
+    finally:
+        conn.set_trace_callback(None)
+    return [s for s in statements if s.lstrip().upper().startswith(prefix)]
+
+
+def check_sqlite_plan(conn, name, statements, index_name):
+    """Проверяет, что запросы идут по index_name (или одному из кортежа) и не сканируют events/payments целиком"""
+    index_names = index_name if isinstance(index_name, tuple) else (index_name,)
+    if not statements:
+        logger.error(f"   ❌ {name}: запрос не перехвачен")
+        return False
+    ok = True
+    for sql in statements:
+        plan = [row[-1] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}').fetchall()]
+        full_scans = [step for step in plan
+                      if step.startswith('SCAN') and ('events' in step or 'payments' in step) and 'INDEX' not in step
+                      and 'SUBQUERY' not in step]
+        uses_index = any(index in step for step in plan for index in index_names)
+        if full_scans or not uses_index:
+            logger.error(f"   ❌ {name}: ожидался индекс {index_name}, план: {plan}")
+            ok = False
+    if ok:
+        logger.info(f"   ✅ {name}: {index_name}")
+    return ok
+
+
+def test_sqlite_plans():
+    """Планы горячих запросов на SQLite после миграций"""
+    logger.info("🔍 Проверка планов запросов (SQLite)...")
+    tmpdir = tempfile.mkdtemp()
+    db_pool.DATABASE_URL = None
+    db_pool.DATABASE = os.path.join(tmpdir, 'test_query_plans.db')
+
+    from migrations import migrate
+    import events_maintenance
+    import repository
+    import view_funnel
+
+    migrate()
+    results = []
+    with db_pool.db_connection() as (conn, db_type):
+        seed(conn)
+
+    # В пуле одно соединение - функции репозитория выполняются через этот же conn
+    for name, call, index_name in HOT_QUERIES:
+        statements = capture_sqlite(conn, lambda: call(repository))
+        results.append(check_sqlite_plan(conn, name, statements, index_name))
+
+    # Пересчёт агрегатов за день (диапазон timestamp) и воронка за день (агрегаты по event_type + day)
+    with db_pool.db_connection() as (conn, db_type):
+        day = events_maintenance.report_today()
+        statements = capture_sqlite(
+            conn, lambda: events_maintenance.refresh_rollups_for_day(conn.cursor(), db_type, day), prefix='INSERT'
+        )
+        results.append(check_sqlite_plan(conn, 'events_maintenance.refresh_rollups_for_day', statements, ROLLUP_INDEX))
+        conn.commit()
+
+        statements = capture_sqlite(
+            conn, lambda: view_funnel.get_funnel_stats(db_type, conn.cursor(), day.isoformat())
+        )
+        statements = [s for s in statements if 'event_daily_users' in s and 'event_type =' in s]
+        results.append(check_sqlite_plan(conn, 'view_funnel.get_funnel_stats', statements, FUNNEL_INDEX))
+
+    repository.stop_event_buffer()
+    db_pool.close_pool()
+    return all(results)
+
+
+def test_postgres_plans():
+    """Планы горячих запросов на PostgreSQL из DATABASE_URL (только EXPLAIN)"""
+    logger.info("🔍 Проверка планов запросов (PostgreSQL)...")
+    if not os.getenv('DATABASE_PUBLIC_URL') and not os.getenv('DATABASE_URL'):
+        logger.error("   ❌ DATABASE_URL не задана")
+        return False
+
+    import psycopg2.extensions
+    import repository
+
+    class RecordingCursor(psycopg2.extensions.cursor):
+        statements = []
+
+        def execute(self, query, vars=None):
+            if query.lstrip().upper().startswith('SELECT'):
+                RecordingCursor.statements.append(self.mogrify(query, vars).decode())
+            return super().execute(query, vars)
+
+    results = []
+    for name, call, index_name in HOT_QUERIES:
+        with db_pool.db_connection() as (conn, db_type):
+            if db_type != 'postgresql':
+                logger.error("   ❌ Не удалось подключиться к PostgreSQL")
+                return False
+            conn.cursor_factory = RecordingCursor
+        RecordingCursor.statements = []
+        call(repository)
+        with db_pool.db_connection() as (conn, db_type):
+            conn.cursor_factory = psycopg2.extensions.cursor
+            cursor = conn.cursor()
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            ok = bool(RecordingCursor.statements)
+            for sql in RecordingCursor.statements:
+                cursor.execute(f'EXPLAIN {sql}')
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+                if index_name not in plan or 'Seq Scan on events' in plan or 'Seq Scan on payments' in plan:
+                    logger.error(f"   ❌ {name}: ожидался индекс {index_name}, план:\n{plan}")
+                    ok = False
+            conn.rollback()
+        if ok:
+            logger.info(f"   ✅ {name}: {index_name}")
+        results.append(ok)
+
+    repository.stop_event_buffer()
+    db_pool.close_pool()
+    return all(results)
+
+
+def main():
+    logger.info("🚀 Проверка планов запросов")
+    logger.info("=" * 60)
+
+    if '--postgres' in sys.argv:
+        results = [("PostgreSQL", test_postgres_plans())]
+    else:
+        results = [("SQLite", test_sqlite_plans())]
+
+    logger.info("=" * 60)
+    logger.info("📊 Результаты:")
+    all_passed = True
+    for test_name, result in results:
+        status = "✅ ПРОЙДЕН" if result else "❌ ПРОВАЛЕН"
+        logger.info(f"   {test_name}: {status}")
+        if not result:
+            all_passed = False
+
+    if all_passed:
+        logger.info("✅ Все запросы используют индексы")
+        return 0
+    logger.error("❌ Есть запросы без подходящего индекса!")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Проверка повторной генерации отчёта по контрольным точкам разделов.
+
+Создаёт временную SQLite БД, ставит оплаченную генерацию в очередь и прогоняет
+её через воркеров generation_queue с подменённым OpenAI (llm_gateway.complete_detailed),
+расчётом карты и сборкой PDF:
+
+    1. Раздел 3 падает - остальные разделы сохранены в report_section_checkpoints,
+       задание failed, оплата не списана, пользователю показана кнопка "Попробовать снова"
+    2. Повтор запрашивает у OpenAI только раздел 3, PDF отправлен, оплата списана,
+       контрольные точки пользователя удалены
+    3. Задание на стадии delivering без файла PDF: PDF пересобирается из сохранённого
+       текста без OpenAI, новый путь записан в stage_data до отправки
+
+    python test_report_checkpoints.py
+"""
+import os
+import sys
+import json
+import asyncio
+import logging
+import sqlite3
+import tempfile
+
+os.environ.setdefault('OPENAI_API_KEY', 'test-key')
+os.environ['GENERATION_JOB_POLL_INTERVAL'] = '0.1'
+os.environ['REPORT_PROGRESS_EDIT_INTERVAL'] = '0'
+os.environ['REPORT_PREFIX_WARMUP_TIMEOUT'] = '0'
+
+logging.basicConfig(
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+import db_pool
+
+USER_ID = 5001
+BIRTH_DATA = {'name': 'Тест', 'date': '15.03.1990', 'time': '14:30', 'place': 'Москва'}
+
+
+class FakeBot:
+    """Bot API: запоминает отправленные сообщения и документы"""
+
+    def __init__(self):
+        self.messages = []
+        self.documents = []
+        self.on_document = None  # корутина, которую ждёт отправка документа
+
+    async def edit_message_text(self, **kwargs):
+        self.messages.append(kwargs)
+
+    async def send_message(self, **kwargs):
+        self.messages.append(kwargs)
+
+    async def send_document(self, **kwargs):
+        if self.on_document is not None:
+            await self.on_document()
+        self.documents.append(kwargs['filename'])
+
+    def has_retry_button(self) -> bool:
+        for message in self.messages:
+            markup = message.get('reply_markup')
+            for row in getattr(markup, 'inline_keyboard', ()):
+                if any(button.callback_data == 'natal_chart' for button in row):
+                    return True
+        return False
+
+
+class FakeOpenAI:
+    """Ответы разделов по номеру; разделы из failing падают"""
+
+    def __init__(self):
+        self.failing = set()
+        self.requested = []
+
+    async def complete_detailed(self, messages, **kwargs):
+        section = int(kwargs['label'].split()[-1])
+        self.requested.append(section)
+        await asyncio.sleep(0.01)
+        if section in self.failing:
+            raise RuntimeError(f"OpenAI недоступен (раздел {section})")
+        return {
+            'text': f"Текст раздела {section}. " * 20,
+            'prompt_tokens': 1000, 'cached_tokens': 0, 'completion_tokens': 100,
+            'queue_seconds': 0.0, 'first_token_seconds': 0.01, 'response_seconds': 0.01, 'attempts': 1,
+        }
+
+
+def job_stage_data(job_id: int) -> dict:
+    conn = sqlite3.connect(db_pool.DATABASE)
+    try:
+        row = conn.execute('SELECT stage_data FROM generation_jobs WHERE job_id = ?', (job_id,)).fetchone()
+    finally:
+        conn.close()
+    return json.loads(row[0])
+
+
+def checkpointed_sections() -> list:
+    conn = sqlite3.connect(db_pool.DATABASE)
+    try:
+        rows = conn.execute(
+            'SELECT section FROM report_section_checkpoints WHERE user_id = ? ORDER BY section', (USER_ID,)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [row[0] for row in rows]
+
+
+async def run_generation(bot_module, repository) -> dict:
+    """Ставит задание пользователя в очередь и ждёт, пока воркер его закончит"""
+    assert await bot_module.enqueue_natal_chart_generation(USER_ID, USER_ID, 100, BIRTH_DATA, 0)
+    job = repository.get_active_generation_job(USER_ID)
+    for _ in range(300):
+        await asyncio.sleep(0.05)
+        if repository.get_active_generation_job(USER_ID) is None:
+            break
+    conn = sqlite3.connect(db_pool.DATABASE)
+    try:
+        state, error = conn.execute(
+            'SELECT state, error FROM generation_jobs WHERE job_id = ?', (job['job_id'],)
+        ).fetchone()
+    finally:
+        conn.close()
+    return {'state': state, 'error': error}
+
+
+async def run_scenario() -> bool:
+    import bot as bot_module
+    import generation_queue
+    import llm_gateway
+    import repository
+
+    fake_openai = FakeOpenAI()
+    llm_gateway.complete_detailed = fake_openai.complete_detailed
+
+    # Карта и PDF не нужны для проверки: подменяем расчёт и сборку
+    tmpdir = tempfile.mkdtemp()
+
+    def fake_pdf(markdown_text, title, chart_data=None):
+        path = os.path.join(tmpdir, 'report.pdf')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(markdown_text)
+        return path
+
+    bot_module.calculate_natal_chart = lambda birth_data: {}
+    bot_module.format_natal_chart_data = lambda chart_data: 'Данные натальной карты'
+    bot_module.generate_pdf_from_markdown = fake_pdf
+
+    repository.mark_user_paid(USER_ID)
+    fake_bot = FakeBot()
+    bot_module.start_generation_workers(fake_bot)
+    ok = True
+    try:
+        logger.info("🔍 Раздел 3 падает...")
+        fake_openai.failing = {3}
+        job = await run_generation(bot_module, repository)
+        sections = checkpointed_sections()
+        checks = [
+            ('задание failed', job['state'] == generation_queue.JOB_FAILED),
+            ('остальные разделы сохранены', sections == [1, 2, 4, 5, 6, 7]),
+            ('оплата не списана', repository.user_has_paid(USER_ID)),
+            ('PDF не отправлен', not fake_bot.documents),
+            ('кнопка "Попробовать снова"', fake_bot.has_retry_button()),
+        ]
+        for name, passed in checks:
+            logger.info(f"   {'✅' if passed else '❌'} {name}")
+            ok = ok and passed
+        if not ok:
+            logger.error(f"   задание: {job}, разделы: {sections}")
+
+        logger.info("🔍 Повтор генерации...")
+        fake_openai.failing = set()
+        fake_openai.requested = []
+        job = await run_generation(bot_module, repository)
+        checks = [
+            ('задание done', job['state'] == generation_queue.JOB_DONE),
+            ('запрошен только раздел 3', fake_openai.requested == [3]),
+            ('PDF отправлен', len(fake_bot.documents) == 1),
+            ('оплата списана', not repository.user_has_paid(USER_ID)),
+            ('контрольные точки удалены', checkpointed_sections() == []),
+        ]
+        for name, passed in checks:
+            logger.info(f"   {'✅' if passed else '❌'} {name}")
+            ok = ok and passed
+        if not ok:
+            logger.error(f"   задание: {job}, запрошены разделы: {fake_openai.requested}")
+
+        logger.info("🔍 Продолжение на стадии delivering без файла PDF...")
+        ok = await check_delivering_rebuild(repository, generation_queue, fake_openai, fake_bot) and ok
+    finally:
+        await bot_module.stop_generation_workers()
+    return ok
+
+
+async def check_delivering_rebuild(repository, generation_queue, fake_openai, fake_bot) -> bool:
+    """Упавший на отправке процесс: файл PDF пропал вместе с контейнером"""
+    repository.mark_user_paid(USER_ID)
+    job_id = repository.enqueue_generation_job(USER_ID, USER_ID, 100, BIRTH_DATA, 0)
+    repository.claim_generation_job('crashed', 60)
+    repository.update_generation_job(job_id, 'crashed', generation_queue.JOB_DELIVERING, {
+        'report_markdown': '## Раздел 1\n\nТекст отчёта',
+        'pdf_path': '/nonexistent/report.pdf',
+    })
+    conn = sqlite3.connect(db_pool.DATABASE)
+    try:
+        conn.execute("UPDATE generation_jobs SET lease_expires_at = '2000-01-01T00:00:00' WHERE job_id = ?",
+                     (job_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+    fake_openai.requested = []
+    stage_data_on_send = {}
+
+    async def remember_stage_data():
+        stage_data_on_send.update(job_stage_data(job_id))
+        stage_data_on_send['pdf_exists'] = os.path.exists(stage_data_on_send.get('pdf_path') or '')
+
+    fake_bot.on_document = remember_stage_data
+    try:
+        for _ in range(300):
+            await asyncio.sleep(0.05)
+            if repository.get_active_generation_job(USER_ID) is None:
+                break
+    finally:
+        fake_bot.on_document = None
+
+    pdf_path = stage_data_on_send.get('pdf_path')
+    checks = [
+        ('OpenAI не вызывался', fake_openai.requested == []),
+        ('PDF отправлен', len(fake_bot.documents) == 2),
+        ('новый путь PDF записан до отправки',
+         pdf_path not in (None, '/nonexistent/report.pdf') and stage_data_on_send['pdf_exists']),
+    ]
+    ok = True
+    for name, passed in checks:
+        logger.info(f"   {'✅' if passed else '❌'} {name}")
+        ok = ok and passed
+    if not ok:
+        logger.error(f"   stage_data при отправке: {stage_data_on_send}, запрошены разделы: {fake_openai.requested}")
+    return ok
+
+
+def test_failed_section_keeps_checkpoints():
+    """Упавший раздел не списывает оплату, повтор догенерирует только его"""
+    tmpdir = tempfile.mkdtemp()
+    db_pool.DATABASE_URL = None
+    db_pool.DATABASE = os.path.join(tmpdir, 'test_report_checkpoints.db')
+
+    from migrations import migrate
+    import repository
+
+    migrate()
+    try:
+        return asyncio.run(run_scenario())
+    finally:
+        repository.stop_event_buffer()
+        db_pool.close_pool()
+
+
+def main():
+    logger.info("🚀 Проверка контрольных точек отчёта")
+    logger.info("=" * 60)
+
+    results = [
+        ("Повтор после упавшего раздела", test_failed_section_keeps_checkpoints()),
+    ]
+
+    logger.info("=" * 60)
+    logger.info("📊 Результаты:")
+    all_passed = True
+    for test_name, result in results:
+        status = "✅ ПРОЙДЕН" if result else "❌ ПРОВАЛЕН"
+        logger.info(f"   {test_name}: {status}")
+        if not result:
+            all_passed = False
+
+    if all_passed:
+        logger.info("✅ Готовые разделы переживают ошибку генерации")
+        return 0
+    logger.error("❌ Повторная генерация работает неправильно!")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тест календаря транзитов (transit_calendar.py) против перебора по часам:
+    - найдены все точные аспекты, которые находит перебор (Солнце, Марс, Сатурн)
+    - в момент 'exact' угол равен аспекту, в 'start' и 'end' - аспекту ± орбис
+    - события идут по возрастанию точного момента
+
+Запуск: python test_transit_calendar.py
+"""
+import logging
+import sys
+
+import numpy as np
+import swisseph as swe
+
+import chart_engine
+import ephemeris
+import transit_calendar
+
+logging.basicConfig(
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+START_JD = 2461041.5  # 01.01.2026
+DAYS = 365
+TOLERANCE = 1e-4  # градусы: Луна проходит это за ~1 с, медленные планеты - за минуты
+CHARTS = [
+    (2447966.0, 55.7558, 37.6173),   # 15.03.1990, Москва
+    (2451544.8, 55.0084, 82.9357),   # 01.01.2000, Новосибирск
+    (2436000.3, -33.8688, 151.2093),  # 1957, Сидней
+]
+
+
+def deviation(jd: float, body: str, natal_longitude: float, angle: float) -> float:
+    """Отклонение угла транзит-натал от аспекта angle, градусы"""
+    longitude = swe.calc_ut(jd, ephemeris.PLANETS[body], swe.FLG_SWIEPH)[0][0]
+    return abs(abs(transit_calendar._wrap(longitude - natal_longitude)) - angle)
+
+
+def brute_force_count(chart: ephemeris.Chart, bodies: list) -> int:
+    """Число точных аспектов перебором с шагом в час"""
+    _, natal_longitudes = chart.points()
+    hours = START_JD + np.arange(DAYS * 24) / 24.0
+    count = 0
+    for body in bodies:
+        longitudes = np.array([swe.calc_ut(jd, ephemeris.PLANETS[body], swe.FLG_SWIEPH)[0][0] for jd in hours])
+        for natal in natal_longitudes:
+            for offset in (0, 60, -60, 90, -90, 120, -120, 180):
+                diff = transit_calendar._wrap(longitudes - natal - offset)
+                count += int(np.sum(((diff[:-1] < 0) != (diff[1:] < 0)) & (np.abs(diff[1:] - diff[:-1]) < 90)))
+    return count
+
+
+def test_chart(jd: float, lat: float, lon: float) -> bool:
+    chart = ephemeris.Chart(jd, lat, lon)
+    names, natal_longitudes = chart.points()
+    orb = chart_engine.TRANSIT_ASPECTS[0][2]
+    angles = {name: angle for name, angle, _ in chart_engine.TRANSIT_ASPECTS}
+    events = list(transit_calendar.transit_calendar(chart, START_JD, START_JD + DAYS))
+    ok = True
+
+    bodies = ['Sun', 'Mars', 'Saturn']
+    expected = brute_force_count(chart, bodies)
+    found = sum(1 for event in events if event['transit'] in bodies)
+    if found != expected:
+        logger.error(f"   ❌ jd={jd}: перебор нашёл {expected} аспектов, календарь - {found}")
+        ok = False
+
+    worst_exact = worst_orb = 0.0
+    for event in events:
+        natal = natal_longitudes[names.index(event['natal'])]
+        angle = angles[event['aspect']]
+        worst_exact = max(worst_exact, deviation(event['exact_jd'], event['transit'], natal, angle))
+        for key in ('start_jd', 'end_jd'):
+            if event[key] is not None:
+                worst_orb = max(worst_orb, abs(deviation(event[key], event['transit'], natal, angle) - orb))
+        if not ((event['start_jd'] or event['exact_jd']) <= event['exact_jd'] <= (event['end_jd'] or event['exact_jd'])):
+            logger.error(f"   ❌ {transit_calendar.format_event(event)}: вход/выход из орбиса не вокруг точного момента")
+            ok = False
+    exact_moments = [event['exact_jd'] for event in events]
+    if exact_moments != sorted(exact_moments):
+        logger.error("   ❌ События не по возрастанию точного момента")
+        ok = False
+    if worst_exact > TOLERANCE or worst_orb > TOLERANCE:
+        logger.error(f"   ❌ Отклонение: точный момент {worst_exact:.2e}°, орбис {worst_orb:.2e}°")
+        ok = False
+
+    logger.info(f"   jd={jd}: {len(events)} событий, отклонение {worst_exact:.1e}° / {worst_orb:.1e}°")
+    return ok
+
+
+def main():
+    logger.info("🚀 Тест календаря транзитов")
+    logger.info("=" * 60)
+
+    results = [(f"Карта {i + 1}", test_chart(*chart)) for i, chart in enumerate(CHARTS)]
+
+    logger.info("=" * 60)
+    logger.info("📊 Результаты:")
+    all_passed = True
+    for test_name, result in results:
+        status = "✅ ПРОЙДЕН" if result else "❌ ПРОВАЛЕН"
+        logger.info(f"   {test_name}: {status}")
+        if not result:
+            all_passed = False
+
+    if all_passed:
+        logger.info("✅ Календарь совпадает с перебором по часам")
+        return 0
+    logger.error("❌ Календарь расходится с перебором!")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
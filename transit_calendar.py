@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Календарь транзитов: точные транзитные аспекты к точкам натальной карты за
+период (например, 12 месяцев) с моментами входа в орбис, точного аспекта и
+выхода из орбиса.
+
+Расчёт без перебора по минутам:
+    1) долготы транзитных планет на сетке по дням (0h UT) - одни и те же дни
+       для всех пользователей, поэтому сетка берётся из общего кэша
+       ephemeris.transit_longitudes
+    2) одной матрицей NumPy (планеты x натальные точки x аспекты x дни)
+       находятся интервалы сетки, на которых отклонение от точного аспекта
+       меняет знак
+    3) каждый момент уточняется методом ложного положения внутри интервала
+       сетки (две-три долготы на момент), вход и выход из орбиса - так же
+
+События выдаются генератором в порядке точного момента: первое доступно сразу
+после расчёта сетки, а сообщение в Telegram или PDF можно собирать по мере
+поступления событий.
+
+    chart = bot.load_chart(birth_data)
+    for event in transit_calendar(chart, start_jd, start_jd + 365):
+        text = format_event(event, tz)
+
+Луна по умолчанию не входит в календарь (её аспекты длятся часы и повторяются
+каждый месяц); её можно передать в bodies.
+"""
+
+import heapq
+import logging
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import swisseph as swe
+
+import chart_engine
+import ephemeris
+
+logger = logging.getLogger(__name__)
+
+# Транзитные планеты календаря по умолчанию
+CALENDAR_BODIES = ['Sun', 'Mercury', 'Venus', 'Mars', 'Jupiter', 'Saturn', 'Uranus', 'Neptune', 'Pluto']
+# Шаг сетки (сутки) и запас по краям периода для поиска входа и выхода из орбиса
+GRID_STEP = 1.0
+GRID_MARGIN = 60
+# Точность уточнения момента (сутки): около 1 секунды
+TIME_TOLERANCE = 1e-5
+
+POINT_NAMES_RU = {
+    'Sun': 'Солнце',
+    'Moon': 'Луна',
+    'Mercury': 'Меркурий',
+    'Venus': 'Венера',
+    'Mars': 'Марс',
+    'Jupiter': 'Юпитер',
+    'Saturn': 'Сатурн',
+    'Uranus': 'Уран',
+    'Neptune': 'Нептун',
+    'Pluto': 'Плутон',
+    'NorthNode': 'Северный узел',
+    'Ascendant': 'Асцендент',
+    'MC': 'MC',
+}
+
+_J2000 = datetime(2000, 1, 1, 12, tzinfo=timezone.utc)
+
+
+def jd_to_datetime(jd: float) -> datetime:
+    """Юлианская дата (UT) -> datetime в UTC"""
+    return _J2000 + timedelta(days=jd - 2451545.0)
+
+
+def _wrap(angle):
+    """Угол в диапазоне -180..180°"""
+    return (angle + 180.0) % 360.0 - 180.0
+
+
+def _longitude(jd: float, body_id: int) -> float:
+    """
+    Долгота транзитной планеты напрямую из Swiss Ephemeris: без скорости это вдвое
+    дешевле, а таблица ephemeris_table выгодна только для всех тел на одну дату.
+    """
+    return swe.calc_ut(jd, body_id, swe.FLG_SWIEPH)[0][0]
+
+
+def _refine(body_id: int, target: float, offset: float, lo: float, f_lo: float, hi: float, f_hi: float) -> float:
+    """
+    Момент t в [lo, hi], когда _wrap(долгота(t) - target) = offset.
+    f_lo и f_hi - отклонения на концах (разного знака), известные по сетке.
+    Метод ложного положения (Illinois): за сутки движение почти линейно, и
+    двух-трёх вычислений долготы хватает до точности TIME_TOLERANCE.
+    """
+    side = 0
+    t = lo
+    for _ in range(50):
+        previous = t
+        t = (f_lo * hi - f_hi * lo) / (f_lo - f_hi)
+        if abs(t - previous) < TIME_TOLERANCE:
+            return t
+        f = _wrap(_longitude(t, body_id) - target) - offset
+        if f == 0:
+            return t
+        if (f < 0) == (f_hi < 0):
+            hi, f_hi = t, f
+            if side == -1:
+                f_lo /= 2
+            side = -1
+        else:
+            lo, f_lo = t, f
+            if side == 1:
+                f_hi /= 2
+            side = 1
+    return t
+
+
+def _targets(aspects: list) -> list:
+    """(индекс аспекта, смещение от натальной точки): у соединения и оппозиции - одно, у остальных - два"""
+    targets = []
+    for index, (_, angle, _) in enumerate(aspects):
+        targets.append((index, angle))
+        if 0.0 < angle < 180.0:
+            targets.append((index, -angle))
+    return targets
+
+
+def transit_calendar(chart: ephemeris.Chart, start_jd: float, end_jd: float,
+                     bodies: list = None, aspects: list = None):
+    """
+    Генератор точных транзитных аспектов к точкам карты chart в периоде
+    [start_jd, end_jd), по возрастанию момента точного аспекта.
+
+    Событие - словарь {'transit', 'natal', 'aspect', 'angle', 'retrograde',
+    'start', 'exact', 'end'} (моменты - datetime в UTC) и те же моменты в
+    юлианских датах 'start_jd', 'exact_jd', 'end_jd'. Если вход или выход из
+    орбиса дальше GRID_MARGIN дней за границей периода, момент - None.
+    При попятном движении аспект бывает точным несколько раз за один
+    заход в орбис - это отдельные события с общими start и end.
+    """
+    bodies = CALENDAR_BODIES if bodies is None else bodies
+    aspects = chart_engine.TRANSIT_ASPECTS if aspects is None else aspects
+    body_rows = [ephemeris.TRANSIT_BODIES.index(body) for body in bodies]
+    natal_names, natal_longitudes = chart.points()
+    targets = _targets(aspects)
+
+    # Сетка по дням в 0h UT - общие дни для всех карт (кэш transit_longitudes)
+    first_day = np.floor(start_jd - 0.5) + 0.5 - GRID_MARGIN
+    days = int(np.ceil((end_jd - first_day) / GRID_STEP)) + GRID_MARGIN + 1
+    grid = first_day + GRID_STEP * np.arange(days)
+    longitudes = np.array([ephemeris.transit_longitudes(float(jd)) for jd in grid])[:, body_rows].T
+
+    # deviation[b, p, a, k] - отклонение планеты b от точного аспекта a к точке p в день k
+    offsets = np.array([offset for _, offset in targets])
+    orbs = np.array([aspects[index][2] for index, _ in targets])
+    deviation = _wrap(
+        longitudes[:, None, None, :]
+        - np.asarray(natal_longitudes, dtype=float)[None, :, None, None]
+        - offsets[None, None, :, None]
+    )
+    before, after = deviation[..., :-1], deviation[..., 1:]
+    # Смена знака без скачка через ±180° - внутри интервала точный аспект
+    crossing = ((before < 0) != (after < 0)) & (np.abs(after - before) < 90.0)
+    b_idx, p_idx, a_idx, k_idx = np.nonzero(crossing)
+
+    # Точный момент лежит внутри своего дня сетки: кандидаты - по дням, а готовые
+    # события ждут в куче, пока не начнётся день позже их точного момента
+    in_window = (grid[k_idx + 1] >= start_jd) & (grid[k_idx] < end_jd)
+    order = np.argsort(k_idx[in_window], kind='stable')
+    candidates = np.stack([b_idx, p_idx, a_idx, k_idx], axis=1)[in_window][order]
+    outside = np.abs(deviation) > orbs[None, None, :, None]
+    logger.debug(f"Календарь транзитов: {len(candidates)} кандидатов на сетке из {days} дней")
+
+    ready = []
+    for number, (b, p, a, k) in enumerate(candidates.tolist()):
+        while ready and ready[0][0] <= grid[k]:
+            yield heapq.heappop(ready)[2]
+
+        body_id = ephemeris.PLANETS[bodies[b]]
+        target = natal_longitudes[p] + offsets[a]
+        series = deviation[b, p, a]
+        exact = _refine(body_id, target, 0.0, grid[k], series[k], grid[k + 1], series[k + 1])
+        if not start_jd <= exact < end_jd:
+            continue
+
+        out = outside[b, p, a]
+        # Вход в орбис: последний день вне орбиса до точного аспекта
+        start = None
+        previous = np.flatnonzero(out[:k + 1])
+        if len(previous):
+            j = previous[-1]
+            orb = np.copysign(orbs[a], series[j])
+            inner, f_inner = (grid[j + 1], series[j + 1] - orb) if j < k else (exact, -orb)
+            start = _refine(body_id, target, orb, grid[j], series[j] - orb, inner, f_inner)
+        # Выход из орбиса: первый день вне орбиса после точного аспекта
+        end = None
+        following = np.flatnonzero(out[k + 1:])
+        if len(following):
+            j = k + 1 + following[0]
+            orb = np.copysign(orbs[a], series[j])
+            inner, f_inner = (grid[j - 1], series[j - 1] - orb) if j > k + 1 else (exact, -orb)
+            end = _refine(body_id, target, orb, inner, f_inner, grid[j], series[j] - orb)
+
+        name, angle, _ = aspects[targets[a][0]]
+        heapq.heappush(ready, (exact, number, {
+            'transit': bodies[b],
+            'natal': natal_names[p],
+            'aspect': name,
+            'angle': angle,
+            # Отклонение от аспекта убывает - планета движется попятно
+            'retrograde': bool(series[k + 1] < series[k]),
+            'start': jd_to_datetime(start) if start is not None else None,
+            'exact': jd_to_datetime(exact),
+            'end': jd_to_datetime(end) if end is not None else None,
+            'start_jd': float(start) if start is not None else None,
+            'exact_jd': float(exact),
+            'end_jd': float(end) if end is not None else None,
+        }))
+
+    while ready:
+        yield heapq.heappop(ready)[2]
+
+
+def format_event(event: dict, tz=None) -> str:
+    """Строка календаря: '12.03.2025 14:05 - Сатурн (R) Квадрат Солнце (01.03 - 25.03)'"""
+    tz = tz or timezone.utc
+
+    def local(moment, fmt):
+        return moment.astimezone(tz).strftime(fmt) if moment is not None else '…'
+
+    transit = POINT_NAMES_RU.get(event['transit'], event['transit'])
+    if event['retrograde']:
+        transit += ' (R)'
+    natal = POINT_NAMES_RU.get(event['natal'], event['natal'])
+    return (
+        f"{local(event['exact'], '%d.%m.%Y %H:%M')} - {transit} {event['aspect']} {natal} "
+        f"({local(event['start'], '%d.%m')} - {local(event['end'], '%d.%m')})"
+    )
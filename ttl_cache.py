@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Потокобезопасный LRU-кэш с ограничением по времени жизни записей (TTL).
+
+Используется для кэширования данных в памяти процесса (профили пользователей и т.п.).
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    LRU-кэш на max_size записей, каждая живёт не дольше ttl секунд.
+
+    Чтобы медленное чтение из БД не перезаписало более свежие данные, set() принимает
+    версию ключа, полученную через version() до чтения: если ключ за это время
+    инвалидировали или обновили, запись пропускается.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+        # Метрики
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                value, expires_at = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self._hits += 1
+                    return value
+                del self._data[key]
+            self._misses += 1
+            return default
+
+    def version(self, key) -> int:
+        with self._lock:
+            return self._versions.get(key, 0)
+
+    def set(self, key, value, version: int = None) -> bool:
+        with self._lock:
+            if version is not None and self._versions.get(key, 0) != version:
+                return False
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                old_key, _ = self._data.popitem(last=False)
+                self._versions.pop(old_key, None)
+                self._evictions += 1
+            return True
+
+    def update(self, key, func) -> bool:
+        """Атомарно изменяет закэшированное значение: value = func(value). Нет записи - ничего не делает."""
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING or item[1] <= time.monotonic():
+                return False
+            self._data[key] = (func(item[0]), item[1])
+            self._versions[key] = self._versions.get(key, 0) + 1
+            return True
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._invalidations += 1
+            if len(self._versions) > 4 * self.max_size:
+                # Не даём словарю версий расти бесконечно
+                self._versions = {k: v for k, v in self._versions.items() if k in self._data or k == key}
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._versions.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / total, 4) if total else 0.0,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations,
+            }
@@ -10,40 +10,49 @@ import json
 from datetime import datetime
 from collections import defaultdict, Counter
 
+from events_maintenance import report_today, refresh_rollups_for_day, rollup_unique_users
+
 DATABASE = 'users.db'
 
 def get_analytics():
-    """Получает аналитику из базы данных"""
+    """Получает аналитику из дневных агрегатов событий"""
     conn = sqlite3.connect(DATABASE)
     conn.row_factory = sqlite3.Row
     
-    # Получаем все события
-    events = conn.execute('''
+    # Агрегаты за сегодня обновляются раз в час - досчитываем текущий день
+    refresh_rollups_for_day(conn.cursor(), 'sqlite', report_today())
+    conn.commit()
+    
+    # Уникальные пользователи
+    unique_users = rollup_unique_users(conn.cursor(), 'sqlite')
+    
+    # События по типам и по дням
+    rows = conn.execute('''
+        SELECT day, event_type, events_count
+        FROM event_daily_rollups
+    ''').fetchall()
+    event_counts = Counter()
+    daily_events = defaultdict(lambda: defaultdict(int))
+    for row in rows:
+        event_counts[row['event_type']] += row['events_count']
+        daily_events[row['day']][row['event_type']] += row['events_count']
+    
+    # Последние 50 событий - по индексу timestamp, без чтения всей таблицы
+    recent_events = conn.execute('''
         SELECT user_id, event_type, event_data, timestamp
         FROM events
         ORDER BY timestamp DESC
+        LIMIT 50
     ''').fetchall()
     
-    # Получаем уникальных пользователей
-    unique_users = conn.execute('SELECT COUNT(DISTINCT user_id) as count FROM events').fetchone()['count']
-    
-    # Подсчитываем события по типам
-    event_counts = Counter(e['event_type'] for e in events)
-    
-    # Подсчитываем по дням
-    daily_events = defaultdict(lambda: defaultdict(int))
-    for event in events:
-        date = event['timestamp'][:10]  # Берем только дату
-        daily_events[date][event['event_type']] += 1
-    
     conn.close()
     
     return {
         'unique_users': unique_users,
-        'total_events': len(events),
+        'total_events': sum(event_counts.values()),
         'event_counts': dict(event_counts),
         'daily_events': dict(daily_events),
-        'recent_events': [dict(e) for e in events[:50]]  # Последние 50 событий
+        'recent_events': [dict(e) for e in recent_events]  # Последние 50 событий
     }
 
 def print_analytics():
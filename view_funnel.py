@@ -11,7 +11,8 @@ import psycopg2
 import sqlite3
 from dotenv import load_dotenv
 from datetime import datetime
-import pytz
+
+from events_maintenance import report_today, refresh_rollups_for_day, rollup_unique_users, rollup_event_totals
 
 load_dotenv()
 
@@ -39,187 +40,50 @@ def get_db_connection():
         return sqlite3.connect(DATABASE), 'sqlite'
 
 def get_funnel_stats(db_type, cursor, date_filter=None, date_filter_end=None):
-    """Получает статистику воронки
+    """Получает статистику воронки из дневных агрегатов событий (event_daily_rollups / event_daily_users)
     
     Args:
         db_type: Тип БД ('postgresql' или 'sqlite')
         cursor: Курсор БД
         date_filter: Начало периода в формате 'YYYY-MM-DD' (опционально)
         date_filter_end: Конец периода 'YYYY-MM-DD' (опционально). Если не задан при заданном date_filter — один день.
-                        Фильтрация по московскому времени (UTC+3).
+                        Дни считаются по московскому времени (UTC+3).
     """
     stats = {}
-    date_from = date_filter
-    date_to = date_filter_end if date_filter_end else date_filter
-
-    # Формируем условие фильтрации по дате (по московскому времени)
-    if date_from:
-        if db_type == 'postgresql':
-            # PostgreSQL: конвертируем timestamp в московское время (считаем что в БД без TZ = UTC)
-            if date_to and date_to != date_from:
-                date_condition = """AND (
-                    (timestamp::timestamp AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Moscow')::date >= %s::date
-                    AND (timestamp::timestamp AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Moscow')::date <= %s::date
-                )"""
-                date_params = (date_from, date_to)
-            else:
-                date_condition = """AND (
-                    (timestamp::timestamp AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Moscow')::date = %s::date
-                )"""
-                date_params = (date_from,)
-        else:
-            # SQLite: диапазон по UTC
-            moscow_tz = pytz.timezone('Europe/Moscow')
-            date_start_msk = moscow_tz.localize(datetime.strptime(f"{date_from} 00:00:00", "%Y-%m-%d %H:%M:%S"))
-            date_end_msk = moscow_tz.localize(datetime.strptime(f"{date_to or date_from} 23:59:59.999", "%Y-%m-%d %H:%M:%S.%f"))
-            date_start_utc = date_start_msk.astimezone(pytz.UTC).isoformat()
-            date_end_utc = date_end_msk.astimezone(pytz.UTC).isoformat()
-            date_condition = "AND timestamp >= ? AND timestamp <= ?"
-            date_params = (date_start_utc, date_end_utc)
-    else:
-        date_condition = ""
-        date_params = ()
+    day_from = datetime.strptime(date_filter, '%Y-%m-%d').date() if date_filter else None
+    day_to = datetime.strptime(date_filter_end, '%Y-%m-%d').date() if date_filter_end else day_from
+    
+    # Агрегаты за сегодня обновляются раз в час - досчитываем текущий день, если он входит в период
+    today = report_today()
+    if not day_from or day_from <= today <= day_to:
+        refresh_rollups_for_day(cursor, db_type, today)
+        cursor.connection.commit()
     
     # Уникальные пользователи на каждом этапе
-    if db_type == 'postgresql':
-        # Старт
-        cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE event_type = %s {date_condition}', 
-                      ('start',) + date_params if date_filter else ('start',))
-        stats['start'] = cursor.fetchone()[0]
-        
-        # Заполнение профиля
-        cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE event_type = %s {date_condition}', 
-                      ('profile_complete',) + date_params if date_filter else ('profile_complete',))
-        stats['profile_complete'] = cursor.fetchone()[0]
-        
-        # Начало оплаты
-        cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE event_type = %s {date_condition}', 
-                      ('payment_start',) + date_params if date_filter else ('payment_start',))
-        stats['payment_start'] = cursor.fetchone()[0]
-        
-        # Успешная оплата
-        cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE event_type = %s {date_condition}', 
-                      ('payment_success',) + date_params if date_filter else ('payment_success',))
-        stats['payment_success'] = cursor.fetchone()[0]
-        
-        # Начало генерации
-        cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE event_type = %s {date_condition}', 
-                      ('natal_chart_generation_start',) + date_params if date_filter else ('natal_chart_generation_start',))
-        stats['natal_chart_generation_start'] = cursor.fetchone()[0]
-        
-        # Успешная генерация
-        cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE event_type = %s {date_condition}', 
-                      ('natal_chart_success',) + date_params if date_filter else ('natal_chart_success',))
-        stats['natal_chart_success'] = cursor.fetchone()[0]
-        
-        # Ошибки генерации
-        cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE event_type = %s {date_condition}', 
-                      ('natal_chart_error',) + date_params if date_filter else ('natal_chart_error',))
-        stats['natal_chart_error'] = cursor.fetchone()[0]
-        
-        # Просмотр "Положение планет"
-        cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE event_type = %s {date_condition}', 
-                      ('planets_info_viewed',) + date_params if date_filter else ('planets_info_viewed',))
-        stats['planets_info_viewed'] = cursor.fetchone()[0]
-        
-        # Запрос данных о планетах
-        cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE event_type = %s {date_condition}', 
-                      ('planets_data_requested',) + date_params if date_filter else ('planets_data_requested',))
-        stats['planets_data_requested'] = cursor.fetchone()[0]
-        
-        # Обращения в поддержку
-        cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE event_type = %s {date_condition}', 
-                      ('support_contacted',) + date_params if date_filter else ('support_contacted',))
-        stats['support_contacted'] = cursor.fetchone()[0]
-        
-        # Всего уникальных пользователей
-        if date_filter:
-            cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE 1=1 {date_condition}', date_params)
-        else:
-            cursor.execute('SELECT COUNT(DISTINCT user_id) FROM events')
-        stats['total_users'] = cursor.fetchone()[0]
-        
-        # Всего уникальных пользователей с профилем (без фильтра по дате, т.к. это состояние, а не событие)
-        cursor.execute('SELECT COUNT(DISTINCT user_id) FROM users WHERE birth_date IS NOT NULL')
-        stats['users_with_profile'] = cursor.fetchone()[0]
-        
-        # Всего платежей (количество)
-        cursor.execute(f'SELECT COUNT(*) FROM events WHERE event_type = %s {date_condition}', 
-                      ('payment_success',) + date_params if date_filter else ('payment_success',))
-        stats['total_payments'] = cursor.fetchone()[0]
-        
-        # Сумма всех платежей
-        if date_filter:
-            cursor.execute(f'''
-                SELECT SUM((event_data::json->>'total_amount')::int) 
-                FROM events 
-                WHERE event_type = %s AND event_data IS NOT NULL {date_condition}
-            ''', ('payment_success',) + date_params)
-        else:
-            cursor.execute('''
-                SELECT SUM((event_data::json->>'total_amount')::int) 
-                FROM events 
-                WHERE event_type = %s AND event_data IS NOT NULL
-            ''', ('payment_success',))
-        result = cursor.fetchone()[0]
-        stats['total_revenue'] = (result or 0) / 100  # Конвертируем из копеек в рубли
-        
-    else:
-        # SQLite версия
-        cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE event_type = ? {date_condition}', 
-                      ('start',) + date_params if date_filter else ('start',))
-        stats['start'] = cursor.fetchone()[0]
-        
-        cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE event_type = ? {date_condition}', 
-                      ('profile_complete',) + date_params if date_filter else ('profile_complete',))
-        stats['profile_complete'] = cursor.fetchone()[0]
-        
-        cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE event_type = ? {date_condition}', 
-                      ('payment_start',) + date_params if date_filter else ('payment_start',))
-        stats['payment_start'] = cursor.fetchone()[0]
-        
-        cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE event_type = ? {date_condition}', 
-                      ('payment_success',) + date_params if date_filter else ('payment_success',))
-        stats['payment_success'] = cursor.fetchone()[0]
-        
-        cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE event_type = ? {date_condition}', 
-                      ('natal_chart_generation_start',) + date_params if date_filter else ('natal_chart_generation_start',))
-        stats['natal_chart_generation_start'] = cursor.fetchone()[0]
-        
-        cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE event_type = ? {date_condition}', 
-                      ('natal_chart_success',) + date_params if date_filter else ('natal_chart_success',))
-        stats['natal_chart_success'] = cursor.fetchone()[0]
-        
-        cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE event_type = ? {date_condition}', 
-                      ('natal_chart_error',) + date_params if date_filter else ('natal_chart_error',))
-        stats['natal_chart_error'] = cursor.fetchone()[0]
-        
-        cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE event_type = ? {date_condition}', 
-                      ('planets_info_viewed',) + date_params if date_filter else ('planets_info_viewed',))
-        stats['planets_info_viewed'] = cursor.fetchone()[0]
-        
-        cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE event_type = ? {date_condition}', 
-                      ('planets_data_requested',) + date_params if date_filter else ('planets_data_requested',))
-        stats['planets_data_requested'] = cursor.fetchone()[0]
-        
-        cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE event_type = ? {date_condition}', 
-                      ('support_contacted',) + date_params if date_filter else ('support_contacted',))
-        stats['support_contacted'] = cursor.fetchone()[0]
-        
-        if date_filter:
-            cursor.execute(f'SELECT COUNT(DISTINCT user_id) FROM events WHERE 1=1 {date_condition}', date_params)
-        else:
-            cursor.execute('SELECT COUNT(DISTINCT user_id) FROM events')
-        stats['total_users'] = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT COUNT(DISTINCT user_id) FROM users WHERE birth_date IS NOT NULL')
-        stats['users_with_profile'] = cursor.fetchone()[0]
-        
-        cursor.execute(f'SELECT COUNT(*) FROM events WHERE event_type = ? {date_condition}', 
-                      ('payment_success',) + date_params if date_filter else ('payment_success',))
-        stats['total_payments'] = cursor.fetchone()[0]
-        
-        stats['total_revenue'] = 0  # SQLite сложнее парсить JSON
+    for event_type in [
+        'start',                         # Старт
+        'profile_complete',              # Заполнение профиля
+        'payment_start',                 # Начало оплаты
+        'payment_success',               # Успешная оплата
+        'natal_chart_generation_start',  # Начало генерации
+        'natal_chart_success',           # Успешная генерация
+        'natal_chart_error',             # Ошибки генерации
+        'planets_info_viewed',           # Просмотр "Положение планет"
+        'planets_data_requested',        # Запрос данных о планетах
+        'support_contacted',             # Обращения в поддержку
+    ]:
+        stats[event_type] = rollup_unique_users(cursor, db_type, event_type, day_from, day_to)
+    
+    # Всего уникальных пользователей
+    stats['total_users'] = rollup_unique_users(cursor, db_type, None, day_from, day_to)
+    
+    cursor.execute('SELECT COUNT(DISTINCT user_id) FROM users WHERE birth_date IS NOT NULL')
+    stats['users_with_profile'] = cursor.fetchone()[0]
+    
+    # Всего платежей (количество) и сумма (total_amount в копейках)
+    total_payments, total_amount = rollup_event_totals(cursor, db_type, 'payment_success', day_from, day_to)
+    stats['total_payments'] = total_payments
+    stats['total_revenue'] = total_amount / 100  # Конвертируем из копеек в рубли
     
     return stats
 
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Отчёт по таймингам стадий генерации натальной карты (таблица generation_spans):
+p50/p95/p99 длительности каждой стадии и отдельно - каждого раздела отчёта
+(ожидание в очереди шлюза OpenAI, первый токен, токены).
+
+Дни считаются по московскому времени, как в отчётах воронки.
+
+Запуск:
+    python view_generation_timings.py                          # за всё время
+    python view_generation_timings.py 2026-10-01               # один день
+    python view_generation_timings.py 2026-10-01 2026-10-18    # период
+"""
+
+import sys
+from datetime import datetime
+
+from db_pool import db_connection
+from events_maintenance import day_bounds
+from generation_spans import STAGES, load_spans
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def _seconds(value: float) -> str:
+    return f"{value:8.2f}"
+
+
+def print_stages(spans: list):
+    """Длительность стадий: число, ошибки, p50/p95/p99, максимум"""
+    print(f"\n{'Стадия':14} │ {'Кол-во':>7} │ {'Ошибок':>6} │ {'p50, с':>8} │ {'p95, с':>8} │ {'p99, с':>8} │ {'max, с':>8}")
+    print("─" * 80)
+    known = [stage for stage in STAGES if any(span['stage'] == stage for span in spans)]
+    other = sorted({span['stage'] for span in spans} - set(STAGES))
+    for stage in known + other:
+        durations = [span['duration_seconds'] for span in spans if span['stage'] == stage]
+        errors = sum(1 for span in spans if span['stage'] == stage and not span['ok'])
+        print(f"{stage:14} │ {len(durations):7d} │ {errors:6d} │ {_seconds(percentile(durations, 0.5))} │ "
+              f"{_seconds(percentile(durations, 0.95))} │ {_seconds(percentile(durations, 0.99))} │ {_seconds(max(durations))}")
+
+
+def print_sections(spans: list):
+    """Разделы отчёта: длительность, очередь шлюза, первый токен и токены"""
+    sections = [span for span in spans if span['stage'] == 'llm_section' and span['ok']]
+    if not sections:
+        return
+    print("\n🤖 Разделы отчёта (успешные запросы к OpenAI)")
+    print(f"{'Раздел':6} │ {'Кол-во':>6} │ {'p50, с':>8} │ {'p95, с':>8} │ {'p99, с':>8} │ {'очередь p95':>11} │ "
+          f"{'1-й токен p50':>13} │ {'1-й токен p95':>13} │ {'промпт':>7} │ {'кэш':>4} │ {'ответ':>6}")
+    print("─" * 120)
+    for number in sorted({span['section'] for span in sections if span['section'] is not None}):
+        rows = [span for span in sections if span['section'] == number]
+        durations = [span['duration_seconds'] for span in rows]
+        queue = [span['queue_seconds'] or 0.0 for span in rows]
+        first_token = [span['first_token_seconds'] or 0.0 for span in rows]
+        prompt = sum(span['prompt_tokens'] or 0 for span in rows)
+        cached = sum(span['cached_tokens'] or 0 for span in rows)
+        completion = sum(span['completion_tokens'] or 0 for span in rows)
+        print(f"{number:6d} │ {len(rows):6d} │ {_seconds(percentile(durations, 0.5))} │ "
+              f"{_seconds(percentile(durations, 0.95))} │ {_seconds(percentile(durations, 0.99))} │ "
+              f"{percentile(queue, 0.95):11.2f} │ {percentile(first_token, 0.5):13.2f} │ {percentile(first_token, 0.95):13.2f} │ "
+              f"{prompt // len(rows):7d} │ {cached / prompt if prompt else 0:4.0%} │ {completion // len(rows):6d}")
+
+
+def main():
+    # Аргументы: одна дата (YYYY-MM-DD) или диапазон (YYYY-MM-DD YYYY-MM-DD)
+    try:
+        day_from = datetime.strptime(sys.argv[1], '%Y-%m-%d').date() if len(sys.argv) > 1 else None
+        day_to = datetime.strptime(sys.argv[2], '%Y-%m-%d').date() if len(sys.argv) > 2 else day_from
+    except ValueError as e:
+        print(f"❌ Неверный формат даты: {e}")
+        print("Используйте формат: YYYY-MM-DD или YYYY-MM-DD YYYY-MM-DD (например: 2026-10-01 2026-10-18)")
+        return 1
+
+    with db_connection() as (conn, db_type):
+        cursor = conn.cursor()
+        start = day_bounds(day_from, db_type)[0] if day_from else None
+        end = day_bounds(day_to, db_type)[1] if day_to else None
+        spans = load_spans(cursor, db_type, start, end)
+
+    print("=" * 80)
+    if day_from:
+        period = f"{day_from} — {day_to}" if day_to != day_from else f"{day_from}"
+        print(f"⏱️ Тайминги генерации натальной карты за {period} (МСК)")
+    else:
+        print("⏱️ Тайминги генерации натальной карты за всё время")
+    print("=" * 80)
+
+    if not spans:
+        print("\nНет данных за период")
+        return 0
+
+    jobs = sum(1 for span in spans if span['stage'] == 'total')
+    delivered = sum(1 for span in spans if span['stage'] == 'total' and span['ok'])
+    print(f"\nЗаданий: {jobs}, PDF доставлен: {delivered}")
+    print_stages(spans)
+    print_sections(spans)
+    print("\n" + "=" * 80)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())